@@ -7,6 +7,7 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 
 from django.contrib.auth.models import User
+from tastypie.admin import ApiKeyInline
 from models import UserProfile
 
 __author__ = "Eraldo Helal"
@@ -22,9 +23,9 @@ class ProfileInline(admin.StackedInline):
 class CustomUserAdmin(UserAdmin):
     """
     Meta information model to display Users
-    with associated inline profile.
+    with associated inline profile and api key.
     """
-    inlines = [ProfileInline,]
+    inlines = [ProfileInline, ApiKeyInline,]
 
 
 # refresh the admin user model settings
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+"""
+Contains the background fetching of the avatar images of social sign-ups.
+Avatars are downloaded by the background task pool (with a timeout and retries),
+so first logins never wait for facebook or google.
+Users keep the default avatar if the download fails.
+The downloading fetcher is configurable (AVATAR_FETCHER),
+e.g. to fetch through a proxy or from a local stand-in server.
+"""
+
+import logging
+import time
+import urllib2
+from cStringIO import StringIO
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.template.defaultfilters import slugify
+from django.utils.importlib import import_module
+from accounts.models import UserProfile
+from carrotwars.images import create_derivatives
+from carrotwars.tasks import run_in_background
+try:
+    from PIL import Image
+except ImportError:
+    import Image
+
+__author__ = "Eraldo Helal"
+
+#: seconds a single download may take
+AVATAR_FETCH_TIMEOUT = getattr(settings, 'AVATAR_FETCH_TIMEOUT', 5)
+#: downloads tried before the default avatar is kept
+AVATAR_FETCH_RETRIES = getattr(settings, 'AVATAR_FETCH_RETRIES', 3)
+#: seconds waited before the first retry (doubled for every further retry)
+AVATAR_FETCH_RETRY_DELAY = getattr(settings, 'AVATAR_FETCH_RETRY_DELAY', 2)
+#: maximum size of a downloaded avatar in bytes
+AVATAR_MAX_SIZE = 1024 * 1024
+#: file extensions of the accepted image formats
+AVATAR_EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'GIF': '.gif'}
+
+logger = logging.getLogger(__name__)
+
+
+class UrllibFetcher(object):
+    """
+    Downloads avatars with urllib2.
+    Fetchers provide a fetch method returning the content of an url
+    and raising an IOError if it cannot be downloaded.
+    """
+
+    def fetch(self, url, timeout):
+        """Returns the content of the url (at most AVATAR_MAX_SIZE + 1 bytes)."""
+        response = urllib2.urlopen(url, timeout=timeout)
+        try:
+            return response.read(AVATAR_MAX_SIZE + 1)
+        finally:
+            response.close()
+
+
+def get_fetcher():
+    """Returns a new fetcher of the class configured as AVATAR_FETCHER."""
+    module, attribute = getattr(settings, 'AVATAR_FETCHER', 'accounts.avatars.UrllibFetcher').rsplit('.', 1)
+    return getattr(import_module(module), attribute)()
+
+
+def get_avatar_extension(content):
+    """Returns the file extension of the avatar image content (or None if it is no accepted image)."""
+    if len(content) > AVATAR_MAX_SIZE:
+        return None
+    try:
+        return AVATAR_EXTENSIONS.get(Image.open(StringIO(content)).format)
+    except IOError:
+        return None
+
+
+def download_avatar(url, fetcher=None, retries=AVATAR_FETCH_RETRIES, delay=AVATAR_FETCH_RETRY_DELAY):
+    """
+    Returns the content and file extension of the avatar image at the url
+    (or None if it could not be downloaded within the retries or is no accepted image).
+    """
+    fetcher = fetcher or get_fetcher()
+    for attempt in range(retries):
+        if attempt:
+            time.sleep(delay * 2 ** (attempt - 1))
+        try:
+            content = fetcher.fetch(url, AVATAR_FETCH_TIMEOUT)
+        except IOError as error:
+            logger.warning("Fetching avatar %s failed (attempt %s): %s", url, attempt + 1, error)
+            continue
+        extension = get_avatar_extension(content)
+        if extension is None:
+            logger.warning("Avatar %s is no accepted image.", url)
+            return None
+        return content, extension
+    return None
+
+
+def fetch_avatar(user_id, url, fetcher=None, retries=AVATAR_FETCH_RETRIES, delay=AVATAR_FETCH_RETRY_DELAY):
+    """
+    Downloads the avatar at the url and sets it as avatar of the user.
+    The derivatives are created right away (this runs in the background already).
+    Returns True if the avatar was set, False if the user keeps the default avatar.
+    """
+    avatar = download_avatar(url, fetcher, retries, delay)
+    if avatar is None:
+        return False
+    content, extension = avatar
+    profile = UserProfile.objects.select_related('user').get(user=user_id)
+    name = default_storage.save(profile.avatar.field.generate_filename(
+        profile, slugify(profile.user.username + " social") + extension), ContentFile(content))
+    create_derivatives(name)
+    profile.avatar = name
+    profile.save()
+    return True
+
+
+def schedule_avatar_fetch(user, url):
+    """
+    Fetches the avatar at the url for the user in the background.
+    Returns the AsyncResult of the task.
+    """
+    return run_in_background(fetch_avatar, user.pk, url)
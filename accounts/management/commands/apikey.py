@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+"""
+Contains the management command issuing and revoking api keys.
+"""
+
+from optparse import make_option
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from tastypie.models import ApiKey
+
+__author__ = "Eraldo Helal"
+
+
+class Command(BaseCommand):
+    """
+    Prints the api key of a user (creating it if needed),
+    replaces it with a new one or revokes it.
+    """
+    args = "<username>"
+    help = "Prints, regenerates or revokes the api key of a user."
+    option_list = BaseCommand.option_list + (
+        make_option('--regenerate', action='store_true', default=False,
+            help="Replace the api key of the user with a new one."),
+        make_option('--revoke', action='store_true', default=False,
+            help="Delete the api key of the user."),
+    )
+
+    def handle(self, *args, **options):
+        """Prints, regenerates or revokes the api key of the provided user."""
+        if len(args) != 1:
+            raise CommandError("Please provide exactly one username.")
+        try:
+            user = User.objects.get(username=args[0])
+        except User.DoesNotExist:
+            raise CommandError("User '%s' does not exist." % args[0])
+        if options['revoke']:
+            ApiKey.objects.filter(user=user).delete()
+            self.stdout.write("Revoked the api key of %s.\n" % user)
+            return
+        api_key, created = ApiKey.objects.get_or_create(user=user)
+        if options['regenerate'] and not created:
+            api_key.key = api_key.generate_key()
+            api_key.save()
+        self.stdout.write("%s\n" % api_key.key)
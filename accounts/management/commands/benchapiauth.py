@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+"""
+Contains the management command benchmarking the api authentication backends.
+"""
+
+import base64
+import time
+from optparse import make_option
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.client import RequestFactory
+from tastypie.authentication import BasicAuthentication
+from tastypie.models import ApiKey
+from carrotwars.authentication import CachedApiKeyAuthentication, api_key_cache
+
+__author__ = "Eraldo Helal"
+
+
+class Command(BaseCommand):
+    """
+    Authenticates the same api request of a temporary user
+    with basic authentication and with the cached api key
+    and prints the average time per request of both.
+    The temporary user is rolled back afterwards.
+    """
+    help = "Compares the per-request cost of basic and api key authentication."
+    option_list = BaseCommand.option_list + (
+        make_option('--requests', type='int', default=100,
+            help="Number of authenticated requests. (default: 100)"),
+    )
+
+    @transaction.commit_manually
+    def handle(self, *args, **options):
+        """Times both authentication backends over the same number of requests."""
+        try:
+            user = User.objects.create_user('benchapiauth', 'benchapiauth@example.com', 'secret')
+            key = ApiKey.objects.create(user=user).key
+            factory = RequestFactory()
+            basic = factory.get('/api/v1/quest/', HTTP_AUTHORIZATION='Basic %s' % base64.b64encode('benchapiauth:secret'))
+            api_key = factory.get('/api/v1/quest/', HTTP_AUTHORIZATION='ApiKey benchapiauth:%s' % key)
+            for name, backend, request in (("basic", BasicAuthentication(), basic),
+                                           ("api key", CachedApiKeyAuthentication(), api_key)):
+                start = time.time()
+                for i in range(options['requests']):
+                    assert backend.is_authenticated(request) is True
+                elapsed = time.time() - start
+                self.stdout.write("%s: %.1f ms total, %.3f ms per request\n" % (
+                    name, elapsed * 1000, elapsed * 1000 / options['requests']))
+        finally:
+            transaction.rollback()
+            api_key_cache.delete('benchapiauth')
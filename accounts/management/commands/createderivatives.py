@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+"""
+Contains the management command creating the image derivatives of all avatars and reward images.
+"""
+
+from optparse import make_option
+from django.core.management.base import BaseCommand
+from accounts.models import UserProfile
+from rewards.models import Reward
+from carrotwars.images import create_derivatives, has_derivatives
+
+__author__ = "Eraldo Helal"
+
+
+class Command(BaseCommand):
+    """
+    Creates the missing icon and display derivatives of all avatars and reward images
+    (e.g. for images uploaded before derivatives existed or while the process restarted).
+    """
+    help = "Creates the missing derivatives of all avatars and reward images."
+    option_list = BaseCommand.option_list + (
+        make_option('--all', action='store_true', default=False,
+            help="Recreate existing derivatives as well (e.g. after changing IMAGE_DERIVATIVES). "
+                 "Running web processes show their new urls once their media hashes expire."),
+    )
+
+    def handle(self, *args, **options):
+        """Creates the derivatives of every distinct image."""
+        names = set(UserProfile.objects.values_list('avatar', flat=True))
+        names |= set(Reward.objects.values_list('image', flat=True))
+        names |= set([UserProfile._meta.get_field('avatar').default, Reward._meta.get_field('image').default])
+        created = 0
+        for name in sorted(name for name in names if name):
+            if options['all'] or not has_derivatives(name):
+                try:
+                    create_derivatives(name, replace=options['all'])
+                    created += 1
+                except IOError as error:
+                    self.stderr.write("Skipped %s: %s\n" % (name, error))
+        self.stdout.write("Created the derivatives of %s images.\n" % created)
@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+"""
+Contains the management command exporting the history of a user.
+"""
+
+from optparse import make_option
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from carrotwars.export import export_lines, EXPORT_CHUNK_SIZE
+
+__author__ = "Eraldo Helal"
+
+
+class Command(BaseCommand):
+    """
+    Writes the relations, quests and rewards of a user as newline delimited json
+    (the same lines the export view streams) to standard output or a file.
+    """
+    args = "<username>"
+    help = "Exports the relations, quests and rewards of a user as newline delimited json."
+    option_list = BaseCommand.option_list + (
+        make_option('--output', default=None,
+            help="File to write the export to. (default: standard output)"),
+        make_option('--chunk-size', type='int', default=EXPORT_CHUNK_SIZE,
+            help="Rows read per query. (default: %s)" % EXPORT_CHUNK_SIZE),
+    )
+
+    def handle(self, *args, **options):
+        """Writes the export of the provided user."""
+        if len(args) != 1:
+            raise CommandError("Please provide exactly one username.")
+        try:
+            user = User.objects.get(username=args[0])
+        except User.DoesNotExist:
+            raise CommandError("User '%s' does not exist." % args[0])
+        output = open(options['output'], 'w') if options['output'] else self.stdout
+        try:
+            for line in export_lines(user, options['chunk_size']):
+                output.write(line)
+        finally:
+            if options['output']:
+                output.close()
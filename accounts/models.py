@@ -1,11 +1,17 @@
 #!/usr/bin/env python
 """
 Contains the UserProfile model and initial generation functionality.
+Profiles are created together with their users
+and read through a cached User.profile accessor.
 """
 
 from django.db import models
 from django.contrib.auth.models import User
-# from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
+from django.conf import settings
+from carrotwars.cache import LRUCache
+from carrotwars.images import get_derivative
+from carrotwars.media import get_media_url
 
 __author__ = "Eraldo Helal"
 
@@ -24,46 +30,103 @@ class UserProfile(models.Model):
     def __unicode__(self):
         return "%s's profile" % self.user
 
-# post_save.connect(create_user_profile, sender=User)
+    @property
+    def avatar_icon_url(self):
+        """Returns the url of the avatar icon (or of the avatar until the icon exists)."""
+        return get_media_url(get_derivative(self.avatar.name, 'icon'))
+
+
+def create_user_profile(sender, instance, created, raw=False, **kwargs):
+    """Creates the profile of a newly created user."""
+    if created and not raw:
+        UserProfile.objects.get_or_create(user=instance)
+
+post_save.connect(create_user_profile, sender=User)
+
+
+#: profiles shared by all requests of this process (keyed by user id)
+profile_cache = LRUCache(max_size=getattr(settings, 'PROFILE_CACHE_SIZE', 1000),
+                         timeout=getattr(settings, 'PROFILE_CACHE_TIMEOUT', 300))
+
+def invalidate_user_profile(sender, instance, **kwargs):
+    """Removes a saved or deleted profile from the profile cache."""
+    profile_cache.delete(instance.user_id)
+
+post_save.connect(invalidate_user_profile, sender=UserProfile)
+post_delete.connect(invalidate_user_profile, sender=UserProfile)
+
+
+def get_user_profile(user):
+    """
+    Returns the profile of the user for reading.
+    The profile is cached on the user object (which lives as long as the request)
+    and in the process wide profile cache, so warm reads cost no query.
+    Users without a stored profile get an unsaved default profile
+    (reading never inserts).
+    Cached profiles are shared and must not be modified,
+    fetch them with UserProfile.objects to make changes.
+    """
+    profile = getattr(user, '_cached_profile', None)
+    if profile is None:
+        profile = profile_cache.get(user.pk)
+        if profile is None:
+            try:
+                profile = UserProfile.objects.get(user=user.pk)
+            except UserProfile.DoesNotExist:
+                profile = UserProfile(user_id=user.pk)
+            profile_cache.set(user.pk, profile)
+        user._cached_profile = profile
+    return profile
+
+
+def prime_profiles(users):
+    """
+    Caches the profiles of all provided users on the user objects
+    loading the profiles missing in the profile cache with a single query.
+    """
+    missing = {}
+    for user in users:
+        if getattr(user, '_cached_profile', None) is None:
+            profile = profile_cache.get(user.pk)
+            if profile is None:
+                missing.setdefault(user.pk, []).append(user)
+            else:
+                user._cached_profile = profile
+    if not missing:
+        return
+    profiles = dict((profile.user_id, profile) for profile in UserProfile.objects.filter(user__in=missing.keys()))
+    for user_id, user_set in missing.items():
+        profile = profiles.get(user_id) or UserProfile(user_id=user_id)
+        profile_cache.set(user_id, profile)
+        for user in user_set:
+            user._cached_profile = profile
 
 # easy access to user profile: user.profile.field_name
-User.profile = property(lambda u: UserProfile.objects.get_or_create(user=u)[0])
+User.profile = property(get_user_profile)
 
 from social_auth.backends.facebook import FacebookBackend
 from social_auth.backends.google import GoogleOAuth2Backend
 from social_auth.signals import socialauth_registered
 def new_users_handler(sender, user, response, details, **kwargs):
     """
-    Tries to get avatar images from social user login information on new user creation
-    and generates profiles based on that information assoziated to that user.
+    Fetches the avatar image from social user login information on new user creation
+    in the background (the profile itself is created with the user).
     """
     user.is_new = True
     if user.is_new:
         if "id" in response:
             
-            from urllib2 import urlopen, HTTPError
-            from django.template.defaultfilters import slugify
-            from django.core.files.base import ContentFile
+            from accounts.avatars import schedule_avatar_fetch
             
-            try:
-                url = None
-                if sender == FacebookBackend:
-                    url = "http://graph.facebook.com/%s/picture?type=large" \
-                        % response["id"]
-                elif sender == GoogleOAuth2Backend and "picture" in response:
-                    url = response["picture"]
-                    
-                if url:
-                    avatar = urlopen(url)
-                    profile = UserProfile(user=user)
-                    
-                    profile.avatar.save(slugify(user.username + " social") + '.jpg',
-                                               ContentFile(avatar.read()))              
-                    
-                    profile.save()
-                    
-            except HTTPError:
-                pass
+            url = None
+            if sender == FacebookBackend:
+                url = "http://graph.facebook.com/%s/picture?type=large" \
+                    % response["id"]
+            elif sender == GoogleOAuth2Backend and "picture" in response:
+                url = response["picture"]
+                
+            if url:
+                schedule_avatar_fetch(user, url)
                 
     return False
 
@@ -5,7 +5,36 @@ when you run "manage.py test".
 Replace this with more appropriate tests for your application.
 """
 
+import json
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from cStringIO import StringIO
+from threading import Thread
 from django.test import TestCase
+from django.test.utils import override_settings
+from django.contrib.auth.models import User
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage, FileSystemStorage
+from django.core.management import get_commands
+from django.template import Context, Template
+from tastypie.models import ApiKey
+from accounts.models import UserProfile, profile_cache
+from accounts.avatars import fetch_avatar
+from carrotwars.authentication import api_key_cache, get_api_key
+from carrotwars.badges import avatar_html
+from carrotwars.export import export_lines
+from carrotwars.events import event_bus, event_stream, flush_events, format_event
+from carrotwars.images import IMAGE_DERIVATIVES, get_derivative_name
+from carrotwars.media import get_media_hash, get_media_url, media_hash_cache
+from carrotwars.staticbundles import bundle_css
+from changes.models import Change
+from relations.models import Relation
+from quests.models import Quest
+from rewards.models import Reward
+try:
+    from PIL import Image
+except ImportError:
+    import Image
 
 
 class SimpleTest(TestCase):
@@ -14,3 +43,307 @@ class SimpleTest(TestCase):
         Tests that 1 + 1 always equals 2.
         """
         self.assertEqual(1 + 1, 2)
+
+
+class ProfileTest(TestCase):
+    """
+    Tests the profile creation and the cached profile accessor.
+    """
+
+    def setUp(self):
+        """Creates a user and clears the profile cache."""
+        profile_cache.clear()
+        self.user = User.objects.create_user('quester', 'quester@example.com', 'secret')
+
+    def test_created_with_user(self):
+        """Tests that a profile is created together with its user."""
+        self.assertEqual(UserProfile.objects.filter(user=self.user).count(), 1)
+
+    def test_cached(self):
+        """Tests that reading a warm profile costs no query, not even for a new request."""
+        self.assertEqual(self.user.profile.avatar, 'profiles/avatars/default.jpg')
+        user = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(user.profile.avatar, 'profiles/avatars/default.jpg')
+            user.profile
+
+    def test_invalidation(self):
+        """Tests that saving a profile invalidates the cached profile."""
+        self.user.profile
+        profile = UserProfile.objects.get(user=self.user)
+        profile.avatar = 'profiles/avatars/quester.jpg'
+        profile.save()
+        self.assertEqual(User.objects.get(pk=self.user.pk).profile.avatar, 'profiles/avatars/quester.jpg')
+
+    def test_missing(self):
+        """Tests that reading a missing profile returns a default without creating it."""
+        UserProfile.objects.filter(user=self.user).delete()
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual(user.profile.avatar, 'profiles/avatars/default.jpg')
+        self.assertFalse(UserProfile.objects.filter(user=self.user).exists())
+
+
+class ApiKeyTest(TestCase):
+    """
+    Tests the cached api key authentication.
+    """
+
+    def setUp(self):
+        """Creates a user with an api key."""
+        api_key_cache.clear()
+        self.user = User.objects.create_user('user', 'user@example.com', 'secret')
+        self.api_key = ApiKey.objects.create(user=self.user)
+
+    def get(self, key):
+        """Returns the response to a relation api request authenticated by the provided key."""
+        return self.client.get('/api/v1/relation/', {'format': 'json'}, HTTP_AUTHORIZATION='ApiKey user:%s' % key)
+
+    def test_authentication(self):
+        """Tests that valid keys are accepted from the cache and wrong keys rejected."""
+        self.assertEqual(self.get(self.api_key.key).status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_api_key('user'), (self.user, self.api_key.key))
+        self.assertEqual(self.get('wrong').status_code, 401)
+
+    def test_revocation(self):
+        """Tests that revoked keys are rejected at once."""
+        self.assertEqual(self.get(self.api_key.key).status_code, 200)
+        self.api_key.delete()
+        self.assertEqual(self.get(self.api_key.key).status_code, 401)
+
+
+class ExportTest(TestCase):
+    """
+    Tests the newline delimited json export.
+    """
+
+    def setUp(self):
+        """Creates a relation with three quests and a reward."""
+        self.user = User.objects.create_user('user', 'user@example.com', 'secret')
+        other = User.objects.create_user('other', 'other@example.com', 'secret')
+        relation = Relation.objects.create(owner=self.user, quester=other, status='A')
+        for index in range(3):
+            Quest.objects.create(relation=relation, title="quest %s" % index)
+        Reward.objects.create(relation=relation, title="reward")
+
+    def test_chunks(self):
+        """Tests that chunked reading exports every row once."""
+        lines = [json.loads(line) for line in export_lines(self.user, chunk_size=2)]
+        self.assertEqual([line['type'] for line in lines], ['relation', 'quest', 'quest', 'quest', 'reward'])
+        self.assertEqual([line['title'] for line in lines[1:4]], ["quest 0", "quest 1", "quest 2"])
+
+    def test_view(self):
+        """Tests that the export view streams the export of the logged in user only."""
+        self.assertEqual(self.client.get('/accounts/export/').status_code, 302)
+        self.client.login(username='other', password='secret')
+        response = self.client.get('/accounts/export/')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        content = response.content # streamed content can only be read once
+        self.assertEqual(content, "".join(export_lines(User.objects.get(username='other'))))
+        self.assertEqual(len(content.splitlines()), 5)
+
+
+class EventTest(TestCase):
+    """
+    Tests the live events of a user.
+    """
+
+    def setUp(self):
+        """Creates a relation with a quest and logs in its quester."""
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'secret')
+        self.quester = User.objects.create_user('quester', 'quester@example.com', 'secret')
+        self.relation = Relation.objects.create(owner=self.owner, quester=self.quester, status='A')
+        self.seq = Change.objects.last_seq(self.quester)
+        self.quest = Quest.objects.create(relation=self.relation, title="quest")
+        self.client.login(username='quester', password='secret')
+
+    def test_publish(self):
+        """Tests that changes wake up the listeners of the participants once committed."""
+        listener = event_bus.listen(self.quester.pk)
+        try:
+            self.quest.save()
+            self.assertFalse(listener.wait(0)) # not yet committed
+            flush_events()
+            self.assertTrue(listener.wait(0))
+        finally:
+            listener.close()
+
+    def test_stream(self):
+        """Tests that the stream sends the changes after the provided sequence number and the unread count."""
+        self.assertEqual(list(event_stream(self.quester, self.seq, timeout=0)), [
+            "retry: 3000\n\n",
+            format_event('change', {'object_type': 'quest', 'object_id': self.quest.pk, 'operation': 'C'},
+                         Change.objects.last_seq(self.quester)),
+            format_event('unread', {'count': 0}),
+        ])
+
+    def test_opt_in(self):
+        """Tests that pages only open an event stream once its url is set."""
+        self.assertNotContains(self.client.get('/messages/inbox/'), 'EventSource(')
+        with self.settings(EVENT_STREAM_URL='/live/events/'):
+            self.assertContains(self.client.get('/messages/inbox/'), 'new EventSource("/live/events/")')
+
+    def test_poll(self):
+        """Tests that long-polling clients get the events they do not know yet."""
+        response = self.client.get('/accounts/events/', {'since': self.seq, 'unread': 0})
+        self.assertEqual(json.loads(response.content), [
+            {'event': 'change', 'id': Change.objects.last_seq(self.quester),
+             'object_type': 'quest', 'object_id': self.quest.pk, 'operation': 'C'}])
+
+
+class AvatarHandler(BaseHTTPRequestHandler):
+    """
+    A stand-in for the avatar servers of the social login providers.
+    Serves an avatar image, fails the first request of /flaky/ and knows no other paths.
+    """
+    requests = []
+
+    def do_GET(self):
+        """Answers a request for an avatar."""
+        self.requests.append(self.path)
+        if self.path == '/avatar/' or (self.path == '/flaky/' and self.requests.count('/flaky/') > 1):
+            content = StringIO()
+            Image.new('RGB', (200, 100)).save(content, 'PNG')
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/png')
+            self.end_headers()
+            self.wfile.write(content.getvalue())
+        else:
+            self.send_error(500 if self.path == '/flaky/' else 404)
+
+    def log_message(self, *args):
+        """Keeps the test output clean."""
+
+
+class AvatarTest(TestCase):
+    """
+    Tests fetching the avatars of social sign-ups.
+    """
+
+    def setUp(self):
+        """Creates a user and starts a local avatar server."""
+        self.user = User.objects.create_user('social', 'social@example.com', 'secret')
+        self.server = HTTPServer(('127.0.0.1', 0), AvatarHandler)
+        Thread(target=self.server.serve_forever).start()
+        self.url = 'http://127.0.0.1:%s' % self.server.server_port
+        AvatarHandler.requests = []
+
+    def tearDown(self):
+        """Stops the avatar server and removes fetched avatars."""
+        self.server.shutdown()
+        self.server.server_close()
+        name = UserProfile.objects.get(user=self.user).avatar.name
+        if name != UserProfile._meta.get_field('avatar').default:
+            for name in [name] + [get_derivative_name(name, derivative) for derivative in IMAGE_DERIVATIVES]:
+                default_storage.delete(name)
+
+    def test_fetch(self):
+        """Tests that a fetched avatar (retried after failures) is set with its derivatives."""
+        self.assertTrue(fetch_avatar(self.user.pk, self.url + '/flaky/', delay=0))
+        self.assertEqual(AvatarHandler.requests, ['/flaky/', '/flaky/'])
+        name = UserProfile.objects.get(user=self.user).avatar.name
+        self.assertEqual(name, 'profiles/avatars/social-social.png')
+        self.assertTrue(default_storage.exists(get_derivative_name(name, 'icon')))
+
+    def test_fallback(self):
+        """Tests that users keep the default avatar if it cannot be fetched."""
+        self.assertFalse(fetch_avatar(self.user.pk, self.url + '/missing/', retries=2, delay=0))
+        self.assertEqual(AvatarHandler.requests, ['/missing/', '/missing/'])
+        self.assertEqual(UserProfile.objects.get(user=self.user).avatar.name, 'profiles/avatars/default.jpg')
+
+
+@override_settings(MEDIA_SENDFILE='x-accel-redirect')
+class MediaTest(TestCase):
+    """
+    Tests serving the uploaded media.
+    """
+
+    def setUp(self):
+        """Creates a relation with a reward and logs in a user outside of it."""
+        owner = User.objects.create_user('owner', 'owner@example.com', 'secret')
+        quester = User.objects.create_user('quester', 'quester@example.com', 'secret')
+        User.objects.create_user('other', 'other@example.com', 'secret')
+        relation = Relation.objects.create(owner=owner, quester=quester, status='A')
+        self.name = default_storage.save('rewards/images/test-media.jpg',
+                                         default_storage.open('rewards/images/default.jpg'))
+        Reward.objects.create(relation=relation, title="reward", image=self.name)
+        self.client.login(username='other', password='secret')
+
+    def tearDown(self):
+        """Removes the uploaded reward image and its derivatives."""
+        for name in [self.name] + [get_derivative_name(self.name, derivative) for derivative in IMAGE_DERIVATIVES]:
+            default_storage.delete(name)
+        media_hash_cache.clear()
+
+    def test_hashed(self):
+        """Tests that hashed urls are handed to the web server and cached for good."""
+        url = get_media_url('profiles/avatars/default.icon.jpg')
+        response = self.client.get(url)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/profiles/avatars/default.icon.jpg')
+        self.assertEqual(response['Cache-Control'], 'private, max-age=31536000')
+        self.assertEqual(response.content, '')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertRedirects(self.client.get('/media/000000000000/profiles/avatars/default.icon.jpg'), url,
+                             target_status_code=200)
+
+    def test_hash(self):
+        """Tests that media hashes change with the file without the file being read."""
+        media_hash = get_media_hash(self.name)
+        def fail(*args, **kwargs):
+            raise AssertionError("media file read")
+        default_storage.open = fail
+        try:
+            media_hash_cache.clear()
+            self.assertEqual(get_media_hash(self.name), media_hash)
+        finally:
+            del default_storage.open
+        default_storage.delete(self.name)
+        default_storage.save(self.name, ContentFile("replaced"))
+        media_hash_cache.clear()
+        self.assertNotEqual(get_media_hash(self.name), media_hash)
+
+    def test_avatar(self):
+        """Tests that memoized avatar badges follow a replaced image."""
+        html = avatar_html('icon', self.name)
+        self.assertIn(get_media_url(self.name), html)
+        default_storage.delete(self.name)
+        default_storage.save(self.name, ContentFile("replaced"))
+        media_hash_cache.clear()
+        self.assertNotEqual(avatar_html('icon', self.name), html)
+        self.assertIn(get_media_url(self.name), avatar_html('icon', self.name))
+
+    def test_permissions(self):
+        """Tests that reward images are only served to the participants of their relation."""
+        url = '/media/%s' % self.name
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.login(username='quester', password='secret')
+        response = self.client.get(url)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/%s' % self.name)
+        self.assertEqual(response['Cache-Control'], 'private, max-age=0, must-revalidate')
+        self.client.logout()
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+
+class StaticBundleTest(TestCase):
+    """
+    Tests the bundled static assets.
+    """
+
+    def test_bundle_css(self):
+        """Tests that bundled stylesheets inline their imports and point to fingerprinted images."""
+        css = bundle_css(FileSystemStorage(location=settings.STATICFILES_DIRS[0]), ['css/common.css'])
+        self.assertFalse('@import' in css)
+        self.assertTrue(css.index('#pm_messages') < css.index('table.paleblue'))
+        self.assertRegexpMatches(css, r"url\('\.\./images/carrots-bg\.png\?v=[0-9a-f]{12}'\)")
+
+    @override_settings(STATIC_BUNDLED=False)
+    def test_unbundled(self):
+        """Tests that unbundled pages include the single files."""
+        self.assertEqual(Template('{% load bundles %}{% bundle "site.js" %}').render(Context()),
+                         '<script type="text/javascript" src="/static/dropdownmenu/dropdownmenu.js"></script>')
+        self.assertIn('/static/django_tables2/themes/paleblue/css/screen.css',
+                      Template('{% load bundles %}{% bundle "site.css" %}').render(Context()))
+
+    def test_command(self):
+        """Tests that the bundles are built by the shared carrotwars command."""
+        self.assertEqual(get_commands()['buildstatic'], 'carrotwars')
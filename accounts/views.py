@@ -3,9 +3,23 @@
 Contains the reward model and a reward manager.
 """
 
-from django.views.generic import RedirectView
+from django.views.generic import RedirectView, View
 from django.contrib import messages
+from django.contrib.auth.views import redirect_to_login
 from django.core.urlresolvers import reverse
+import json
+import posixpath
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, HttpResponseNotModified, Http404
+from django.shortcuts import redirect
+from django.db.models import Q
+from accounts.models import UserProfile
+from rewards.models import Reward
+from changes.models import Change
+from carrotwars.events import event_stream, poll_events
+from carrotwars.api import MetaMixin
+from carrotwars.export import export_lines
+from carrotwars.images import get_original_name
+from carrotwars.media import MEDIA_MAX_AGE, get_media_hash, get_media_url, serve_media
 
 __author__ = "Eraldo Helal"
 
@@ -17,3 +31,106 @@ class LoginErrorView(RedirectView):
     def get_redirect_url(self):        
         messages.add_message(self.request, messages.ERROR, 'Login failed.')
         return reverse('login')
+
+
+class ExportView(View):
+    """
+    A view streaming the relations, quests and rewards of the user
+    as newline delimited json (one object per line).
+    Besides logged in users, api clients authenticated by api key or password are served.
+    """
+
+    def get(self, request):
+        """Returns the streamed export or redirects to the login page."""
+        if not request.user.is_authenticated():
+            authenticated = MetaMixin.authentication.is_authenticated(request)
+            if authenticated is not True:
+                if 'HTTP_AUTHORIZATION' in request.META or 'api_key' in request.GET:
+                    return authenticated
+                return redirect_to_login(request.get_full_path())
+        response = HttpResponse(export_lines(request.user), content_type='application/x-ndjson')
+        response['Content-Disposition'] = 'attachment; filename=carrotwars-%s.ndjson' % request.user.username
+        return response
+
+
+class EventView(View):
+    """
+    A view pushing the changes of the relations, quests and rewards of the user
+    and the unread message count as server-sent events.
+    Clients without server-sent events long-poll the view with the last sequence number
+    and unread count they know (since and unread parameters) and get the events as json.
+    """
+
+    def get_last_seq(self, request):
+        """
+        Returns the change sequence number to continue after:
+        the id of the last received event, the since parameter or the latest change of the user.
+        """
+        last_seq = request.META.get('HTTP_LAST_EVENT_ID') or request.GET.get('since')
+        if last_seq is None:
+            return Change.objects.last_seq(request.user)
+        return int(last_seq)
+
+    def get(self, request):
+        """Returns the event stream (or the long-polled events) of the user."""
+        if not request.user.is_authenticated():
+            return redirect_to_login(request.get_full_path())
+        try:
+            last_seq = self.get_last_seq(request)
+            unread = int(request.GET['unread']) if 'unread' in request.GET else None
+        except ValueError:
+            return HttpResponseBadRequest("Invalid since, Last-Event-ID or unread.")
+        if 'text/event-stream' in request.META.get('HTTP_ACCEPT', ''):
+            response = HttpResponse(event_stream(request.user, last_seq), content_type='text/event-stream')
+            response['Cache-Control'] = 'no-cache'
+            response['X-Accel-Buffering'] = 'no' # let proxies pass each event at once
+            return response
+        events = [dict(data, event=name, id=id) for name, data, id in poll_events(request.user, last_seq, unread)]
+        return HttpResponse(json.dumps(events), content_type='application/json')
+
+
+class MediaView(View):
+    """
+    A view serving the avatars and reward images to logged in users.
+    Reward images are only served to the participants of the relations of the rewards.
+    Responses to hashed urls are cached by browsers for good,
+    plain urls are revalidated by ETag.
+    The file transfer is handed to the web server (see carrotwars.media).
+    """
+
+    def has_permission(self, user, name):
+        """Returns True if the user may see the media file (an image or one of its derivatives)."""
+        original = get_original_name(name)
+        if original in (UserProfile._meta.get_field('avatar').default, Reward._meta.get_field('image').default):
+            return True
+        if original.startswith(UserProfile._meta.get_field('avatar').upload_to + '/'):
+            return True # avatars are shown next to every username
+        if original.startswith(Reward._meta.get_field('image').upload_to + '/'):
+            return Reward.objects.filter(Q(relation__owner=user) | Q(relation__quester=user), image=original).exists()
+        return False
+
+    def get(self, request, path, hash=None):
+        """Returns the (offloaded) media file or a 304, 403, 404 or redirect response."""
+        if not request.user.is_authenticated():
+            return redirect_to_login(request.get_full_path())
+        name = posixpath.normpath(path).lstrip('/')
+        if name != path or name.startswith('..'):
+            raise Http404
+        media_hash = get_media_hash(name)
+        if media_hash is None:
+            raise Http404
+        if not self.has_permission(request.user, name):
+            return HttpResponseForbidden()
+        if hash is not None and hash != media_hash: # outdated url
+            return redirect(get_media_url(name))
+        etag = '"%s"' % media_hash
+        if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+            response = HttpResponseNotModified()
+        else:
+            response = serve_media(request, name)
+        response['ETag'] = etag
+        if hash is None:
+            response['Cache-Control'] = 'private, max-age=0, must-revalidate'
+        else:
+            response['Cache-Control'] = 'private, max-age=%s' % MEDIA_MAX_AGE
+        return response
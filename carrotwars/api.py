@@ -9,11 +9,17 @@ from django.contrib.auth.models import User
 from tastypie import fields
 from tastypie.resources import ModelResource
 from tastypie.authentication import BasicAuthentication
+from carrotwars.authentication import CachedApiKeyAuthentication, MultiAuthentication
 from tastypie.authorization import DjangoAuthorization
 from relations.models import Relation
 from quests.models import Quest
 from rewards.models import Reward
 from django.db.models import Q
+from carrotwars.conditional import ConditionalResourceMixin
+from carrotwars.paginator import CursorPaginator, SincePaginator
+from changes.models import Change
+from tastypie.exceptions import ImmediateHttpResponse
+from tastypie.http import HttpGone
 
 __author__ = "Eraldo Helal"
 
@@ -21,8 +27,9 @@ __author__ = "Eraldo Helal"
 class MetaMixin:
     """
     Mixin class to enable subclasses to inherit permission settings.
+    Clients authenticate with their api key (cheap) or with their password.
     """
-    authentication = BasicAuthentication()
+    authentication = MultiAuthentication(CachedApiKeyAuthentication(), BasicAuthentication())
     authorization = DjangoAuthorization()
     allowed_methods = ['get', 'put']
 
@@ -36,7 +43,7 @@ class UserResource(ModelResource):
         fields = ['username']
 
 
-class RelationResource(ModelResource):
+class RelationResource(ConditionalResourceMixin, ModelResource):
     """
     An api model resource representung user-relation objects.
     """
@@ -45,6 +52,7 @@ class RelationResource(ModelResource):
 
     class Meta(MetaMixin):
         queryset = Relation.objects.all()
+        paginator_class = CursorPaginator # opt-in (cursor parameter)
 
     def apply_authorization_limits(self, request, object_list):
         """
@@ -54,7 +62,7 @@ class RelationResource(ModelResource):
         return object_list.filter(Q(owner=request.user) | Q(quester=request.user))
 
 
-class QuestResource(ModelResource):
+class QuestResource(ConditionalResourceMixin, ModelResource):
     """
     An api model resource representung quest objects.
     """
@@ -62,6 +70,7 @@ class QuestResource(ModelResource):
 
     class Meta(MetaMixin):
         queryset = Quest.objects.all()
+        paginator_class = CursorPaginator # opt-in (cursor parameter)
 
     def apply_authorization_limits(self, request, object_list):
         """
@@ -70,7 +79,7 @@ class QuestResource(ModelResource):
         """
         return object_list.filter(Q(relation__owner=request.user) | Q(relation__quester=request.user))
 
-class RewardResource(ModelResource):
+class RewardResource(ConditionalResourceMixin, ModelResource):
     """
     An api model resource representung reward objects.
     """
@@ -78,6 +87,7 @@ class RewardResource(ModelResource):
 
     class Meta(MetaMixin):
         queryset = Reward.objects.all()
+        paginator_class = CursorPaginator # opt-in (cursor parameter)
     
     def apply_authorization_limits(self, request, object_list):
         """
@@ -87,3 +97,54 @@ class RewardResource(ModelResource):
         return object_list.filter(Q(relation__owner=request.user) | Q(relation__quester=request.user))
 
 
+class ChangePaginator(SincePaginator):
+    """
+    A since paginator returning the changes of a user by their sequence numbers.
+    """
+    sequence_field = 'seq'
+
+
+class ChangeResource(ModelResource):
+    """
+    An api model resource representing the change log of the user.
+    changes/?since=<seq> returns the changes after the provided sequence number,
+    changes/ without since returns no changes but the sequence number to start syncing from
+    (before downloading the data the sync starts with).
+    Changes are not answered conditionally: the returned changes depend on more than the table version.
+    """
+    seq = fields.IntegerField(attribute='seq')
+
+    class Meta(MetaMixin):
+        queryset = Change.objects.all()
+        resource_name = 'changes'
+        fields = ['object_type', 'object_id', 'operation', 'creation_date']
+        list_allowed_methods = ['get']
+        detail_allowed_methods = []
+        include_resource_uri = False
+        paginator_class = ChangePaginator
+
+    def apply_authorization_limits(self, request, object_list):
+        """
+        Limits api change requests to the changes of the user.
+        (using django filters)
+        """
+        return object_list.filter(user=request.user)
+
+    def get_list(self, request, **kwargs):
+        """
+        Returns the serialized changes after the since parameter
+        or 410 Gone if some of them were already pruned (the client has to download its data again).
+        Requests without since only get the sequence number to start from.
+        """
+        if 'since' not in request.GET:
+            return self.create_response(request, {'meta': {'last_seq': Change.objects.last_seq(request.user)}, 'objects': []})
+        since = request.GET['since']
+        if since.isdigit() and Change.objects.is_pruned(request.user, int(since)):
+            raise ImmediateHttpResponse(response=HttpGone("Changes since %s were pruned." % since))
+        return super(ChangeResource, self).get_list(request, **kwargs)
+
+    def dehydrate(self, bundle):
+        """Adds the resource uri of the changed object."""
+        bundle.data['object_uri'] = self._build_reverse_url('api_dispatch_detail', kwargs={
+            'api_name': self._meta.api_name, 'resource_name': bundle.obj.object_type, 'pk': bundle.obj.object_id})
+        return bundle
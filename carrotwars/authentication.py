@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+"""
+Contains the authentication settings of the RESTful API.
+Besides basic authentication (which runs the slow password hasher on every request),
+clients can authenticate with a per-user api key,
+which is verified against a process wide cache of the keys.
+"""
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models.signals import post_save, post_delete
+from django.utils.crypto import constant_time_compare
+from tastypie.authentication import Authentication, ApiKeyAuthentication
+from tastypie.models import ApiKey
+from carrotwars.cache import LRUCache
+
+__author__ = "Eraldo Helal"
+
+#: api keys shared by all requests of this process (keyed by username)
+api_key_cache = LRUCache(max_size=getattr(settings, 'API_KEY_CACHE_SIZE', 1000),
+                         timeout=getattr(settings, 'API_KEY_CACHE_TIMEOUT', 60))
+
+
+def invalidate_api_key(sender, instance, **kwargs):
+    """Removes the key of a changed, deleted (revoked) or regenerated api key or user from the cache."""
+    user = instance if sender is User else instance.user
+    api_key_cache.delete(user.username)
+
+post_save.connect(invalidate_api_key, sender=ApiKey)
+post_delete.connect(invalidate_api_key, sender=ApiKey)
+post_save.connect(invalidate_api_key, sender=User)
+post_delete.connect(invalidate_api_key, sender=User)
+
+
+def get_api_key(username):
+    """
+    Returns the active user of the username and its api key
+    (or None for unknown or inactive users and users without a key).
+    Results are cached, so repeated requests cost no query.
+    Revoked keys are removed from the cache of this process at once
+    and expire from the caches of other processes within API_KEY_CACHE_TIMEOUT seconds.
+    Cached users are shared by requests and must not be modified.
+    """
+    entry = api_key_cache.get(username)
+    if entry is None:
+        try:
+            api_key = ApiKey.objects.select_related('user').get(user__username=username, user__is_active=True)
+            entry = (api_key.user, api_key.key)
+        except ApiKey.DoesNotExist:
+            entry = (None, None)
+        api_key_cache.set(username, entry)
+    return entry
+
+
+class CachedApiKeyAuthentication(ApiKeyAuthentication):
+    """
+    Authenticates requests by a username and api key, passed as
+    "Authorization: ApiKey <username>:<api key>" header
+    or as username and api_key parameters.
+    Keys are compared in constant time against the cached keys.
+    """
+
+    def get_credentials(self, request):
+        """Returns the username and api key of the request (or None)."""
+        authorization = request.META.get('HTTP_AUTHORIZATION', '')
+        if authorization.startswith('ApiKey '):
+            username, separator, api_key = authorization[len('ApiKey '):].strip().partition(':')
+            return username, api_key
+        return (request.GET.get('username') or request.POST.get('username'),
+                request.GET.get('api_key') or request.POST.get('api_key'))
+
+    def is_authenticated(self, request, **kwargs):
+        """Returns True if the api key matches the one of the user or an unauthorized response."""
+        username, api_key = self.get_credentials(request)
+        if not username or not api_key:
+            return self._unauthorized()
+        user, key = get_api_key(username)
+        if user is None or not constant_time_compare(api_key, key):
+            return self._unauthorized()
+        request.user = user
+        return True
+
+    def get_identifier(self, request):
+        """Returns the username of the request (used for throttling)."""
+        return self.get_credentials(request)[0] or 'nouser'
+
+
+class MultiAuthentication(Authentication):
+    """
+    Authenticates requests with the first of the provided authentication backends that accepts them.
+    Rejected requests get the response of the last backend
+    (e.g. the basic authentication challenge).
+    """
+
+    def __init__(self, *backends):
+        """Sets the authentication backends in the order they are tried."""
+        super(MultiAuthentication, self).__init__()
+        self.backends = backends
+
+    def is_authenticated(self, request, **kwargs):
+        """Returns True if a backend accepts the request, else the response of the last backend."""
+        result = False
+        for backend in self.backends:
+            result = backend.is_authenticated(request, **kwargs)
+            if result is True:
+                request._authentication_backend = backend
+                return True
+        return result
+
+    def get_identifier(self, request):
+        """Returns the identifier of the request by the backend that accepted it."""
+        backend = getattr(request, '_authentication_backend', self.backends[-1])
+        return backend.get_identifier(request)
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+"""
+Contains the shared html badge renderers for ratings, balances, prices, deadlines and avatars.
+Rendered badges only depend on their values, so they are memoized
+(keyed by the values, avatars by their hashed media urls, and cleared when STATIC_URL, MEDIA_URL or STATIC_SPRITES change)
+and table rows showing the same values share one rendered string.
+With STATIC_SPRITES, carrots and bombs are rendered from the icon sprite sheet
+(up to five carrots are a single element).
+"""
+
+from functools import wraps
+from django.conf import settings
+from django.test.signals import setting_changed
+from django.utils import timezone
+from django.utils.safestring import mark_safe
+from carrotwars.media import get_media_url
+
+__author__ = "Eraldo Helal"
+
+#: maximum number of rendered badges kept per renderer
+BADGE_CACHE_SIZE = getattr(settings, 'BADGE_CACHE_SIZE', 1000)
+#: rendered badges of this process per renderer (keyed by arguments)
+badge_caches = []
+
+
+def memoize_badge(func):
+    """
+    Memoizes a badge renderer by its arguments.
+    A full cache is simply cleared (badge values repeat a lot,
+    so this bound is rarely reached and keeps lookups at a plain dict access).
+    The undecorated renderer stays available as the build attribute.
+    """
+    cache = {}
+    badge_caches.append(cache)
+    @wraps(func)
+    def wrapper(*args):
+        try:
+            return cache[args]
+        except KeyError:
+            if len(cache) >= BADGE_CACHE_SIZE:
+                cache.clear()
+            html = cache[args] = func(*args)
+            return html
+    wrapper.build = func
+    return wrapper
+
+
+def clear_badges():
+    """Clears all rendered badges."""
+    for cache in badge_caches:
+        cache.clear()
+
+
+def invalidate_badges(setting, **kwargs):
+    """Clears the rendered badges when the static or media url or the sprite mode changes."""
+    if setting in ('STATIC_URL', 'MEDIA_URL', 'STATIC_SPRITES'):
+        clear_badges()
+
+setting_changed.connect(invalidate_badges)
+
+
+def get_today():
+    """Returns the current date deadlines are compared to."""
+    return timezone.now().date()
+
+
+def _use_sprites():
+    """Returns True if icons are rendered from the sprite sheet."""
+    return getattr(settings, 'STATIC_SPRITES', False)
+
+
+def _carrots_html(amount):
+    """Returns 1-5 carrot images or a carrot image followed by the amount as a string."""
+    if _use_sprites():
+        if amount <= 5:
+            return '<span class="sprite sprite-carrots-%s"></span>' % amount if amount else ''
+        return '<span class="sprite sprite-carrots-1"></span> x %s' % amount
+    img_html = '<img src=%simages/carrot.png>' % settings.STATIC_URL
+    if amount <= 5:
+        return img_html * amount
+    return '%s x %s' % (img_html, amount)
+
+
+@memoize_badge
+def bomb_html(bomb):
+    """Returns the html representation of a quest bomb flag as a string."""
+    html = ""
+    if bomb and _use_sprites():
+        html = '<span class="sprite sprite-bomb"></span>'
+    elif bomb:
+        html = '<img src=%simages/bomb.png>' % settings.STATIC_URL
+    return mark_safe(html)
+
+
+@memoize_badge
+def rating_html(rating, bomb):
+    """
+    Returns the html representation of a quest rating as a string.
+    The code displays 1-5 carrot images
+    and a bomb image if the quest bomb flag is set.
+    """
+    html = _carrots_html(rating)
+    if bomb:
+        html += " " + bomb_html(bomb)
+    return mark_safe(html)
+
+
+@memoize_badge
+def balance_html(balance):
+    """Returns the html representation of a relation balance as a string."""
+    if balance == 0:
+        return mark_safe("no credits")
+    return mark_safe(_carrots_html(balance))
+
+
+@memoize_badge
+def price_html(price):
+    """Returns the html representation of a reward price as a string."""
+    if price == 0:
+        return mark_safe("free")
+    return mark_safe(_carrots_html(price))
+
+
+def deadline_html(deadline, today=None, warning_days=1):
+    """
+    Returns the color coded html representation of a deadline as a string.
+    The color depends on the days left until the deadline day (relative to today).
+    """
+    if not deadline:
+        return "-"
+    deadline = deadline.date()
+    days_left = (deadline - (today or get_today())).days
+    # all later days look alike: only the bucket is part of the memoization key
+    return _deadline_html(deadline, max(-1, min(days_left, warning_days + 1)), warning_days)
+
+
+@memoize_badge
+def _deadline_html(deadline, days_left, warning_days):
+    """Returns the color coded html representation of a deadline date as a string."""
+    template = '<span id="deadline-%s">%s</span>'
+    # render date in color depending on time left
+    if days_left == 0: # due
+        html = template % ("due", deadline)
+    elif days_left > 0: # not yet due
+        if days_left <= warning_days: # soon due
+            html = template % ("soon-due", deadline)
+        else: # not due
+            html = template % ("not-due", deadline)
+    else: # over due
+        html = template % ("over-due", deadline)
+    return mark_safe(html)
+
+
+def avatar_html(id, image_path):
+    """Returns the html representation of a user avatar as a string."""
+    # the hashed media url (changing with the file) is part of the memoization key
+    return _avatar_html(id, get_media_url(image_path) if image_path else "")
+
+
+@memoize_badge
+def _avatar_html(id, url):
+    """Returns the html representation of a user avatar with the provided media url as a string."""
+    html = ""
+    if url:
+        html = '<img id="%s" src="%s">' % (id, url)
+    return mark_safe(html)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+"""
+Contains in-process caching helpers shared by the carrotwars applications.
+"""
+
+import time
+from collections import OrderedDict
+from threading import Lock
+from django.conf import settings
+from django.core.cache import cache
+
+__author__ = "Eraldo Helal"
+
+#: django cache backends keeping their entries in the memory of each process
+LOCAL_CACHE_BACKENDS = ('LocMemCache', 'DummyCache')
+
+
+def is_shared_cache():
+    """
+    Returns True if the django cache is shared by all processes of the site
+    (web servers, background workers and cron jobs), as set by CACHE_IS_SHARED
+    or else judged by the backend (local memory and dummy caches are not shared).
+    """
+    shared = getattr(settings, 'CACHE_IS_SHARED', None)
+    if shared is None:
+        shared = type(cache).__name__ not in LOCAL_CACHE_BACKENDS
+    return shared
+
+
+class LRUCache(object):
+    """
+    A thread-safe least recently used cache living in the current process.
+    At most max_size entries are kept, each for at most timeout seconds
+    (bounding how long other processes may serve a stale entry).
+    """
+
+    def __init__(self, max_size=1000, timeout=300):
+        """Creates an empty cache."""
+        self.max_size = max_size
+        self.timeout = timeout
+        self.entries = OrderedDict() # key -> (expiry, value)
+        self.lock = Lock()
+
+    def get(self, key, default=None):
+        """Returns the cached value of the key or the default if missing or expired."""
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None or entry[0] < time.time():
+                return default
+            self.entries[key] = entry # mark as most recently used
+            return entry[1]
+
+    def set(self, key, value):
+        """Caches the value for the key and evicts the least recently used entries."""
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (time.time() + self.timeout, value)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        """Removes the key from the cache."""
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        """Removes all entries from the cache."""
+        with self.lock:
+            self.entries.clear()
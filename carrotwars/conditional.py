@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""
+Contains the conditional GET support of the quest, relation and reward pages and the api.
+Responses carry an ETag derived from the table version of the user
+(bumped on every change of the quests, relations, rewards and profiles of the user),
+so clients and proxies revalidating an unchanged page or resource
+get a 304 Not Modified response without the quest, relation and reward tables being queried.
+Like the cached tables, ETags require a cache shared by all processes.
+"""
+
+from hashlib import md5
+from django.contrib import messages
+from django.middleware.csrf import get_token
+from django.views.decorators.http import condition
+from carrotwars.tablecache import get_table_version, get_table_modified, is_table_cache_enabled
+from carrotwars.unread import get_unread_count
+
+__author__ = "Eraldo Helal"
+
+
+def _hash(*parts):
+    """Returns an ETag value for the provided parts."""
+    return md5(":".join(unicode(part) for part in parts).encode('utf-8')).hexdigest()
+
+
+def get_page_etag(request, *args, **kwargs):
+    """
+    Returns the ETag of a page of the current user (or None if the page has to be rendered).
+    Besides the tables, pages show the number of unread messages, pending flash messages
+    and forms posting the csrf token.
+    """
+    user = request.user
+    if not user.is_authenticated() or len(messages.get_messages(request)) or not is_table_cache_enabled():
+        return None
+    unread = get_unread_count(user)
+    return _hash(get_table_version(user.pk), unread, get_token(request))
+
+
+def get_resource_etag(request, *args, **kwargs):
+    """Returns the ETag of an api resource of the authenticated user."""
+    if not request.user.is_authenticated() or not is_table_cache_enabled():
+        return None
+    return _hash(get_table_version(request.user.pk), request.META.get('HTTP_ACCEPT', ''))
+
+
+def get_resource_modified(request, *args, **kwargs):
+    """Returns the time the api resources of the authenticated user changed last."""
+    if not request.user.is_authenticated() or not is_table_cache_enabled():
+        return None
+    return get_table_modified(request.user.pk)
+
+
+class ConditionalMixin(object):
+    """
+    A mixin class answering requests for unchanged pages with 304 Not Modified.
+    Follows the login mixin in the bases of a view.
+    Detail pages also depend on the modification date of their object
+    (which may belong to relations of other users).
+    """
+
+    def get_etag(self, request, *args, **kwargs):
+        """Returns the ETag of the requested page (or None if the page has to be rendered)."""
+        etag = get_page_etag(request)
+        if etag and 'pk' in kwargs:
+            modified = self.model._default_manager.filter(pk=kwargs['pk']).values_list('modification_date', flat=True)
+            etag = _hash(etag, *modified)
+        return etag
+
+    def dispatch(self, request, *args, **kwargs):
+        """Processes the request unless the page of the client is still up to date."""
+        view = super(ConditionalMixin, self).dispatch
+        return condition(etag_func=self.get_etag)(view)(request, *args, **kwargs)
+
+
+class ConditionalResourceMixin(object):
+    """
+    A mixin class for api resources answering requests for unchanged lists and details
+    with 304 Not Modified.
+    """
+
+    def get_list(self, request, **kwargs):
+        """Returns the serialized list unless the one of the client is still up to date."""
+        view = super(ConditionalResourceMixin, self).get_list
+        return condition(get_resource_etag, get_resource_modified)(view)(request, **kwargs)
+
+    def get_detail(self, request, **kwargs):
+        """Returns the serialized resource unless the one of the client is still up to date."""
+        view = super(ConditionalResourceMixin, self).get_detail
+        return condition(get_resource_etag, get_resource_modified)(view)(request, **kwargs)
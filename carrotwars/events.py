@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+"""
+Contains the live event streams of the users.
+Changes of relations, quests and rewards and new messages publish the ids of the users concerned
+on a pub/sub channel, which wakes up the event streams of these users.
+Woken streams read the new changes (from the change log) and the unread message count
+from the database, so events only carry committed state and resuming streams miss nothing.
+The default channel only reaches the streams of the current process,
+deployments with several processes configure a cross-process channel (EVENT_CHANNEL).
+Open streams hold a worker each, so pages only open a stream once EVENT_STREAM_URL is set
+(pointing at the events view served by a separate asynchronous process).
+"""
+
+import json
+import time
+from collections import defaultdict
+from threading import Event, Lock, local
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils.importlib import import_module
+
+__author__ = "Eraldo Helal"
+
+#: seconds an event stream stays open before the client reconnects
+EVENT_STREAM_TIMEOUT = getattr(settings, 'EVENT_STREAM_TIMEOUT', 55)
+#: seconds between heartbeats (and database checks) of an idle event stream
+EVENT_HEARTBEAT = getattr(settings, 'EVENT_HEARTBEAT', 15)
+#: maximum number of changes sent per database read
+EVENT_BATCH_SIZE = 100
+
+
+class LocalChannel(object):
+    """
+    An in-process stand-in for a cross-process pub/sub channel (e.g. redis).
+    Messages are passed to the listeners of this process right away.
+    """
+
+    def __init__(self):
+        """Creates a channel without listeners."""
+        self.listeners = []
+        self.lock = Lock()
+
+    def subscribe(self, listener):
+        """Calls the listener with every published message."""
+        with self.lock:
+            self.listeners.append(listener)
+
+    def publish(self, message):
+        """Passes the message to all listeners."""
+        with self.lock:
+            listeners = list(self.listeners)
+        for listener in listeners:
+            listener(message)
+
+
+class EventBus(object):
+    """
+    Wakes up the listeners of the users whose ids are published on the channel.
+    """
+
+    def __init__(self, channel):
+        """Creates a bus receiving the user ids published on the channel."""
+        self.channel = channel
+        self.listeners = defaultdict(set) # user id -> set of events
+        self.lock = Lock()
+        channel.subscribe(self.dispatch)
+
+    def publish(self, user_ids):
+        """Publishes the provided user ids on the channel."""
+        self.channel.publish(sorted(set(user_ids)))
+
+    def dispatch(self, user_ids):
+        """Wakes up the listeners of the provided user ids."""
+        with self.lock:
+            for user_id in user_ids:
+                for listener in self.listeners.get(user_id, ()):
+                    listener.set()
+
+    def listen(self, user_id):
+        """Returns a new listener of the user (to be closed after use)."""
+        return Listener(self, user_id)
+
+
+class Listener(object):
+    """
+    A registration of an event stream at the event bus.
+    Can be used as context manager closing the registration.
+    """
+
+    def __init__(self, bus, user_id):
+        """Registers the listener at the bus."""
+        self.bus = bus
+        self.user_id = user_id
+        self.event = Event()
+        with bus.lock:
+            bus.listeners[user_id].add(self.event)
+
+    def wait(self, timeout):
+        """Returns True if the user was published within the timeout in seconds (or before)."""
+        woken = self.event.wait(timeout)
+        self.event.clear()
+        return woken
+
+    def close(self):
+        """Removes the listener from the bus."""
+        with self.bus.lock:
+            listeners = self.bus.listeners[self.user_id]
+            listeners.discard(self.event)
+            if not listeners:
+                del self.bus.listeners[self.user_id]
+
+    def __enter__(self):
+        """Returns the listener."""
+        return self
+
+    def __exit__(self, *exc_info):
+        """Closes the listener."""
+        self.close()
+
+
+def get_channel():
+    """Returns a new channel of the class configured as EVENT_CHANNEL."""
+    module, attribute = getattr(settings, 'EVENT_CHANNEL', 'carrotwars.events.LocalChannel').rsplit('.', 1)
+    return getattr(import_module(module), attribute)()
+
+#: the event bus of this process
+event_bus = EventBus(get_channel())
+
+#: users published inside a transaction of the current thread
+_uncommitted = local()
+
+
+def publish_events(*user_ids):
+    """
+    Wakes up the event streams of the provided users.
+    Inside a transaction the users are published by flush_events after the commit,
+    so the woken streams read the committed changes.
+    """
+    if transaction.is_managed():
+        _uncommitted.user_ids = getattr(_uncommitted, 'user_ids', set()) | set(user_ids)
+    else:
+        event_bus.publish(user_ids)
+
+
+def flush_events():
+    """Publishes the users published inside transactions of the current thread."""
+    user_ids = getattr(_uncommitted, 'user_ids', None)
+    _uncommitted.user_ids = set()
+    if user_ids:
+        event_bus.publish(user_ids)
+
+
+class EventMiddleware(object):
+    """
+    Middleware publishing the users changed by a request
+    once its transactions committed.
+    """
+
+    def process_response(self, request, response):
+        """Flushes the users published by the request."""
+        flush_events()
+        return response
+
+
+def event_stream_url(request):
+    """Context processor providing the url of the event stream pages open (None if disabled)."""
+    return {'event_stream_url': getattr(settings, 'EVENT_STREAM_URL', None)}
+
+
+def format_event(name, data, id=None):
+    """Returns a server-sent event as a string."""
+    lines = ["event: %s" % name]
+    if id is not None:
+        lines.append("id: %s" % id)
+    lines.append("data: %s" % json.dumps(data))
+    return "\n".join(lines) + "\n\n"
+
+
+def read_events(user, last_seq, unread):
+    """
+    Returns the events of the user after the provided change sequence number
+    (and an unread event if the unread message count differs from the provided one)
+    as list of (name, data, id) tuples.
+    """
+    # imported here: the change log and the unread counts publish their users with this module
+    from changes.models import Change
+    from carrotwars.unread import get_unread_count
+    events = [('change', {'object_type': change.object_type, 'object_id': change.object_id,
+                          'operation': change.operation}, change.seq)
+              for change in Change.objects.since(user, last_seq)[:EVENT_BATCH_SIZE]]
+    count = get_unread_count(user)
+    if count != unread:
+        events.append(('unread', {'count': count}, None))
+    return events
+
+
+def event_stream(user, last_seq, timeout=EVENT_STREAM_TIMEOUT, heartbeat=EVENT_HEARTBEAT):
+    """
+    Yields the server-sent events of the user after the provided change sequence number
+    until the timeout in seconds passed (clients reconnect with the id of the last event).
+    The database connection is closed while the stream waits,
+    so idle streams neither hold a connection nor read from an old snapshot.
+    """
+    deadline = time.time() + timeout
+    unread = None
+    yield "retry: 3000\n\n"
+    with event_bus.listen(user.pk) as listener:
+        while True:
+            events = read_events(user, last_seq, unread)
+            for name, data, id in events:
+                if name == 'unread':
+                    unread = data['count']
+                else:
+                    last_seq = id
+                yield format_event(name, data, id)
+            if len([event for event in events if event[0] == 'change']) >= EVENT_BATCH_SIZE:
+                continue # more changes are waiting
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            connection.close()
+            if not listener.wait(min(heartbeat, remaining)):
+                yield ": heartbeat\n\n"
+
+
+def poll_events(user, last_seq, unread, timeout=EVENT_STREAM_TIMEOUT, heartbeat=EVENT_HEARTBEAT):
+    """
+    Returns the events of the user after the provided change sequence number
+    and unread message count, waiting up to the timeout in seconds for one
+    (the long-poll variant of event_stream for clients without server-sent events).
+    The database is checked again every heartbeat, as the channel may not reach the process recording a change.
+    """
+    deadline = time.time() + timeout
+    with event_bus.listen(user.pk) as listener:
+        events = read_events(user, last_seq, unread)
+        while not events:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            connection.close()
+            listener.wait(min(heartbeat, remaining))
+            events = read_events(user, last_seq, unread)
+    return events
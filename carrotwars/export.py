@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+"""
+Contains the newline delimited json export of the history of a user.
+The relations, quests and rewards of the user are read in primary key chunks
+and written one json object per line by a generator,
+so memory use does not grow with the size of the history.
+"""
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from relations.models import Relation
+from quests.models import Quest
+from rewards.models import Reward
+
+__author__ = "Eraldo Helal"
+
+#: rows read per query
+EXPORT_CHUNK_SIZE = 1000
+
+
+def iterate_chunked(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yields the field dictionaries of the query set in primary key order,
+    reading at most chunk_size rows per query (each chunk continues after the last primary key,
+    so no query skips rows with an offset).
+    """
+    queryset = queryset.order_by('pk').values()
+    last_pk = 0
+    while True:
+        rows = list(queryset.filter(pk__gt=last_pk)[:chunk_size])
+        for row in rows:
+            yield row
+        if len(rows) < chunk_size:
+            break
+        last_pk = rows[-1]['id']
+
+
+def get_export_sets(user):
+    """Returns (type, query set) pairs of the exported objects of the user."""
+    return (
+        ('relation', Relation.objects.filter(Q(owner=user) | Q(quester=user))),
+        ('quest', Quest.objects.filter(Q(relation__owner=user) | Q(relation__quester=user))),
+        ('reward', Reward.objects.filter(Q(relation__owner=user) | Q(relation__quester=user))),
+    )
+
+
+def export_lines(user, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yields the relations, quests and rewards of the user as lines of json objects
+    (each object has a type and the fields of the exported row).
+    """
+    encoder = DjangoJSONEncoder()
+    for type, queryset in get_export_sets(user):
+        for row in iterate_chunked(queryset, chunk_size):
+            row['type'] = type
+            yield encoder.encode(row) + "\n"
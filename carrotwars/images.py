@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+"""
+Contains the derivatives of the uploaded reward images and avatars.
+Every image gets a small icon and a display sized image derivative,
+stored next to the original (e.g. rewards/images/cake.icon.jpg).
+Derivatives are created by the background task pool after the image was saved.
+Until they exist, the original image is shown instead.
+Existing derivatives are kept, only the createderivatives command replaces them
+(e.g. after changing IMAGE_DERIVATIVES).
+"""
+
+import os
+from cStringIO import StringIO
+from threading import Lock
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from carrotwars.cache import LRUCache
+from carrotwars.media import media_hash_cache
+from carrotwars.tablecache import bump_table_versions
+from carrotwars.tasks import run_in_background
+try:
+    from PIL import Image
+except ImportError:
+    import Image
+
+__author__ = "Eraldo Helal"
+
+#: derivative name -> maximum (width, height), twice the displayed size for high density screens
+IMAGE_DERIVATIVES = getattr(settings, 'IMAGE_DERIVATIVES', {
+    'icon': (64, 64),
+    'image': (500, 500),
+})
+
+#: seconds a missing derivative is assumed to be missing
+#: (derivatives created by other processes are shown after at most this delay)
+MISSING_DERIVATIVE_TIMEOUT = getattr(settings, 'MISSING_DERIVATIVE_TIMEOUT', 60)
+
+#: names of the derivatives known to exist (new uploads get new names)
+derivative_cache = LRUCache(max_size=10000, timeout=3600)
+#: names of the derivatives known to be missing (cleared once created by this process)
+missing_derivative_cache = LRUCache(max_size=10000, timeout=MISSING_DERIVATIVE_TIMEOUT)
+
+#: names of the images whose derivatives are being created by this process
+_pending = set()
+_pending_lock = Lock()
+
+
+def get_derivative_name(name, derivative):
+    """Returns the storage name of the derivative of the image with the provided name."""
+    root, ext = os.path.splitext(name)
+    return "%s.%s%s" % (root, derivative, ext)
+
+
+def get_original_name(name):
+    """Returns the storage name of the image a derivative was created from (or the name itself)."""
+    root, ext = os.path.splitext(name)
+    original, dot, derivative = root.rpartition('.')
+    if dot and derivative in IMAGE_DERIVATIVES:
+        return original + ext
+    return name
+
+
+def get_derivative(name, derivative):
+    """
+    Returns the storage name of the derivative of the image
+    or the name of the image if the derivative does not exist (yet).
+    """
+    if not name:
+        return name
+    derivative_name = get_derivative_name(name, derivative)
+    if derivative_cache.get(derivative_name) is None:
+        if missing_derivative_cache.get(derivative_name):
+            return name
+        if not default_storage.exists(derivative_name):
+            missing_derivative_cache.set(derivative_name, True)
+            return name
+        derivative_cache.set(derivative_name, True)
+    return derivative_name
+
+
+def has_derivatives(name):
+    """
+    Returns True if all derivatives of the image with the provided name exist
+    (or there is no image or the image is a derivative itself).
+    """
+    return not name or get_original_name(name) != name or all(get_derivative(name, derivative) != name for derivative in IMAGE_DERIVATIVES)
+
+
+def create_derivatives(name, replace=False):
+    """
+    Creates the missing derivatives of the image with the provided name
+    (or replaces all of them if replace is set).
+    Replaced derivatives get new hashed media urls.
+    """
+    derivatives = dict((derivative, size) for derivative, size in IMAGE_DERIVATIVES.items()
+                       if replace or not default_storage.exists(get_derivative_name(name, derivative)))
+    if not derivatives:
+        return
+    image_file = default_storage.open(name)
+    try:
+        image = Image.open(image_file)
+        image.load()
+    finally:
+        image_file.close()
+    format = image.format
+    for derivative, size in derivatives.items():
+        resized = image.copy()
+        resized.thumbnail(size, Image.ANTIALIAS) # keeps the aspect ratio, never enlarges
+        if format == 'JPEG' and resized.mode != 'RGB':
+            resized = resized.convert('RGB')
+        content = StringIO()
+        resized.save(content, format)
+        derivative_name = get_derivative_name(name, derivative)
+        default_storage.delete(derivative_name) # saving would pick a new name otherwise
+        default_storage.save(derivative_name, ContentFile(content.getvalue()))
+        missing_derivative_cache.delete(derivative_name)
+        derivative_cache.set(derivative_name, True)
+        media_hash_cache.delete(derivative_name) # the hash of the new modification time
+
+
+def _create_derivatives(name, user_ids):
+    """Creates the derivatives of the image and invalidates the cached tables showing it."""
+    try:
+        create_derivatives(name)
+        bump_table_versions(*user_ids)
+    finally:
+        with _pending_lock:
+            _pending.discard(name)
+
+
+def schedule_derivatives(name, *user_ids):
+    """
+    Creates the missing derivatives of the image with the provided name in the background.
+    The cached tables of the provided users (showing the image) are invalidated afterwards.
+    Returns the AsyncResult of the task or None if there is nothing to do.
+    """
+    if has_derivatives(name):
+        return None
+    with _pending_lock:
+        if name in _pending:
+            return None
+        _pending.add(name)
+    return run_in_background(_create_derivatives, name, user_ids)
@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+"""
+Contains the management command building the bundled static assets.
+"""
+
+from optparse import make_option
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from carrotwars.staticbundles import build_bundles, build_sprites
+
+__author__ = "Eraldo Helal"
+
+
+class Command(BaseCommand):
+    """
+    Builds the icon sprite sheet, collects the static files to STATIC_ROOT
+    and writes the fingerprinted css and javascript bundles next to them.
+    Deployments set STATIC_BUNDLED afterwards and serve STATIC_ROOT/bundles
+    with far-future expiry headers.
+    """
+    help = "Builds the sprite sheet, collects the static files and writes the fingerprinted bundles."
+    option_list = BaseCommand.option_list + (
+        make_option('--skip-sprites', action='store_true', default=False,
+            help="Keep the sprite sheet (e.g. if PIL is not available)."),
+    )
+
+    def handle(self, *args, **options):
+        """Builds the sprites and bundles."""
+        if not options['skip_sprites']:
+            build_sprites(settings.STATICFILES_DIRS[0])
+            self.stdout.write("Built the sprite sheet.\n")
+        call_command('collectstatic', interactive=False, verbosity=0)
+        for bundle, name in sorted(build_bundles().items()):
+            self.stdout.write("Built %s as %s.\n" % (bundle, name))
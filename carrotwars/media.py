@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""
+Contains the hashed urls and the offloaded serving of the uploaded media.
+Media urls carry a hash of the file name, size and modification time
+(e.g. /media/0123456789ab/rewards/images/cake.jpg), taken from the file system without reading the file,
+so responses can be cached by browsers for good: changed files get new urls.
+Django only checks the permissions of a request and hands the file transfer
+to the web server (X-Sendfile or X-Accel-Redirect, see MEDIA_SENDFILE),
+so no python worker streams media bytes in production.
+"""
+
+import mimetypes
+from hashlib import md5
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.storage import default_storage
+from django.http import HttpResponse
+from django.utils.http import urlquote
+from django.views import static
+from carrotwars.cache import LRUCache
+
+__author__ = "Eraldo Helal"
+
+#: seconds browsers cache media requested by a hashed url
+MEDIA_MAX_AGE = 365 * 24 * 60 * 60
+#: length of the hashes of the media urls
+MEDIA_HASH_LENGTH = 12
+
+#: hashes of the media files (uploads never change, replaced derivatives expire)
+media_hash_cache = LRUCache(max_size=10000, timeout=3600)
+
+
+def get_media_hash(name):
+    """
+    Returns the hash of the name, size and modification time of the media file with the provided name
+    (or None if it does not exist). The file itself is never read.
+    """
+    media_hash = media_hash_cache.get(name)
+    if media_hash is None:
+        try:
+            signature = "%s:%s:%s" % (name, default_storage.size(name), default_storage.modified_time(name).isoformat())
+        except (IOError, OSError):
+            return None
+        media_hash = md5(signature.encode('utf-8')).hexdigest()[:MEDIA_HASH_LENGTH]
+        media_hash_cache.set(name, media_hash)
+    return media_hash
+
+
+def get_media_url(name):
+    """Returns the hashed url of the media file (or its plain url if it does not exist)."""
+    media_hash = get_media_hash(name)
+    if media_hash is None:
+        return settings.MEDIA_URL + urlquote(name)
+    return "%s%s/%s" % (settings.MEDIA_URL, media_hash, urlquote(name))
+
+
+def serve_media(request, name):
+    """
+    Returns a response handing the transfer of the media file to the web server
+    as configured by MEDIA_SENDFILE:
+    'x-accel-redirect' (nginx, internal location MEDIA_ACCEL_PREFIX aliasing MEDIA_ROOT),
+    'x-sendfile' (apache mod_xsendfile, lighttpd) or
+    None (the file is streamed by django, for development only).
+    """
+    backend = getattr(settings, 'MEDIA_SENDFILE', None)
+    if backend is None:
+        return static.serve(request, name, document_root=settings.MEDIA_ROOT)
+    response = HttpResponse(content_type=mimetypes.guess_type(name)[0] or 'application/octet-stream')
+    if backend == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = getattr(settings, 'MEDIA_ACCEL_PREFIX', '/protected-media/') + urlquote(name)
+    elif backend == 'x-sendfile':
+        response['X-Sendfile'] = default_storage.path(name)
+    else:
+        raise ImproperlyConfigured("Unknown MEDIA_SENDFILE backend '%s'." % backend)
+    return response
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+"""
+Contains the cursor paginators of the RESTful API.
+Clients walking long result sets follow an opaque cursor on (creation_date, id)
+or a sequence number instead of an offset, so deep pages cost as much as the first one.
+"""
+
+from urllib import urlencode
+from django.core import signing
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from tastypie.exceptions import BadRequest
+from tastypie.paginator import Paginator
+
+__author__ = "Eraldo Helal"
+
+
+class CursorPaginator(Paginator):
+    """
+    A paginator walking result sets ordered by (creation_date, id) with a cursor.
+    Clients opt in by passing a cursor parameter (empty for the first page)
+    and follow the next uri of each page until it is null.
+    Pages are neither counted nor reached by skipping rows,
+    and rows inserted while a client walks the set do not shift its pages
+    (they are created later, so they show up at the end).
+    Requests without a cursor parameter are paginated by offset.
+    """
+    ordering = ('creation_date', 'id')
+    salt = 'carrotwars.api.cursor'
+
+    def encode_cursor(self, obj):
+        """Returns the signed cursor pointing behind the provided object."""
+        return signing.dumps([obj.creation_date.isoformat(), obj.pk], salt=self.salt)
+
+    def decode_cursor(self, cursor):
+        """Returns the creation date and id a cursor points behind (or None for an empty cursor)."""
+        if not cursor:
+            return None
+        try:
+            creation_date, pk = signing.loads(cursor, salt=self.salt)
+            return parse_datetime(creation_date), int(pk)
+        except (signing.BadSignature, TypeError, ValueError):
+            raise BadRequest("Invalid cursor '%s' provided." % cursor)
+
+    def get_cursor_slice(self, limit, cursor):
+        """
+        Returns the list of objects following the cursor (at most limit)
+        and whether more objects follow them.
+        """
+        objects = self.objects.order_by(*self.ordering)
+        position = self.decode_cursor(cursor)
+        if position:
+            creation_date, pk = position
+            objects = objects.filter(Q(creation_date__gt=creation_date) | Q(creation_date=creation_date, pk__gt=pk))
+        if not limit:
+            return list(objects), False
+        objects = list(objects[:limit + 1])
+        return objects[:limit], len(objects) > limit
+
+    def _generate_cursor_uri(self, limit, cursor):
+        """Returns the uri of the page behind the provided cursor."""
+        if self.resource_uri is None:
+            return None
+        request_params = dict([k, v.encode('utf-8')] for k, v in self.request_data.items() if k != 'offset')
+        request_params.update({'limit': limit, 'cursor': cursor})
+        return '%s?%s' % (self.resource_uri, urlencode(request_params))
+
+    def page(self):
+        """
+        Returns the objects and meta data of the requested page.
+        Cursor pages carry the uri of the next page (or None) but no total count.
+        """
+        if 'cursor' not in self.request_data:
+            return super(CursorPaginator, self).page()
+        if 'order_by' in self.request_data:
+            raise BadRequest("Cursor pagination is always ordered by creation date and cannot be combined with order_by.")
+        limit = self.get_limit()
+        objects, more = self.get_cursor_slice(limit, self.request_data['cursor'])
+        meta = {
+            'limit': limit,
+            'next': None,
+        }
+        if more:
+            meta['next'] = self._generate_cursor_uri(limit, self.encode_cursor(objects[-1]))
+        return {
+            'objects': objects,
+            'meta': meta,
+        }
+
+
+class SincePaginator(Paginator):
+    """
+    A paginator returning the objects after a sequence number (primary key) in order.
+    Clients pass the last sequence number they have seen as since parameter
+    (0 for everything) and keep the last_seq of each page for their next sync.
+    Full pages link the following page as next.
+    Pages cost as much as the number of returned objects, no matter how many objects are older.
+    """
+    #: field holding the sequence numbers
+    sequence_field = 'pk'
+
+    def get_since(self):
+        """Returns the sequence number after which objects are returned."""
+        since = self.request_data.get('since', 0)
+        try:
+            since = int(since)
+        except ValueError:
+            raise BadRequest("Invalid since '%s' provided. Please provide an integer." % since)
+        if since < 0:
+            raise BadRequest("Invalid since '%s' provided. Please provide an integer >= 0." % since)
+        return since
+
+    def _generate_since_uri(self, limit, since):
+        """Returns the uri of the page after the provided sequence number."""
+        if self.resource_uri is None:
+            return None
+        request_params = dict([k, v.encode('utf-8')] for k, v in self.request_data.items() if k != 'offset')
+        request_params.update({'limit': limit, 'since': since})
+        return '%s?%s' % (self.resource_uri, urlencode(request_params))
+
+    def page(self):
+        """Returns the objects after the since parameter and the meta data of the page."""
+        limit = self.get_limit()
+        since = self.get_since()
+        objects = self.objects.filter(**{'%s__gt' % self.sequence_field: since}).order_by(self.sequence_field)
+        more = False
+        if limit:
+            objects = list(objects[:limit + 1])
+            more = len(objects) > limit
+            objects = objects[:limit]
+        else:
+            objects = list(objects)
+        last_seq = getattr(objects[-1], self.sequence_field) if objects else since
+        meta = {
+            'limit': limit,
+            'since': since,
+            'last_seq': last_seq,
+            'next': None,
+        }
+        if more:
+            meta['next'] = self._generate_since_uri(limit, last_seq)
+        return {
+            'objects': objects,
+            'meta': meta,
+        }
@@ -29,6 +29,9 @@ DATABASES = {
     }
 }
 
+# tests run on a file based sqlite database in a temporary directory (threaded tests share it)
+TEST_RUNNER = 'carrotwars.testrunner.FileDatabaseTestRunner'
+
 # Local time zone for this installation. Choices can be found here:
 # http://en.wikipedia.org/wiki/List_of_tz_zones_by_name
 # although not all choices may be available on all operating systems.
@@ -61,16 +64,28 @@ MEDIA_ROOT = os.path.join(PROJECT_DIR, 'media')
 # Examples: "http://media.lawrence.com/media/", "http://example.com/media/"
 MEDIA_URL = urlparse.urljoin(DOMAIN, 'media/')
 
+# How the web server transfers media files once django checked the permissions:
+# 'x-accel-redirect' (nginx: "location /protected-media/ { internal; alias <MEDIA_ROOT>/; }"),
+# 'x-sendfile' (apache mod_xsendfile, lighttpd) or None (streamed by django, development only).
+MEDIA_SENDFILE = None
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+
 # Absolute path to the directory static files should be collected to.
 # Don't put anything in this directory yourself; store your static files
 # in apps' "static/" subdirectories and in STATICFILES_DIRS.
 # Example: "/home/media/media.lawrence.com/static/"
-STATIC_ROOT = ''
+STATIC_ROOT = os.path.join(PROJECT_DIR, 'collected_static')
 
 # URL prefix for static files.
 # Example: "http://media.lawrence.com/static/"
 STATIC_URL = '/static/'
 
+# Pages include one fingerprinted css and javascript bundle instead of the single files
+# (run "python manage.py buildstatic" first, serve STATIC_ROOT/bundles with far-future expiry headers).
+STATIC_BUNDLED = False
+# Render carrots, bombs and action buttons from the icon sprite sheet instead of single images.
+STATIC_SPRITES = True
+
 # Additional locations of static files
 STATICFILES_DIRS = (
     # Put strings here, like "/home/html/static" or "C:/www/django/static".
@@ -98,6 +113,9 @@ TEMPLATE_LOADERS = (
 )
 
 MIDDLEWARE_CLASSES = (
+    'carrotwars.tablecache.TableVersionMiddleware', # first: responds after all transactions ended
+    'carrotwars.events.EventMiddleware', # publishes the users changed by the request
+    'carrotwars.unread.UnreadCountMiddleware', # keeps the cached unread message counts up to date
     'django.middleware.common.CommonMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -136,9 +154,13 @@ INSTALLED_APPS = (
     'relations',
     'quests',
     'rewards',
+    'notifications', # notification outbox
+    'changes', # change log of the api
 
     'accounts', # user profiles
 
+    'carrotwars', # shared template tags and management commands
+
     'pagination', # should be above postman
     # 'ajax_select', # should be above postman
     'postman', # user messaging
@@ -154,6 +176,32 @@ INSTALLED_APPS = (
 LOGIN_URL='/accounts/login/'
 LOGIN_REDIRECT_URL = '/quests/' #reverse('home') << breaks ajax-selects
 LOGIN_ERROR_URL    = '/accounts/login-error/'
+# in-process user profile cache (entries are dropped on profile save and after the timeout in seconds)
+PROFILE_CACHE_SIZE = 1000
+PROFILE_CACHE_TIMEOUT = 300
+# api keys cached per process (revoked keys expire in other processes after the timeout in seconds)
+API_KEY_CACHE_SIZE = 1000
+API_KEY_CACHE_TIMEOUT = 60
+# seconds rendered quest, relation and reward tables are cached (invalidated on changes)
+TABLE_CACHE_TIMEOUT = 600
+# seconds unread message counts are cached (reconciled every hour, a few minutes at most with a local memory cache)
+UNREAD_CACHE_TIMEOUT = 86400
+# worker threads per process for background tasks (e.g. creating image derivatives)
+TASK_THREADS = 2
+# avatars of social sign-ups are fetched in the background (seconds per download, downloads tried)
+AVATAR_FETCH_TIMEOUT = 5
+AVATAR_FETCH_RETRIES = 3
+AVATAR_FETCHER = 'accounts.avatars.UrllibFetcher'
+
+# table versions and fragments need a cache shared by all processes in production (e.g. memcached),
+# tables are neither cached nor answered with 304 with a local memory cache unless CACHE_IS_SHARED is set
+# (e.g. for the single process development server)
+CACHE_IS_SHARED = None
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
 AUTH_PROFILE_MODULE = 'accounts.UserProfile'
 
 TEMPLATE_CONTEXT_PROCESSORS = (
@@ -168,6 +216,8 @@ TEMPLATE_CONTEXT_PROCESSORS = (
    "social_auth.context_processors.social_auth_backends",
    "social_auth.context_processors.social_auth_by_type_backends",
    "social_auth.context_processors.social_auth_login_redirect",
+   "carrotwars.unread.unread_count", # cached unread message count of the menu
+   "carrotwars.events.event_stream_url", # live events of the pages (if enabled)
 )
 
 # A sample logging configuration. The only tangible logging
@@ -209,6 +259,20 @@ POSTMAN_DISABLE_USER_EMAILING = True
 POSTMAN_NOTIFIER_APP = True
 POSTMAN_AUTO_MODERATE_AS = True
 
+# seconds the digest of a bulk event (e.g. a sweep run) waits for the rest of the event before delivery
+NOTIFICATION_DIGEST_WINDOW = 60
+# seconds an event stream stays open (clients reconnect) and between heartbeats of idle streams
+EVENT_STREAM_TIMEOUT = 55
+EVENT_HEARTBEAT = 15
+# pub/sub channel waking up event streams (the local channel only reaches streams of the same process)
+EVENT_CHANNEL = 'carrotwars.events.LocalChannel'
+# url of the event stream opened by the pages (None: no live events, pages show the state they were rendered with);
+# every open stream holds a worker for EVENT_STREAM_TIMEOUT seconds, so serve the events view
+# from a separate asynchronous process (e.g. gunicorn with gevent workers) before setting it
+EVENT_STREAM_URL = None
+# days api changes are kept (clients syncing less often have to download their data again)
+CHANGE_LOG_DAYS = 30
+
 #### django-ajax-selects settings
 
 # define the lookup channels in use on the site
@@ -269,4 +333,7 @@ SOCIAL_AUTH_ASSOCIATE_URL_NAME = 'socialauth_associate_complete'
 
 CRON_CLASSES = [
     "quests.cron.UpdateQuestStatusCronJob",
+    "relations.cron.CompactLedgerCronJob",
+    "changes.cron.PruneChangesCronJob",
+    "notifications.cron.ReconcileUnreadCountsCronJob",
 ]
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+"""
+Contains the bundled and fingerprinted static assets and the icon sprite sheet.
+The css and javascript files every page loads are concatenated into one bundle per type
+named by a hash of its content (e.g. bundles/site.0123456789ab.css),
+so browsers and proxies can cache bundles for good: changed bundles get new names.
+Images referenced by bundled stylesheets get a content hash as query string.
+Bundles are built by the buildstatic management command (after collecting the static files)
+and used by the bundle template tag once STATIC_BUNDLED is set.
+The carrot, bomb and action icons are combined into one sprite sheet,
+so tables render them as css backgrounds of a single image.
+"""
+
+import json
+import os
+import posixpath
+import re
+from hashlib import md5
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+try:
+    from PIL import Image
+except ImportError:
+    import Image
+
+__author__ = "Eraldo Helal"
+
+#: bundle name -> static files concatenated into the bundle (in order)
+STATIC_BUNDLES = getattr(settings, 'STATIC_BUNDLES', {
+    'site.css': ('css/common.css', 'dropdownmenu/dropdownmenu.css', 'css/sprites.css',
+                 'django_tables2/themes/paleblue/css/screen.css'),
+    'site.js': ('dropdownmenu/dropdownmenu.js',),
+})
+#: directory of the bundles (and their manifest) in the collected static files
+BUNDLE_DIR = 'bundles'
+#: file mapping the bundle names to their fingerprinted names
+BUNDLE_MANIFEST = posixpath.join(BUNDLE_DIR, 'manifest.json')
+#: length of the content hashes of bundles and referenced images
+BUNDLE_HASH_LENGTH = 12
+
+#: icons of the sprite sheet (one row each, the carrot row holds MAX_SPRITE_CARROTS carrots)
+SPRITE_ICONS = ('carrot', 'bomb', 'accept', 'decline', 'complete', 'confirm', 'deny')
+SPRITE_SIZE = 25
+MAX_SPRITE_CARROTS = 5
+SPRITE_SHEET = 'images/sprites.png'
+SPRITE_CSS = 'css/sprites.css'
+
+_comment_re = re.compile(r'/\*.*?\*/', re.S)
+_import_re = re.compile(r'@import\s+url\((["\']?)(.+?)\1\)\s*;')
+_url_re = re.compile(r'url\((["\']?)(.+?)\1\)')
+
+
+def get_content_hash(content):
+    """Returns the fingerprint of the provided content."""
+    return md5(content).hexdigest()[:BUNDLE_HASH_LENGTH]
+
+
+def bundle_css(storage, names, bundle_dir=BUNDLE_DIR):
+    """
+    Returns the stylesheets with the provided names concatenated.
+    Comments are removed, imported stylesheets are inlined
+    and relative urls are rebased to the bundle directory
+    (with the content hash of existing files as query string).
+    """
+    def rebase(match, name):
+        url = match.group(2)
+        if url.startswith(('/', '#')) or ':' in url:
+            return match.group(0) # absolute or data url
+        path = posixpath.normpath(posixpath.join(posixpath.dirname(name), url))
+        if storage.exists(path):
+            with storage.open(path) as referenced:
+                url = "%s?v=%s" % (posixpath.relpath(path, bundle_dir), get_content_hash(referenced.read()))
+        else:
+            url = posixpath.relpath(path, bundle_dir)
+        return "url('%s')" % url
+
+    def read(name):
+        with storage.open(name) as stylesheet:
+            content = _comment_re.sub('', stylesheet.read())
+        imports = [posixpath.normpath(posixpath.join(posixpath.dirname(name), match.group(2)))
+                   for match in _import_re.finditer(content)]
+        content = _url_re.sub(lambda match: rebase(match, name), _import_re.sub('', content))
+        return "".join(read(imported) for imported in imports) + "/* %s */\n%s\n" % (name, content.strip())
+
+    return "".join(read(name) for name in names)
+
+
+def bundle_js(storage, names):
+    """Returns the scripts with the provided names concatenated."""
+    scripts = []
+    for name in names:
+        with storage.open(name) as script:
+            scripts.append("/* %s */\n%s\n;" % (name, script.read().strip()))
+    return "\n".join(scripts) + "\n"
+
+
+def build_bundles(storage=staticfiles_storage):
+    """
+    Writes the fingerprinted bundles and their manifest to the (collected) static files storage.
+    Returns the manifest (bundle name -> fingerprinted name).
+    """
+    manifest = {}
+    for bundle, names in sorted(STATIC_BUNDLES.items()):
+        root, ext = posixpath.splitext(bundle)
+        content = bundle_css(storage, names) if ext == '.css' else bundle_js(storage, names)
+        name = posixpath.join(BUNDLE_DIR, "%s.%s%s" % (root, get_content_hash(content), ext))
+        if not storage.exists(name):
+            storage.save(name, ContentFile(content))
+        manifest[bundle] = name
+    storage.delete(BUNDLE_MANIFEST)
+    storage.save(BUNDLE_MANIFEST, ContentFile(json.dumps(manifest, indent=2, sort_keys=True)))
+    return manifest
+
+
+def build_sprites(static_dir):
+    """Writes the sprite sheet of the icons and its stylesheet to the provided static files directory."""
+    sheet = Image.new('RGBA', (SPRITE_SIZE * MAX_SPRITE_CARROTS, SPRITE_SIZE * len(SPRITE_ICONS)), (0, 0, 0, 0))
+    rules = [
+        ".sprite {",
+        "    display: inline-block;",
+        "    width: %spx;" % SPRITE_SIZE,
+        "    height: %spx;" % SPRITE_SIZE,
+        "    padding: 0;",
+        "    border: 0;",
+        "    vertical-align: middle;",
+        "    background: url('../%s') no-repeat;" % SPRITE_SHEET,
+        "}",
+        "button.sprite {",
+        "    cursor: pointer;",
+        "}",
+    ]
+    for row, icon in enumerate(SPRITE_ICONS):
+        image = Image.open(os.path.join(static_dir, 'images', icon + '.png')).convert('RGBA')
+        top = row * SPRITE_SIZE
+        if icon == 'carrot':
+            for count in range(1, MAX_SPRITE_CARROTS + 1):
+                sheet.paste(image, ((count - 1) * SPRITE_SIZE, top))
+                rules.append(".sprite-carrots-%s { width: %spx; background-position: 0 %spx; }"
+                             % (count, count * SPRITE_SIZE, -top))
+        else:
+            sheet.paste(image, (0, top))
+            rules.append(".sprite-%s { background-position: 0 %spx; }" % (icon, -top))
+    sheet.save(os.path.join(static_dir, *SPRITE_SHEET.split('/')), optimize=True)
+    with open(os.path.join(static_dir, *SPRITE_CSS.split('/')), 'w') as stylesheet:
+        stylesheet.write("/* generated by the buildstatic management command */\n%s\n" % "\n".join(rules))
+
+
+#: the bundle manifest of this process (loaded on first use)
+_manifest = None
+
+
+def get_manifest():
+    """Returns the bundle manifest written by the buildstatic management command."""
+    global _manifest
+    if _manifest is None:
+        try:
+            with staticfiles_storage.open(BUNDLE_MANIFEST) as manifest:
+                _manifest = json.loads(manifest.read())
+        except (IOError, OSError):
+            raise ImproperlyConfigured("STATIC_BUNDLED is set but there are no bundles. "
+                                       "Please run 'python manage.py buildstatic'.")
+    return _manifest
+
+
+def get_bundle_urls(bundle):
+    """
+    Returns the urls of the provided bundle: the url of the fingerprinted bundle
+    if STATIC_BUNDLED is set, else the urls of the files of the bundle (e.g. for development).
+    """
+    if getattr(settings, 'STATIC_BUNDLED', False):
+        return [staticfiles_storage.url(get_manifest()[bundle])]
+    return [staticfiles_storage.url(name) for name in STATIC_BUNDLES[bundle]]
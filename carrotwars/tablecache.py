@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+"""
+Contains the per-user versioning of the cached quest, relation and reward tables.
+Rendered tables are cached as template fragments keyed by the table version of the user.
+Every change of a quest, relation, reward or profile bumps the versions
+of the users involved, so their next page view renders fresh tables
+while unchanged tables keep coming from the cache.
+The versions also serve as ETags of the pages and api resources of the users.
+Versions are bumped by background workers and cron jobs as well,
+so tables are only cached with a cache shared by all processes (see is_table_cache_enabled).
+"""
+
+import time
+from threading import local
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from carrotwars.cache import is_shared_cache
+
+__author__ = "Eraldo Helal"
+
+#: seconds a rendered table fragment is cached
+TABLE_CACHE_TIMEOUT = getattr(settings, 'TABLE_CACHE_TIMEOUT', 600)
+
+
+def is_table_cache_enabled():
+    """
+    Returns True if rendered tables are cached and pages are answered by their table versions.
+    With a cache local to each process, versions bumped by other processes
+    (e.g. the deadline scheduler cron job) never reach the web processes.
+    """
+    return is_shared_cache()
+
+
+def _get_version_key(user_id):
+    """Returns the cache key of the table version of the user."""
+    return 'tables.version.%s' % user_id
+
+
+def _get_modified_key(user_id):
+    """Returns the cache key of the time of the last table version bump of the user."""
+    return 'tables.modified.%s' % user_id
+
+
+def _new_version():
+    """
+    Returns a version number that was not used before
+    (even if the previous version of a user got evicted from the cache).
+    """
+    return int(time.time() * 1000)
+
+
+def get_table_version(user_id):
+    """
+    Returns the current table version of the user as a string.
+    The version includes the current date, as deadline colors change with the day.
+    """
+    key = _get_version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        if cache.add(key, _new_version()):
+            cache.set(_get_modified_key(user_id), timezone.now())
+        version = cache.get(key)
+    return "%s-%s" % (version, timezone.now().date())
+
+
+def get_table_modified(user_id):
+    """
+    Returns the time the tables of the user changed last.
+    Unknown times (evicted from the cache) are assumed to be now.
+    """
+    key = _get_modified_key(user_id)
+    modified = cache.get(key)
+    if modified is None:
+        cache.add(key, timezone.now())
+        modified = cache.get(key)
+    return modified
+
+
+#: users whose versions were bumped inside a transaction of the current thread
+_uncommitted = local()
+
+
+def _bump(user_ids):
+    """Increments the table versions of the provided users."""
+    for user_id in user_ids:
+        key = _get_version_key(user_id)
+        try:
+            cache.incr(key)
+        except ValueError: # no version yet (or evicted)
+            cache.set(key, _new_version())
+    now = timezone.now()
+    cache.set_many(dict((_get_modified_key(user_id), now) for user_id in user_ids))
+
+
+def bump_table_versions(*user_ids):
+    """
+    Invalidates the cached tables of the provided users.
+    Bumps inside a transaction are repeated by flush_table_versions after the commit,
+    so tables rendered from the not yet committed state in the meantime are not kept.
+    """
+    user_ids = set(user_ids)
+    _bump(user_ids)
+    if transaction.is_managed():
+        _uncommitted.user_ids = getattr(_uncommitted, 'user_ids', set()) | user_ids
+
+
+def flush_table_versions():
+    """Bumps the table versions bumped inside transactions of the current thread again."""
+    user_ids = getattr(_uncommitted, 'user_ids', None)
+    _uncommitted.user_ids = set()
+    if user_ids:
+        _bump(user_ids)
+
+
+class TableVersionMiddleware(object):
+    """
+    Middleware bumping the table versions changed by a request again
+    once its transactions committed.
+    """
+
+    def process_request(self, request):
+        """Flushes the table versions bumped outside of requests beforehand."""
+        flush_table_versions()
+
+    def process_response(self, request, response):
+        """Flushes the table versions bumped by the request."""
+        flush_table_versions()
+        return response
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+"""
+Contains table helpers shared by the quest, relation and reward views.
+"""
+
+import django_tables2 as tables
+from django.conf import settings
+from django.core.urlresolvers import reverse
+from django.middleware.csrf import get_token
+from django.utils.functional import SimpleLazyObject
+from django.utils.safestring import mark_safe
+from django_tables2 import RequestConfig
+from django_tables2.utils import A  # alias for Accessor
+from accounts.models import prime_profiles
+from carrotwars import badges
+from carrotwars.tablecache import get_table_version, is_table_cache_enabled, TABLE_CACHE_TIMEOUT
+
+__author__ = "Eraldo Helal"
+
+
+class PrefetchTable(tables.Table):
+    """
+    Table base class loading the related objects of the displayed rows in bulk.
+    Query set data joins the related objects listed in select_related,
+    the profiles of the users listed in user_accessors are loaded
+    for the current page with a single query before the rows are rendered.
+    All rows compare their dates to the same today.
+    """
+    #: related objects joined into the query of the table rows
+    select_related = ()
+    #: accessors of the users displayed in each row
+    user_accessors = ()
+
+    def __init__(self, data, *args, **kwargs):
+        """Creates the table joining the related objects of query set data."""
+        self.today = badges.get_today()
+        if self.select_related and hasattr(data, 'select_related'):
+            data = data.select_related(*self.select_related)
+        super(PrefetchTable, self).__init__(data, *args, **kwargs)
+
+    def paginate(self, *args, **kwargs):
+        """Paginates the table and prefetches the rows of the current page."""
+        super(PrefetchTable, self).paginate(*args, **kwargs)
+        self.prefetch(self.page.object_list.data)
+
+    def prefetch(self, records):
+        """Primes the profiles of the users displayed for the provided records."""
+        prime_profiles([A(accessor).resolve(record) for record in records for accessor in self.user_accessors])
+
+
+class ActionColumn(tables.Column):
+    """
+    Table column layout for an action button posting to the url of a record.
+    Renders the same markup as a TemplateColumn using {% url %} and {% csrf_token %}
+    but resolves the url pattern and gets the csrf token only once per table
+    and formats each cell with a string template.
+    Subclasses set the view name, the button label and the button image.
+    Buttons with an icon of the sprite sheet are rendered from it if STATIC_SPRITES is set.
+    """
+    empty_values = ()
+    #: name of the url pattern taking the column value as only argument
+    viewname = None
+    label = None
+    image = None
+    #: name of the button icon in the sprite sheet (or None)
+    sprite = None
+    template = """
+        
+        <form action="%(url)s" method="POST">
+            %(csrf)s
+            <input type="image" value="%(label)s" src="%(image)s" />
+            </form>
+            """
+    sprite_template = """
+        
+        <form action="%(url)s" method="POST">
+            %(csrf)s
+            <button type="submit" class="sprite sprite-%(sprite)s" title="%(label)s" value="%(label)s"></button>
+            </form>
+            """
+    #: stands in for the value while resolving the url pattern
+    placeholder = 918273645
+
+    def render(self, value, record, table):
+        """Returns a html string version of the action button for the record."""
+        if not hasattr(self, '_prepared'):
+            self._prepared = self.prepare(table)
+        url_prefix, url_suffix, csrf = self._prepared
+        if self.sprite and getattr(settings, 'STATIC_SPRITES', False):
+            template = self.sprite_template
+        else:
+            template = self.template
+        return mark_safe(template % {
+            'url': "%s%s%s" % (url_prefix, value, url_suffix),
+            'csrf': csrf,
+            'label': self.label,
+            'image': self.get_image(record),
+            'sprite': self.sprite,
+            })
+
+    def prepare(self, table):
+        """
+        Returns the url parts around the value and the csrf token html as a tuple.
+        The csrf token is taken from the context render_table attaches to the table.
+        """
+        url = reverse(self.viewname, args=[self.placeholder])
+        url_prefix, url_suffix = url.split(str(self.placeholder), 1)
+        context = getattr(table, 'context', {})
+        return url_prefix, url_suffix, get_csrf_html(context.get('csrf_token', None))
+
+    def get_image(self, record):
+        """Returns the button image url for the record."""
+        return self.image
+
+
+def get_csrf_html(csrf_token):
+    """Returns the hidden csrf token form field as the {% csrf_token %} tag renders it."""
+    if not csrf_token:
+        return u''
+    csrf_token = unicode(csrf_token)
+    if csrf_token == 'NOTPROVIDED':
+        return mark_safe(u"")
+    return mark_safe(u"<div style='display:none'><input type='hidden' name='csrfmiddlewaretoken' value='%s' /></div>" % csrf_token)
+
+
+def lazy_tables(request, tables, per_page=10):
+    """
+    Returns a context dictionary containing a lazy data set and a lazy table
+    for each of the provided (name, table class, data function) tuples.
+    Data sets are only queried and tables are only built and configured
+    by the request once a template actually uses them.
+    A data set and its table share a single evaluation of the data function.
+    The context also contains the table version, key and timeout
+    the templates key and expire the cached table fragments with.
+    The table key adds the paging and sorting parameters and the csrf token
+    (rendered into the action buttons) to the version.
+    Without a shared cache the fragments expire at once (timeout 0), so tables are always rendered.
+    """
+    version = get_table_version(request.user.pk)
+    context = {
+        'table_version': version,
+        'table_key': "%s:%s:%s" % (version, request.GET.urlencode(), get_token(request)),
+        'table_cache_timeout': TABLE_CACHE_TIMEOUT if is_table_cache_enabled() else 0,
+        }
+    for name, table_class, get_data in tables:
+        get_data = _evaluate_once(get_data)
+        context[name] = SimpleLazyObject(get_data)
+        context['%s_table' % name] = SimpleLazyObject(_table_builder(request, table_class, get_data, per_page))
+    return context
+
+
+def _evaluate_once(func):
+    """Returns a function that calls the provided function once and then returns the cached result."""
+    result = []
+    def evaluate():
+        if not result:
+            result.append(func())
+        return result[0]
+    return evaluate
+
+
+def _table_builder(request, table_class, get_data, per_page):
+    """Returns a function building a table of the provided class configured by the request."""
+    def build():
+        table = table_class(get_data())
+        RequestConfig(request, paginate={"per_page": per_page,}).configure(table)
+        return table
+    return build
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+"""
+Contains the background task pool of the carrotwars applications.
+Slow work triggered by requests (e.g. resizing uploaded images) runs on a small
+pool of worker threads of the current process, so responses do not wait for it.
+Tasks are not persisted: work lost with a restarted process has to be repeated
+by the management command of the task.
+"""
+
+import logging
+from multiprocessing.pool import ThreadPool
+from threading import Lock
+from django.conf import settings
+from django.db import connection
+
+__author__ = "Eraldo Helal"
+
+#: number of worker threads of the background task pool
+TASK_THREADS = getattr(settings, 'TASK_THREADS', 2)
+
+logger = logging.getLogger(__name__)
+
+#: the background task pool of this process (created by the first task)
+_pool = None
+_pool_lock = Lock()
+
+
+def get_pool():
+    """
+    Returns the background task pool of this process.
+    The pool is created on first use, so processes forked by the server
+    start their own worker threads.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPool(TASK_THREADS)
+        return _pool
+
+
+def _run(func, args):
+    """Runs a task in a worker thread and logs its failure."""
+    try:
+        return func(*args)
+    except Exception:
+        logger.exception("Background task %s failed.", func.__name__)
+        raise
+    finally:
+        connection.close() # every thread has its own connection
+
+
+def run_in_background(func, *args):
+    """
+    Calls the function with the provided arguments in a worker thread.
+    Returns an AsyncResult (wait for the result with its get method).
+    """
+    return get_pool().apply_async(_run, (func, args))
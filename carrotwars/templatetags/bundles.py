@@ -0,0 +1,26 @@
+#!/usr/bin/env python
+"""
+Contains the template tag including the bundled static assets.
+"""
+
+from django import template
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+from carrotwars.staticbundles import get_bundle_urls
+
+__author__ = "Eraldo Helal"
+
+register = template.Library()
+
+
+@register.simple_tag
+def bundle(name):
+    """
+    Returns the html tags including a css or javascript bundle, e.g. {% bundle "site.css" %}
+    (one tag for the fingerprinted bundle or one tag per bundled file, see STATIC_BUNDLED).
+    """
+    if name.endswith('.css'):
+        tag = '<link href="%s" rel="stylesheet" type="text/css" media="screen" />'
+    else:
+        tag = '<script type="text/javascript" src="%s"></script>'
+    return mark_safe("\n  ".join(tag % escape(url) for url in get_bundle_urls(name)))
@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+"""
+Contains the test runner of the carrotwars applications.
+Tests run on a file based sqlite test database instead of an in-memory one,
+as threads do not share an in-memory database (e.g. the balance contention tests).
+"""
+
+import os
+import shutil
+import tempfile
+from django.db import connections
+from django.test.simple import DjangoTestSuiteRunner
+
+__author__ = "Eraldo Helal"
+
+
+class FileDatabaseTestRunner(DjangoTestSuiteRunner):
+    """
+    A test runner creating the sqlite test databases without TEST_NAME
+    as files in a temporary directory, which is removed after the tests.
+    """
+
+    def setup_databases(self, **kwargs):
+        """Points the sqlite test databases to files in a new temporary directory and creates them."""
+        self.database_dir = tempfile.mkdtemp(prefix='carrotwars-test-')
+        for alias in connections:
+            settings_dict = connections[alias].settings_dict
+            if settings_dict['ENGINE'].endswith('sqlite3') and not settings_dict.get('TEST_NAME'):
+                settings_dict['TEST_NAME'] = os.path.join(self.database_dir, '%s.db' % alias)
+        return super(FileDatabaseTestRunner, self).setup_databases(**kwargs)
+
+    def teardown_databases(self, old_config, **kwargs):
+        """Destroys the test databases and removes the temporary directory."""
+        try:
+            super(FileDatabaseTestRunner, self).teardown_databases(old_config, **kwargs)
+        finally:
+            shutil.rmtree(self.database_dir, ignore_errors=True)
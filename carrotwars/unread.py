@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+"""
+Contains the cached per-user count of unread messages shown in the menu of every page.
+Counting the unread messages of a user is a query on the postman message table,
+so the count is kept in the cache and only counted again after it was reset.
+New messages increment the counts of their recipients.
+Postman marks messages read, archived and deleted with bulk updates (which send no signals),
+so the count of a user is reset after every postman view doing so.
+A cron job reconciles the cached counts with the database.
+Increments by background workers and cron jobs only reach the web processes through a cache
+shared by all processes, so counts in a cache local to each process expire within minutes.
+"""
+
+from threading import local
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.signals import post_save, post_delete
+from postman.models import Message, STATUS_ACCEPTED
+from carrotwars.cache import is_shared_cache
+from carrotwars.events import publish_events
+
+__author__ = "Eraldo Helal"
+
+#: seconds a count is cached (bounds the drift of a count that missed a change)
+UNREAD_CACHE_TIMEOUT = getattr(settings, 'UNREAD_CACHE_TIMEOUT', 86400)
+#: seconds a count is cached at most by a cache local to each process
+UNREAD_LOCAL_CACHE_TIMEOUT = 180
+#: postman views marking messages read, archived, deleted or undeleted
+RESET_VIEWS = ('view', 'view_conversation', 'archive', 'delete', 'undelete')
+
+
+def _get_key(user_id):
+    """Returns the cache key of the unread message count of the user."""
+    return 'messages.unread.%s' % user_id
+
+
+def get_unread_cache_timeout():
+    """
+    Returns the seconds a count is cached: UNREAD_CACHE_TIMEOUT with a cache shared by all processes,
+    else a few minutes, as the web processes miss the increments of other processes.
+    """
+    if is_shared_cache():
+        return UNREAD_CACHE_TIMEOUT
+    return min(UNREAD_CACHE_TIMEOUT, UNREAD_LOCAL_CACHE_TIMEOUT)
+
+
+def get_unread_count(user):
+    """Returns the number of unread messages of the user (counted only if not cached)."""
+    key = _get_key(user.pk)
+    count = cache.get(key)
+    if count is None:
+        count = Message.objects.inbox_unread_count(user)
+        cache.add(key, count, get_unread_cache_timeout())
+    return count
+
+
+def is_unread(message):
+    """Returns True if the message counts as unread message of its recipient."""
+    return (message.recipient_id is not None and message.moderation_status == STATUS_ACCEPTED
+            and not message.recipient_archived and message.recipient_deleted_at is None
+            and message.read_at is None)
+
+
+#: counts incremented and reset inside transactions of the current thread
+_uncommitted = local()
+
+
+def _increment(user_ids):
+    """Increments the cached counts of the provided users (once per occurrence)."""
+    for user_id in user_ids:
+        try:
+            cache.incr(_get_key(user_id))
+        except ValueError: # not cached, counted on the next read
+            pass
+
+
+def _reset(user_ids):
+    """Removes the cached counts of the provided users."""
+    cache.delete_many([_get_key(user_id) for user_id in user_ids])
+
+
+def increment_unread_counts(*user_ids):
+    """
+    Increments the counts of the provided users (once per occurrence) for new unread messages.
+    Inside a transaction the counts are incremented by flush_unread_counts after the commit,
+    so counts read from the database in the meantime are not incremented twice.
+    """
+    if transaction.is_managed():
+        _uncommitted.increments = getattr(_uncommitted, 'increments', []) + list(user_ids)
+    else:
+        _increment(user_ids)
+    publish_events(*user_ids)
+
+
+def reset_unread_counts(*user_ids):
+    """
+    Resets the counts of the provided users, which are counted again on their next read.
+    Resets inside a transaction are repeated by flush_unread_counts after the commit,
+    so counts read from the not yet committed state in the meantime are not kept.
+    """
+    _reset(user_ids)
+    if transaction.is_managed():
+        _uncommitted.resets = getattr(_uncommitted, 'resets', set()) | set(user_ids)
+    publish_events(*user_ids)
+
+
+def flush_unread_counts():
+    """Applies the increments and resets made inside transactions of the current thread."""
+    increments = getattr(_uncommitted, 'increments', None)
+    resets = getattr(_uncommitted, 'resets', None)
+    _uncommitted.increments = []
+    _uncommitted.resets = set()
+    if resets:
+        _reset(resets)
+    if increments:
+        _increment([user_id for user_id in increments if user_id not in (resets or ())])
+
+
+def reconcile_unread_counts():
+    """
+    Sets the cached counts of all users to their number of unread messages.
+    Returns the number of users with unread messages.
+    """
+    unread = Message.objects.filter(recipient__isnull=False, recipient_archived=False,
+        recipient_deleted_at__isnull=True, moderation_status=STATUS_ACCEPTED, read_at__isnull=True)
+    counts = dict(unread.values_list('recipient').annotate(count=Count('pk')).order_by())
+    user_ids = User.objects.values_list('pk', flat=True)
+    cache.set_many(dict((_get_key(user_id), counts.get(user_id, 0)) for user_id in user_ids), get_unread_cache_timeout())
+    return len(counts)
+
+
+def update_unread_count(sender, instance, created, **kwargs):
+    """Increments the count of the recipient of a new message or resets it for a changed message."""
+    if instance.recipient_id is None:
+        return
+    if not created:
+        reset_unread_counts(instance.recipient_id)
+    elif is_unread(instance):
+        increment_unread_counts(instance.recipient_id)
+
+post_save.connect(update_unread_count, sender=Message)
+
+
+def reset_deleted_unread_count(sender, instance, **kwargs):
+    """Resets the count of the recipient of a deleted message."""
+    if instance.recipient_id is not None:
+        reset_unread_counts(instance.recipient_id)
+
+post_delete.connect(reset_deleted_unread_count, sender=Message)
+
+
+def unread_count(request):
+    """Context processor providing the unread message count of an authenticated user."""
+    if request.user.is_authenticated():
+        return {'unread_count': get_unread_count(request.user)}
+    return {}
+
+
+class UnreadCountMiddleware(object):
+    """
+    Middleware resetting the count of a user after postman views changing the read state,
+    and applying the counts changed by a request once its transactions committed.
+    """
+
+    def process_request(self, request):
+        """Flushes the counts changed outside of requests beforehand."""
+        flush_unread_counts()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        """Marks requests of postman views changing the read state of messages."""
+        request.resets_unread_count = (view_func.__module__ == 'postman.views'
+                                       and view_func.__name__ in RESET_VIEWS)
+
+    def process_response(self, request, response):
+        """Resets the count of the user after marked requests and flushes the counts changed by the request."""
+        if getattr(request, 'resets_unread_count', False) and request.user.is_authenticated():
+            reset_unread_counts(request.user.pk)
+        flush_unread_counts()
+        return response
@@ -5,7 +5,7 @@ Contains the base url mappings for the carrotwars project.
 
 from django.conf.urls import patterns, include, url
 from django.shortcuts import redirect
-from accounts.views import LoginErrorView
+from accounts.views import LoginErrorView, ExportView, EventView, MediaView
 
 # Uncomment the next two lines to enable the admin:
 from django.contrib import admin
@@ -13,7 +13,7 @@ from ajax_select import urls as ajax_select_urls
 
 # api
 from tastypie.api import Api
-from carrotwars.api import UserResource, RelationResource, QuestResource, RewardResource
+from carrotwars.api import UserResource, RelationResource, QuestResource, RewardResource, ChangeResource
 
 __author__ = "Eraldo Helal"
 
@@ -26,6 +26,7 @@ v1_api.register(UserResource())
 v1_api.register(RelationResource())
 v1_api.register(QuestResource())
 v1_api.register(RewardResource())
+v1_api.register(ChangeResource())
 
 urlpatterns = patterns('',
     # Examples:
@@ -44,6 +45,10 @@ urlpatterns = patterns('',
     url(r'^accounts/logout/$', 'django.contrib.auth.views.logout_then_login', name='logout'),
     # login error page
     url(r'^accounts/login-error/$', LoginErrorView.as_view(), name='login-error'),
+    # history export (newline delimited json)
+    url(r'^accounts/export/$', ExportView.as_view(), name='export'),
+    # live events (server-sent events or long-polling)
+    url(r'^accounts/events/$', EventView.as_view(), name='events'),
 
     # main urls
     url(r'^$', lambda x: redirect('/quests'), name='home'),
@@ -59,12 +64,8 @@ urlpatterns = patterns('',
 
     # include api
     url(r'^api/', include(v1_api.urls)),
-)
-
-from django.conf import settings
 
-if settings.DEBUG:
-    # static files (images, css, javascript, etc.)
-    urlpatterns += patterns('',
-        (r'^media/(?P<path>.*)$', 'django.views.static.serve', {
-        'document_root': settings.MEDIA_ROOT}))
+    # uploaded media (content hashed and plain urls, transferred by the web server)
+    url(r'^media/(?P<hash>[0-9a-f]{12})/(?P<path>.+)$', MediaView.as_view(), name='media'),
+    url(r'^media/(?P<path>.+)$', MediaView.as_view()),
+)
@@ -0,0 +1,17 @@
+#!/usr/bin/env python
+"""
+Contains the django admin interface settings related to the change model.
+"""
+
+from django.contrib import admin
+from changes.models import Change
+
+__author__ = "Eraldo Helal"
+
+
+class ChangeAdmin(admin.ModelAdmin):
+    """Meta information model to display the change log."""
+    list_display = ('id', 'user', 'seq', 'operation', 'object_type', 'object_id', 'creation_date')
+    list_filter = ('object_type', 'operation')
+
+admin.site.register(Change, ChangeAdmin)
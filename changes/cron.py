@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+"""
+Contains the change log related cron job settings.
+This module manages the pruning of old changes
+by using time based triggering.
+"""
+
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from django_cron import CronJobBase, Schedule
+from changes.models import Change
+
+__author__ = "Eraldo Helal"
+
+
+class PruneChangesCronJob(CronJobBase):
+    """
+    Triggers pruning of the change log once a day.
+    Clients that did not sync for CHANGE_LOG_DAYS have to download their data again.
+    """
+    RUN_AT_TIMES = ['03:30']
+    KEEP_DAYS = getattr(settings, 'CHANGE_LOG_DAYS', 30)
+
+    schedule = Schedule(run_at_times=RUN_AT_TIMES)
+    code = 'changes.prune_changes'    # a unique code
+
+    def do(self):
+        """
+        Deletes the changes older than KEEP_DAYS.
+        Returns a summary message that is stored in the cron job log.
+        """
+        removed = Change.objects.prune(before=timezone.now() - timedelta(days=self.KEEP_DAYS))
+        return "Removed %s changes." % removed
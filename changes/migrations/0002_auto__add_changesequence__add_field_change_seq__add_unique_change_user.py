@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+import datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Removing index on 'Change', fields ['user', 'id'] (replaced by the unique constraint)
+        db.delete_index('changes_change', ['user_id', 'id'])
+
+        # Adding model 'ChangeSequence'
+        db.create_table('changes_changesequence', (
+            ('user', self.gf('django.db.models.fields.related.OneToOneField')(related_name='change_sequence', unique=True, primary_key=True, to=orm['auth.User'])),
+            ('last_seq', self.gf('django.db.models.fields.PositiveIntegerField')(default=0)),
+            ('pruned_seq', self.gf('django.db.models.fields.PositiveIntegerField')(default=0)),
+        ))
+        db.send_create_signal('changes', ['ChangeSequence'])
+
+        # Adding field 'Change.seq'
+        db.add_column('changes_change', 'seq',
+                      self.gf('django.db.models.fields.PositiveIntegerField')(default=0),
+                      keep_default=False)
+
+        # the primary keys serve as sequence numbers of the existing changes,
+        # so the sequence numbers known to clients stay valid
+        # and every user continues above all of them (pruned before the oldest kept change)
+        if not db.dry_run:
+            db.execute('UPDATE changes_change SET seq = id')
+            db.execute('INSERT INTO changes_changesequence (user_id, last_seq, pruned_seq) '
+                       'SELECT auth_user.id, COALESCE((SELECT MAX(id) FROM changes_change), 0), '
+                       'COALESCE((SELECT MIN(id) FROM changes_change), 1) - 1 FROM auth_user')
+
+        # Adding unique constraint on 'Change', fields ['user', 'seq']
+        db.create_unique('changes_change', ['user_id', 'seq'])
+
+
+    def backwards(self, orm):
+        # Removing unique constraint on 'Change', fields ['user', 'seq']
+        db.delete_unique('changes_change', ['user_id', 'seq'])
+
+        # Deleting model 'ChangeSequence'
+        db.delete_table('changes_changesequence')
+
+        # Deleting field 'Change.seq'
+        db.delete_column('changes_change', 'seq')
+
+        # Adding index on 'Change', fields ['user', 'id']
+        db.create_index('changes_change', ['user_id', 'id'])
+
+
+    models = {
+        'auth.group': {
+            'Meta': {'object_name': 'Group'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '80'}),
+            'permissions': ('django.db.models.fields.related.ManyToManyField', [], {'to': "orm['auth.Permission']", 'symmetrical': 'False', 'blank': 'True'})
+        },
+        'auth.permission': {
+            'Meta': {'ordering': "('content_type__app_label', 'content_type__model', 'codename')", 'unique_together': "(('content_type', 'codename'),)", 'object_name': 'Permission'},
+            'codename': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'content_type': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['contenttypes.ContentType']"}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '50'})
+        },
+        'auth.user': {
+            'Meta': {'object_name': 'User'},
+            'date_joined': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'}),
+            'email': ('django.db.models.fields.EmailField', [], {'max_length': '75', 'blank': 'True'}),
+            'first_name': ('django.db.models.fields.CharField', [], {'max_length': '30', 'blank': 'True'}),
+            'groups': ('django.db.models.fields.related.ManyToManyField', [], {'to': "orm['auth.Group']", 'symmetrical': 'False', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'is_active': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'is_staff': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'is_superuser': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'last_login': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'}),
+            'last_name': ('django.db.models.fields.CharField', [], {'max_length': '30', 'blank': 'True'}),
+            'password': ('django.db.models.fields.CharField', [], {'max_length': '128'}),
+            'user_permissions': ('django.db.models.fields.related.ManyToManyField', [], {'to': "orm['auth.Permission']", 'symmetrical': 'False', 'blank': 'True'}),
+            'username': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '30'})
+        },
+        'changes.change': {
+            'Meta': {'unique_together': "(('user', 'seq'),)", 'object_name': 'Change'},
+            'creation_date': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'db_index': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'object_id': ('django.db.models.fields.PositiveIntegerField', [], {}),
+            'object_type': ('django.db.models.fields.CharField', [], {'max_length': '10'}),
+            'operation': ('django.db.models.fields.CharField', [], {'max_length': '1'}),
+            'seq': ('django.db.models.fields.PositiveIntegerField', [], {}),
+            'user': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'changes'", 'to': "orm['auth.User']"})
+        },
+        'changes.changesequence': {
+            'Meta': {'object_name': 'ChangeSequence'},
+            'last_seq': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'pruned_seq': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'user': ('django.db.models.fields.related.OneToOneField', [], {'related_name': "'change_sequence'", 'unique': 'True', 'primary_key': 'True', 'to': "orm['auth.User']"})
+        },
+        'contenttypes.contenttype': {
+            'Meta': {'ordering': "('name',)", 'unique_together': "(('app_label', 'model'),)", 'object_name': 'ContentType', 'db_table': "'django_content_type'"},
+            'app_label': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'model': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '100'})
+        }
+    }
+
+    complete_apps = ['changes']
\ No newline at end of file
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+"""
+Contains the change log of the relations, quests and rewards.
+Every creation, update and deletion is recorded once per relation participant
+under a sequence number of the participant,
+so api clients fetch what changed since the last sequence number they have seen
+instead of downloading their whole data set again.
+Sequence numbers are taken from a counter row per user, which stays locked
+until the recording transaction ends, so the changes of a user become visible
+in the order of their sequence numbers and clients never skip one.
+Saves and deletions are recorded by signal handlers,
+bulk updates (which send no signals) record their changes explicitly.
+"""
+
+from collections import defaultdict
+from django.db import models, transaction
+from django.db.models import F, Max
+from django.db.models.signals import post_save, pre_delete, post_delete
+from django.contrib.auth.models import User
+from carrotwars.events import publish_events
+
+__author__ = "Eraldo Helal"
+
+#: (app label, model name) of the tracked models (model names equal their api resource names)
+TRACKED_MODELS = (('relations', 'relation'), ('quests', 'quest'), ('rewards', 'reward'))
+
+
+def is_tracked(model):
+    """Returns True if changes of the model are recorded."""
+    return (model._meta.app_label, model._meta.module_name) in TRACKED_MODELS
+
+
+def get_participants(instance):
+    """
+    Returns the ids of the users of the relation of a relation, quest or reward
+    (as remembered before the deletion for deleted instances).
+    """
+    participant_ids = getattr(instance, 'participant_ids', None)
+    if participant_ids is not None:
+        return participant_ids
+    relation = instance if instance._meta.module_name == 'relation' else instance.relation
+    return relation.owner_id, relation.quester_id
+
+
+class ChangeSequence(models.Model):
+    """
+    A django model holding the change sequence numbers of a user:
+    the last one handed out and the last one of the pruned changes.
+    """
+    user = models.OneToOneField(User, primary_key=True, related_name='change_sequence')
+    last_seq = models.PositiveIntegerField(default=0)
+    pruned_seq = models.PositiveIntegerField(default=0)
+
+    def __unicode__(self):
+        """Returns the unicode string representation of the sequence."""
+        return u'%s: %s' % (self.user_id, self.last_seq)
+
+
+class ChangeManager(models.Manager):
+    """
+    A custom django manager recording and querying changes.
+    """
+
+    def record(self, operation, instances, user_ids=None):
+        """
+        Records the provided operation on the provided relations, quests or rewards
+        for all their relation participants (or only those of them in user_ids)
+        with a single insert and wakes up the event streams of the participants
+        once the recording transaction committed.
+        """
+        participants = [(instance, user_id) for instance in instances for user_id in set(get_participants(instance))
+                        if user_ids is None or user_id in user_ids]
+        if not participants:
+            return
+        if transaction.is_managed():
+            self._record(operation, participants)
+        else:
+            with transaction.commit_on_success():
+                self._record(operation, participants)
+        publish_events(*[user_id for instance, user_id in participants])
+
+    def _record(self, operation, participants):
+        """
+        Inserts the changes of the provided (instance, user id) pairs.
+        The counters of the users are locked in the order of the user ids (avoiding deadlocks)
+        until the transaction ends.
+        """
+        counts = defaultdict(int)
+        for instance, user_id in participants:
+            counts[user_id] += 1
+        next_seqs = {}
+        for user_id in sorted(counts):
+            if not ChangeSequence.objects.filter(user=user_id).update(last_seq=F('last_seq') + counts[user_id]):
+                ChangeSequence.objects.create(user_id=user_id, last_seq=counts[user_id])
+            last_seq = ChangeSequence.objects.filter(user=user_id).values_list('last_seq', flat=True)[0]
+            next_seqs[user_id] = last_seq - counts[user_id] + 1
+        changes = []
+        for instance, user_id in participants:
+            changes.append(Change(user_id=user_id, seq=next_seqs[user_id], object_type=instance._meta.module_name,
+                                  object_id=instance.pk, operation=operation))
+            next_seqs[user_id] += 1
+        self.bulk_create(changes)
+
+    def since(self, user, seq):
+        """Returns the changes of the provided user after the provided sequence number in order."""
+        return super(ChangeManager, self).get_query_set().filter(user=user, seq__gt=seq).order_by('seq')
+
+    def last_seq(self, user):
+        """Returns the sequence number of the latest change of the provided user (or 0)."""
+        seqs = ChangeSequence.objects.filter(user=user).values_list('last_seq', flat=True)
+        return seqs[0] if seqs else 0
+
+    def is_pruned(self, user, seq):
+        """Returns True if changes of the provided user after the provided sequence number were pruned."""
+        return ChangeSequence.objects.filter(user=user, pruned_seq__gt=seq).exists()
+
+    def prune(self, before):
+        """
+        Deletes the changes recorded before the provided date and returns their number.
+        The pruned sequence numbers of the users are raised,
+        so clients that did not fetch these changes yet have to download their data again.
+        """
+        changes = super(ChangeManager, self).get_query_set().filter(creation_date__lt=before)
+        pruned = changes.values('user').annotate(seq=Max('seq')).values_list('user', 'seq')
+        for user_id, seq in pruned:
+            ChangeSequence.objects.filter(user=user_id, pruned_seq__lt=seq).update(pruned_seq=seq)
+        count = changes.count()
+        changes.delete()
+        return count
+
+
+class Change(models.Model):
+    """
+    A django model representing a change of a relation, quest or reward seen by a user.
+    """
+
+    user = models.ForeignKey(User, related_name='changes')
+    seq = models.PositiveIntegerField()
+    TYPES = (
+        ('relation', 'relation'),
+        ('quest', 'quest'),
+        ('reward', 'reward'),
+    )
+    object_type = models.CharField(max_length=10, choices=TYPES)
+    object_id = models.PositiveIntegerField()
+    OPERATIONS = (
+        ('C', 'created'),
+        ('U', 'updated'),
+        ('D', 'deleted'),
+    )
+    operation = models.CharField(max_length=1, choices=OPERATIONS)
+    creation_date = models.DateTimeField(auto_now_add=True, db_index=True)
+    objects = ChangeManager()
+
+    class Meta:
+        unique_together = ('user', 'seq')
+
+    def __unicode__(self):
+        """Returns the unicode string representation of the change."""
+        return u'%s: %s %s %s' % (self.seq, self.get_operation_display(), self.object_type, self.object_id)
+
+
+def record_saved(sender, instance, created, raw=False, **kwargs):
+    """Records the creation or update of a relation, quest or reward."""
+    if is_tracked(sender) and not raw:
+        Change.objects.record('C' if created else 'U', [instance])
+
+post_save.connect(record_saved)
+
+
+def remember_participants(sender, instance, **kwargs):
+    """
+    Remembers the relation participants of a relation, quest or reward about to be deleted,
+    as the relation of a quest or reward may be deleted along with it.
+    """
+    if is_tracked(sender):
+        instance.participant_ids = get_participants(instance)
+
+pre_delete.connect(remember_participants)
+
+
+def record_deleted(sender, instance, **kwargs):
+    """
+    Records the deletion of a relation, quest or reward
+    for the participants that still exist (deleted users take their changes with them).
+    """
+    if is_tracked(sender):
+        user_ids = set(User.objects.filter(pk__in=get_participants(instance)).values_list('pk', flat=True))
+        Change.objects.record('D', [instance], user_ids)
+
+post_delete.connect(record_deleted)
+
+
+def create_change_sequence(sender, instance, created, raw=False, **kwargs):
+    """Creates the change sequence of a new user."""
+    if created and not raw:
+        ChangeSequence.objects.create(user=instance)
+
+post_save.connect(create_change_sequence, sender=User)
@@ -0,0 +1,103 @@
+"""
+This file demonstrates writing tests using the unittest module. These will pass
+when you run "manage.py test".
+
+Replace this with more appropriate tests for your application.
+"""
+
+import base64
+import json
+from datetime import timedelta
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.contrib.auth.models import User
+from django.utils import timezone
+from relations.models import Relation
+from quests.models import Quest
+from changes.models import Change
+
+
+class ChangeLogTest(TestCase):
+    """
+    Tests the recording and the api of the change log.
+    """
+
+    def setUp(self):
+        """Creates a relation with a quest."""
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'secret')
+        self.quester = User.objects.create_user('quester', 'quester@example.com', 'secret')
+        self.relation = Relation.objects.create(owner=self.owner, quester=self.quester, status='A')
+        self.quest = Quest.objects.create(relation=self.relation, title="quest")
+
+    def get_changes(self, since=None, **headers):
+        """Returns the response to a changes request of the owner (without since if None)."""
+        data = {'format': 'json'}
+        if since is not None:
+            data['since'] = since
+        return self.client.get('/api/v1/changes/', data,
+                               HTTP_AUTHORIZATION='Basic %s' % base64.b64encode('owner:secret'), **headers)
+
+    def test_record(self):
+        """Tests that saves, bulk updates and deletions are recorded for both participants."""
+        seq = Change.objects.last_seq(self.owner)
+        quest_id = self.quest.pk
+        Relation.objects.credit(self.relation.pk, 2, 'Q')
+        self.quest.delete()
+        for user in (self.owner, self.quester):
+            self.assertEqual(list(Change.objects.since(user, 0).values_list('object_type', 'operation')),
+                             [('relation', 'C'), ('quest', 'C'), ('relation', 'U'), ('quest', 'D')])
+        self.assertEqual([change.object_id for change in Change.objects.since(self.owner, seq)],
+                         [self.relation.pk, quest_id])
+
+    def test_sequence(self):
+        """Tests that every user numbers its changes without gaps."""
+        Quest.objects.create(relation=Relation.objects.create(owner=self.quester, quester=self.owner), title="other")
+        for user in (self.owner, self.quester):
+            self.assertEqual(list(Change.objects.since(user, 0).values_list('seq', flat=True)), [1, 2, 3, 4])
+            self.assertEqual(Change.objects.last_seq(user), 4)
+
+    def test_api(self):
+        """Tests that the api returns the changes after the provided sequence number only."""
+        data = json.loads(self.get_changes(0).content)
+        self.assertEqual([(change['object_type'], change['operation']) for change in data['objects']],
+                         [('relation', 'C'), ('quest', 'C')])
+        self.assertEqual(data['objects'][1]['object_uri'], '/api/v1/quest/%s/' % self.quest.pk)
+        last_seq = data['meta']['last_seq']
+        self.assertEqual(json.loads(self.get_changes(last_seq).content)['objects'], [])
+        self.quest.title = "renamed"
+        self.quest.save()
+        data = json.loads(self.get_changes(last_seq).content)
+        self.assertEqual([change['object_id'] for change in data['objects']], [self.quest.pk])
+
+    @override_settings(CACHE_IS_SHARED=True)
+    def test_repoll(self):
+        """Tests that a change after a poll is delivered by a repoll with the ETag of that poll."""
+        response = self.get_changes(0)
+        last_seq = json.loads(response.content)['meta']['last_seq']
+        self.quest.title = "renamed"
+        self.quest.save()
+        response = self.get_changes(last_seq, HTTP_IF_NONE_MATCH=response.get('ETag', '*'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([change['object_id'] for change in json.loads(response.content)['objects']], [self.quest.pk])
+
+    def test_pruned(self):
+        """Tests that clients are told to download their data again after their changes were pruned."""
+        Change.objects.update(creation_date=timezone.now() - timedelta(days=40))
+        Quest.objects.create(relation=self.relation, title="new")
+        self.assertEqual(Change.objects.prune(before=timezone.now() - timedelta(days=30)), 4)
+        self.assertEqual(self.get_changes(0).status_code, 410)
+        self.assertEqual(json.loads(self.get_changes().content)['meta']['last_seq'], 3)
+        self.assertEqual(len(json.loads(self.get_changes(2).content)['objects']), 1)
+
+    def test_cascade(self):
+        """Tests that deleting a relation or a user records the deletions of the quests deleted with it."""
+        quest_id = self.quest.pk
+        Relation.objects.get(pk=self.relation.pk).delete()
+        self.assertEqual(list(Change.objects.since(self.quester, 0).values_list('object_type', 'object_id', 'operation'))[-2:],
+                         [('quest', quest_id, 'D'), ('relation', self.relation.pk, 'D')])
+        relation = Relation.objects.create(owner=self.owner, quester=self.quester, status='A')
+        quest = Quest.objects.create(relation=relation, title="quest")
+        User.objects.get(pk=self.owner.pk).delete()
+        self.assertFalse(Change.objects.filter(user=self.owner.pk).exists())
+        self.assertEqual(list(Change.objects.since(self.quester, 0).values_list('object_type', 'object_id', 'operation'))[-2:],
+                         [('quest', quest.pk, 'D'), ('relation', relation.pk, 'D')])
@@ -0,0 +1,17 @@
+#!/usr/bin/env python
+"""
+Contains the django admin interface settings related to the notification model.
+"""
+
+from django.contrib import admin
+from notifications.models import Notification
+
+__author__ = "Eraldo Helal"
+
+
+class NotificationAdmin(admin.ModelAdmin):
+    """Meta information model to display the notification outbox."""
+    list_display = ('subject', 'sender', 'recipient', 'status', 'creation_date', 'delivery_date')
+    list_filter = ('status',)
+
+admin.site.register(Notification, NotificationAdmin)
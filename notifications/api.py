@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+"""
+This module provides the notification API for the other applications in the project.
+It replaces direct postman.api.pm_write calls: notifications are only queued
+(inside the caller's transaction) and delivered later by the sendnotifications worker.
+Single notifications are delivered on the next pass of the worker.
+Notifications of one bulk event (e.g. a sweep run) share a digest key
+and are coalesced into a single digest message per recipient,
+delivered NOTIFICATION_DIGEST_WINDOW seconds after they were queued
+(so later chunks of the same run join the digest).
+"""
+
+from datetime import timedelta
+from uuid import uuid4
+from django.conf import settings
+from django.utils import timezone
+from notifications.models import Notification
+
+__author__ = "Eraldo Helal"
+
+DIGEST_WINDOW = getattr(settings, 'NOTIFICATION_DIGEST_WINDOW', 60)
+
+
+def new_digest(name):
+    """
+    Returns a new digest key for notifications of a single bulk event (e.g. a sweep run).
+    """
+    return "%s-%s" % (name, uuid4().hex[:16])
+
+
+def notify(sender, recipient, subject, body='', carrots=0):
+    """
+    Queues a notification message from the sender to the recipient
+    for delivery on the next pass of the worker.
+    Returns the queued notification.
+    """
+    return Notification.objects.create(sender=sender, recipient=recipient, subject=subject, body=body,
+                                       carrots=carrots)
+
+
+def notify_many(notifications, digest=None):
+    """
+    Queues several unsaved notifications with a single bulk insert.
+    Notifications queued under a digest key (see new_digest) are coalesced
+    into one digest message per recipient, the others are delivered one by one
+    on the next pass of the worker.
+    """
+    if digest is not None:
+        deliver_after = timezone.now() + timedelta(seconds=DIGEST_WINDOW)
+        for notification in notifications:
+            notification.digest = digest
+            notification.deliver_after = deliver_after
+    Notification.objects.bulk_create(notifications)
@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+"""
+Contains the unread message count related cron job settings.
+This module manages the reconciliation of the cached unread message counts
+by using time based triggering.
+"""
+
+from django_cron import CronJobBase, Schedule
+from carrotwars.unread import reconcile_unread_counts
+
+__author__ = "Eraldo Helal"
+
+
+class ReconcileUnreadCountsCronJob(CronJobBase):
+    """
+    Triggers reconciling the cached unread message counts every hour.
+    Counts that missed a change (e.g. messages changed outside of postman views)
+    are correct again after the next run.
+    """
+    RUN_EVERY_MINS = 60
+
+    schedule = Schedule(run_every_mins=RUN_EVERY_MINS)
+    code = 'notifications.reconcile_unread_counts'    # a unique code
+
+    def do(self):
+        """
+        Sets the cached unread message counts of all users.
+        Returns a summary message that is stored in the cron job log.
+        """
+        users = reconcile_unread_counts()
+        return "Reconciled unread message counts (%s users with unread messages)." % users
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""
+Contains the management command delivering the queued notifications.
+"""
+
+import time
+from optparse import make_option
+from multiprocessing.pool import ThreadPool
+from django.core.management.base import BaseCommand
+from django.db import connection
+from notifications.models import Notification
+from carrotwars.events import flush_events
+from carrotwars.unread import flush_unread_counts
+
+__author__ = "Eraldo Helal"
+
+
+def deliver_batch(pks):
+    """
+    Delivers a batch of notifications from a worker thread.
+    Returns the number of delivered notifications.
+    """
+    try:
+        return Notification.objects.deliver(pks)
+    finally:
+        flush_unread_counts() # count the delivered messages
+        flush_events() # wake up the event streams of the recipients
+        connection.close() # every thread has its own connection
+
+
+def get_batches(due, batch_size):
+    """
+    Splits the due (primary key, recipient) pairs into lists of primary keys.
+    A batch only ends between recipients (it may exceed the batch size for that),
+    so all notifications of one recipient are coalesced by the same worker.
+    Returns a list of primary key lists.
+    """
+    batches = [[]]
+    last_recipient = None
+    for pk, recipient in due:
+        if len(batches[-1]) >= batch_size and recipient != last_recipient:
+            batches.append([])
+        batches[-1].append(pk)
+        last_recipient = recipient
+    return batches
+
+
+class Command(BaseCommand):
+    """
+    Drains the notification outbox until interrupted (or once).
+    Due notifications are split into batches that are delivered in parallel
+    by a pool of worker threads, so a slow messaging path only delays the outbox
+    and never the requests that queued the notifications.
+    """
+    help = "Delivers queued notifications as postman messages."
+    option_list = BaseCommand.option_list + (
+        make_option('--interval', type='int', default=5,
+            help="Seconds to wait when the outbox is empty. (default: 5)"),
+        make_option('--batch-size', type='int', default=100,
+            help="Number of notifications delivered per batch. (default: 100)"),
+        make_option('--threads', type='int', default=4,
+            help="Number of worker threads. (default: 4)"),
+        make_option('--once', action='store_true', default=False,
+            help="Drain the outbox once and exit."),
+    )
+
+    def handle(self, *args, **options):
+        """Delivers pending notifications in batches until interrupted."""
+        batch_size = options['batch_size']
+        pool = ThreadPool(options['threads'])
+        try:
+            while True:
+                limit = batch_size * options['threads']
+                due = list(Notification.objects.due().order_by('recipient', 'pk')
+                           .values_list('pk', 'recipient')[:limit])
+                connection.close()
+                if len(due) == limit:
+                    # the last recipient may have more due notifications: leave them for the next round
+                    due = [item for item in due if item[1] != due[-1][1]] or due
+                if due:
+                    sent = sum(pool.map(deliver_batch, get_batches(due, batch_size)))
+                    self.stdout.write("Delivered %s notifications.\n" % sent)
+                elif options['once']:
+                    break
+                else:
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            pool.close()
+            pool.join()
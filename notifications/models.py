@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+"""
+Contains the notification outbox model.
+Notifications are queued inside the transaction of the state change they report
+and are delivered as postman messages by the sendnotifications worker.
+Pending notifications sharing a digest key are coalesced into one digest message
+per recipient.
+"""
+
+from itertools import groupby
+from django.db import models, transaction
+from django.db.models import Q
+from django.contrib.auth.models import User
+from django.utils import timezone
+from postman.models import Message, STATUS_PENDING, STATUS_ACCEPTED
+from carrotwars.unread import increment_unread_counts
+
+__author__ = "Eraldo Helal"
+
+
+class NotificationManager(models.Manager):
+    """
+    A django model manager to queue and deliver notifications.
+    """
+
+    def pending(self):
+        """Returns a query set of the notifications that have not been delivered yet."""
+        return super(NotificationManager, self).get_query_set().filter(status='P')
+
+    def due(self, now=None):
+        """
+        Returns a query set of the pending notifications
+        whose digest window (if any) has closed (at the provided time).
+        """
+        return self.pending().filter(Q(deliver_after__isnull=True) | Q(deliver_after__lte=now or timezone.now()))
+
+    @transaction.commit_on_success
+    def deliver(self, pks):
+        """
+        Delivers the pending notifications among the provided primary keys
+        as postman messages created with a single bulk insert.
+        Locked rows keep concurrent workers from delivering a notification twice.
+        Returns the number of delivered notifications.
+        """
+        notifications = list(self.pending().filter(pk__in=pks).select_for_update()
+                             .select_related('sender', 'recipient').order_by('pk'))
+        if not notifications:
+            return 0
+        now = timezone.now()
+        self.pending().filter(pk__in=[notification.pk for notification in notifications]).update(status='S', delivery_date=now)
+        messages = [self.digest_message(list(group), now) for key, group in
+                    groupby(sorted(notifications, key=Notification.get_digest_key), Notification.get_digest_key)]
+        Message.objects.bulk_create(messages)
+        for message in messages:
+            message.notify_users(STATUS_PENDING)
+        increment_unread_counts(*[message.recipient_id for message in messages]) # bulk inserts send no signals
+        return len(notifications)
+
+    def digest_message(self, notifications, now):
+        """
+        Returns an unsaved postman message carrying the provided notifications
+        of one recipient (sent by the sender of the first one).
+        Several notifications are listed in one digest message
+        that also sums up the deducted carrots.
+        Each entry keeps the body of its notification (e.g. the link to a new quest)
+        and names its sender if the notifications have several senders.
+        """
+        if len(notifications) == 1:
+            return notifications[0].to_message(now)
+        subject = "%s notifications" % len(notifications)
+        carrots = sum(notification.carrots for notification in notifications)
+        if carrots:
+            subject += ": %s carrot%s deducted." % (carrots, "s"[carrots==1:])
+        several_senders = len(set(notification.sender_id for notification in notifications)) > 1
+        body = "\n".join(" ".join(part for part in ("-", notification.subject, notification.body,
+                                                    several_senders and "(%s)" % notification.sender) if part)
+                         for notification in notifications)
+        digest = Notification(sender=notifications[0].sender, recipient=notifications[0].recipient,
+                              subject=subject, body=body, creation_date=notifications[-1].creation_date)
+        return digest.to_message(now)
+
+
+class Notification(models.Model):
+    """
+    A django model representing a queued notification from one user to another.
+    """
+    sender = models.ForeignKey(User, related_name='sent_notifications')
+    recipient = models.ForeignKey(User, related_name='notifications')
+    subject = models.CharField(max_length=120)
+    body = models.TextField(blank=True)
+    creation_date = models.DateTimeField(auto_now_add=True)
+    delivery_date = models.DateTimeField(blank=True, null=True)
+    STATUS = (
+        ('P', 'pending'),
+        ('S', 'sent'),
+    )
+    status = models.CharField(default='P', max_length=1, choices=STATUS, db_index=True)
+    #: carrots deducted by the reported event (summed up in digests)
+    carrots = models.PositiveIntegerField(default=0)
+    #: notifications with the same digest key and recipient are delivered as one digest
+    digest = models.CharField(max_length=40, blank=True)
+    #: end of the digest window, the notification is not delivered before
+    deliver_after = models.DateTimeField(blank=True, null=True)
+    # a composite index on (status, deliver_after) is added by south migration 0002
+    objects = NotificationManager() # custom django notification manager
+
+    def __unicode__(self):
+        """Returns the unicode string representation of the notification."""
+        return "%s -> %s: %s" % (self.sender, self.recipient, self.subject)
+
+    def get_digest_key(self):
+        """
+        Returns the key grouping this notification with others into one digest.
+        Notifications without digest key are never coalesced.
+        """
+        return (self.recipient_id, self.digest or self.pk)
+
+    def to_message(self, now):
+        """
+        Returns an unsaved postman message carrying this notification.
+        The message is dated with the creation of the notification.
+        """
+        return Message(sender=self.sender, recipient=self.recipient,
+            subject=self.subject, body=self.body, sent_at=self.creation_date,
+            moderation_status=STATUS_ACCEPTED, moderation_date=now)
+
@@ -0,0 +1,114 @@
+"""
+This file demonstrates writing tests using the unittest module. These will pass
+when you run "manage.py test".
+
+Replace this with more appropriate tests for your application.
+"""
+
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.core.cache import cache
+from django.contrib.auth.models import User
+from postman.models import Message
+from notifications.api import notify, notify_many, new_digest
+from notifications.models import Notification
+from carrotwars.unread import get_unread_count, get_unread_cache_timeout, flush_unread_counts, reconcile_unread_counts, \
+    UNREAD_CACHE_TIMEOUT, UNREAD_LOCAL_CACHE_TIMEOUT
+
+
+class OutboxTest(TestCase):
+    """
+    Tests the queuing, coalescing and delivery of notifications.
+    """
+
+    def setUp(self):
+        """Creates two users and queues some notifications between them in one digest."""
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'secret')
+        self.quester = User.objects.create_user('quester', 'quester@example.com', 'secret')
+        notify_many([Notification(sender=self.owner, recipient=self.quester, subject="Quest %s" % i, carrots=i)
+                     for i in range(3)], new_digest('sweep'))
+        self.deliver_after = Notification.objects.latest('pk').deliver_after
+
+    def test_queue(self):
+        """Tests that digest notifications are queued until their digest window closes."""
+        self.assertEqual(Notification.objects.pending().count(), 3)
+        self.assertEqual(Message.objects.count(), 0)
+        self.assertEqual(Notification.objects.due().count(), 0)
+        self.assertEqual(Notification.objects.due(self.deliver_after).count(), 3)
+
+    def test_notify(self):
+        """Tests that single notifications are due at once and never coalesced."""
+        notify(sender=self.owner, recipient=self.quester, subject="Quest 3")
+        notify(sender=self.owner, recipient=self.quester, subject="Quest 4")
+        self.assertEqual(Notification.objects.due().count(), 2)
+        self.assertEqual(Notification.objects.deliver(Notification.objects.due().values_list('pk', flat=True)), 2)
+        self.assertEqual(Message.objects.count(), 2)
+
+    def test_deliver(self):
+        """Tests that pending notifications are delivered exactly once."""
+        pks = list(Notification.objects.values_list('pk', flat=True))
+        Notification.objects.filter(pk=pks[2]).update(digest='')
+        self.assertEqual(Notification.objects.deliver(pks[1:]), 2)
+        self.assertEqual(Notification.objects.deliver(pks), 1)
+        self.assertEqual(Notification.objects.deliver(pks), 0)
+        self.assertEqual(Notification.objects.pending().count(), 0)
+        self.assertEqual(sorted(Message.objects.values_list('subject', flat=True)),
+                         ["Quest 0", "Quest 1", "Quest 2"])
+
+    def test_digest(self):
+        """Tests that notifications of one digest are delivered as one digest message keeping their bodies."""
+        Notification.objects.filter(subject="Quest 1").update(body='<a href="/quests/1/">Quest 1</a>')
+        self.assertEqual(Notification.objects.deliver(Notification.objects.values_list('pk', flat=True)), 3)
+        message = Message.objects.get()
+        self.assertEqual(message.subject, "3 notifications: 3 carrots deducted.")
+        self.assertEqual(message.body, '- Quest 0\n- Quest 1 <a href="/quests/1/">Quest 1</a>\n- Quest 2')
+        self.assertEqual(message.recipient, self.quester)
+
+
+    def test_senders(self):
+        """Tests that the notifications of one digest from several senders are delivered as one message."""
+        other = User.objects.create_user('other', 'other@example.com', 'secret')
+        Notification.objects.filter(subject="Quest 2").update(sender=other)
+        self.assertEqual(Notification.objects.deliver(Notification.objects.values_list('pk', flat=True)), 3)
+        message = Message.objects.get()
+        self.assertEqual(message.body, '- Quest 0 (owner)\n- Quest 1 (owner)\n- Quest 2 (other)')
+
+
+class UnreadCountTest(TestCase):
+    """
+    Tests the cached unread message counts.
+    """
+
+    def setUp(self):
+        """Creates two users and delivers a message between them."""
+        flush_unread_counts() # counts changed by other tests
+        cache.clear()
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'secret')
+        self.quester = User.objects.create_user('quester', 'quester@example.com', 'secret')
+        self.assertEqual(get_unread_count(self.quester), 0)
+        notify(sender=self.owner, recipient=self.quester, subject="Quest")
+        Notification.objects.deliver(Notification.objects.values_list('pk', flat=True))
+        flush_unread_counts()
+        self.message = Message.objects.get()
+
+    def test_deliver(self):
+        """Tests that delivered messages increment the cached count."""
+        with self.assertNumQueries(0):
+            self.assertEqual(get_unread_count(self.quester), 1)
+
+    def test_read(self):
+        """Tests that reading a message resets the count and pages show the cached count."""
+        self.client.login(username='quester', password='secret')
+        self.client.get('/messages/view/%s/' % self.message.pk)
+        self.assertEqual(get_unread_count(self.quester), 0)
+        Message.objects.filter(pk=self.message.pk).update(read_at=None) # missed by the cache
+        self.assertEqual(self.client.get('/messages/inbox/').context['unread_count'], 0)
+        self.assertEqual(reconcile_unread_counts(), 1)
+        self.assertEqual(self.client.get('/messages/inbox/').context['unread_count'], 1)
+
+    def test_timeout(self):
+        """Tests that counts are cached for minutes only without a cache shared by all processes."""
+        with override_settings(CACHE_IS_SHARED=True):
+            self.assertEqual(get_unread_cache_timeout(), UNREAD_CACHE_TIMEOUT)
+        with override_settings(CACHE_IS_SHARED=None): # local memory cache of the test settings
+            self.assertEqual(get_unread_cache_timeout(), min(UNREAD_CACHE_TIMEOUT, UNREAD_LOCAL_CACHE_TIMEOUT))
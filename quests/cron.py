@@ -18,6 +18,8 @@ class UpdateQuestStatusCronJob(CronJobBase):
     If this command is called multiple times a day, only the first call will evoce
     quest status updates and all following calls will be ignored.
     This means calling it every hour will also just work fine.
+    Deployments running 'python manage.py runscheduler' fail quests continuously
+    and only need this job as a safety net.
     """
     RUN_AT_TIMES = ['00:00']
 
@@ -25,7 +27,10 @@ class UpdateQuestStatusCronJob(CronJobBase):
     code = 'quests.update_quest_status'    # a unique code
 
     def do(self):
-        """Updates the status of all quests."""
-        # print("updating quest status")
-        Quest.objects.update_status()    
+        """
+        Fails all overdue quests.
+        Returns a summary message that is stored in the cron job log.
+        """
+        counts = Quest.objects.update_status()
+        return "Failed %(quests)s quests. Deducted %(carrots)s carrots from %(relations)s relations." % counts
 
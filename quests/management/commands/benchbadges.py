@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+"""
+Contains the management command benchmarking the html badge renderers.
+"""
+
+import random
+import time
+from datetime import timedelta
+from optparse import make_option
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from carrotwars import badges
+
+__author__ = "Eraldo Helal"
+
+
+class Command(BaseCommand):
+    """
+    Renders the rating, balance, price and deadline badges of generated rows
+    once without memoization (a clock read per deadline, as before)
+    and once memoized with a single today,
+    and prints the average time per row of both.
+    """
+    help = "Compares the per-row cost of rendering badges with and without memoization."
+    option_list = BaseCommand.option_list + (
+        make_option('--rows', type='int', default=10000,
+            help="Number of rendered rows. (default: 10000)"),
+    )
+
+    def handle(self, *args, **options):
+        """Times both render variants over the same generated rows."""
+        now = timezone.now()
+        rows = [(random.randint(1, 5), random.random() < 0.2, random.randint(0, 30),
+                 random.randint(0, 100), now + timedelta(days=random.randint(-10, 10)))
+                for i in range(options['rows'])]
+
+        def render_uncached():
+            for rating, bomb, balance, price, deadline in rows:
+                badges.rating_html.build(rating, bomb)
+                badges.balance_html.build(balance)
+                badges.price_html.build(price)
+                days_left = (deadline.date() - badges.get_today()).days
+                badges._deadline_html.build(deadline.date(), days_left, 1)
+
+        def render_memoized():
+            today = badges.get_today()
+            for rating, bomb, balance, price, deadline in rows:
+                badges.rating_html(rating, bomb)
+                badges.balance_html(balance)
+                badges.price_html(price)
+                badges.deadline_html(deadline, today)
+
+        badges.clear_badges()
+        for name, render in (("uncached", render_uncached), ("memoized", render_memoized)):
+            start = time.time()
+            render()
+            elapsed = time.time() - start
+            self.stdout.write("%s: %.1f ms total, %.2f us per row\n" % (
+                name, elapsed * 1000, elapsed * 1000000 / len(rows)))
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+"""
+Contains the management command benchmarking the custom manager queries.
+"""
+
+import time
+from optparse import make_option
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+from django.db import connection
+from relations.models import Relation
+from quests.models import Quest
+from rewards.models import Reward
+
+__author__ = "Eraldo Helal"
+
+
+class Command(BaseCommand):
+    """
+    Prints the query plan and the average execution time of every
+    quest, relation and reward manager query for a given user.
+    Run it before and after 'python manage.py migrate' to compare
+    the plans with and without the composite indexes.
+    """
+    args = '<username>'
+    help = "Shows the query plans and timings of the quest, relation and reward manager queries."
+    option_list = BaseCommand.option_list + (
+        make_option('--repeat', type='int', default=20,
+            help="Number of timed executions per query. (default: 20)"),
+    )
+
+    def handle(self, *args, **options):
+        """Explains and times each manager query."""
+        if len(args) != 1:
+            raise CommandError("Usage: explainqueries %s" % self.args)
+        try:
+            user = User.objects.get(username=args[0])
+        except User.DoesNotExist:
+            raise CommandError("User '%s' does not exist." % args[0])
+        queries = []
+        for manager in (Quest.objects, Relation.objects, Reward.objects):
+            model = manager.model.__name__
+            for name in ('owned_by', 'assigned_to', 'proposed_by', 'pending_for', 'completed_for', 'waiting_for'):
+                if hasattr(manager, name):
+                    queries.append(("%s.%s" % (model, name), getattr(manager, name)(user)))
+        queries.append(("Quest.overdue", Quest.objects.overdue()))
+        for name, queryset in queries:
+            self.explain(name, queryset, options['repeat'])
+
+    def explain(self, name, queryset, repeat):
+        """Prints the query plan and average execution time of the provided queryset."""
+        sql, params = queryset.query.sql_with_params()
+        if connection.vendor == 'sqlite':
+            prefix = "EXPLAIN QUERY PLAN "
+        else:
+            prefix = "EXPLAIN "
+        cursor = connection.cursor()
+        cursor.execute(prefix + sql, params)
+        self.stdout.write("%s\n" % name)
+        for row in cursor.fetchall():
+            self.stdout.write("    %s\n" % " ".join(unicode(column) for column in row))
+        start = time.time()
+        for i in range(repeat):
+            cursor.execute(sql, params)
+            cursor.fetchall()
+        self.stdout.write("    %.3f ms\n\n" % ((time.time() - start) * 1000 / max(repeat, 1)))
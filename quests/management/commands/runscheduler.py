@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+"""
+Contains the management command running the quest deadline scheduler.
+"""
+
+import time
+from optparse import make_option
+from django.core.management.base import BaseCommand
+from django.db import connection
+from quests.models import Quest
+from quests.scheduler import DeadlineScheduler
+
+__author__ = "Eraldo Helal"
+
+
+class Command(BaseCommand):
+    """
+    Runs the deadline scheduler until interrupted.
+    Every interval seconds newly activated quests are scheduled and due quests are failed.
+    Failing at most batch size quests per run spreads bursts of expiring quests
+    over several runs instead of one load spike.
+    A full overdue sweep runs every sweep interval to catch quests
+    that became active again after their deadline (e.g. denied completions).
+    """
+    help = "Continuously fails overdue quests shortly after their deadline."
+    option_list = BaseCommand.option_list + (
+        make_option('--interval', type='int', default=60,
+            help="Seconds between scheduler runs. (default: 60)"),
+        make_option('--sweep-interval', type='int', default=3600,
+            help="Seconds between full overdue sweeps. (default: 3600)"),
+        make_option('--batch-size', type='int', default=500,
+            help="Maximum number of quests failed per run. (default: 500)"),
+    )
+
+    def handle(self, *args, **options):
+        """Loads the scheduler and processes due quests until interrupted."""
+        scheduler = DeadlineScheduler(batch_size=options['batch_size'])
+        self.stdout.write("Scheduled %s active quests.\n" % scheduler.load())
+        last_sweep = time.time()
+        try:
+            while True:
+                scheduler.refresh()
+                counts = scheduler.run_pending()
+                if time.time() - last_sweep >= options['sweep_interval']:
+                    for key, value in Quest.objects.update_status().items():
+                        counts[key] += value
+                    last_sweep = time.time()
+                if counts['quests']:
+                    self.stdout.write("Failed %(quests)s quests. Deducted %(carrots)s carrots from %(relations)s relations.\n" % counts)
+                # do not keep a connection (and its snapshot) open while sleeping
+                connection.close()
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
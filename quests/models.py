@@ -3,14 +3,19 @@
 Contains the quest model and a quest manager.
 """
 
-from django.db import models
-from relations.models import Relation
+from django.db import models, transaction
+from django.db.models import Q
+from relations.models import Relation, InsufficientBalance
 from django.core.urlresolvers import reverse
-from django.conf import settings
 from django.utils import timezone
-from datetime import datetime, timedelta
-from django.utils.safestring import mark_safe
-from postman.api import pm_write
+from datetime import datetime, time, timedelta
+from carrotwars import badges
+from carrotwars.tablecache import bump_table_versions, flush_table_versions
+from django.db.models.signals import post_save, pre_delete, post_delete
+from notifications.api import notify_many, new_digest
+from notifications.models import Notification
+from changes.models import Change
+from carrotwars.events import flush_events
 
 __author__ = "Eraldo Helal"
 
@@ -42,12 +47,110 @@ class QuestManager(models.Manager):
         """Returns the set of quests the provided user is waiting for."""
         return super(QuestManager, self).get_query_set().filter(relation__quester=user).filter(status='M')
 
-    def update_status(self):
-        """Checks all quests to see if they are overdue and fails them if so."""
-        quests = super(QuestManager, self).get_query_set()
+    def dashboard_for(self, user):
+        """
+        Returns a dictionary of the quest sets shown on the quest dashboard
+        of the provided user (owned, assigned, proposed, pending, completed and waiting).
+        All quests are fetched with a single query including their relation users.
+        """
+        dashboard = dict((name, []) for name in ('owned', 'assigned', 'proposed', 'pending', 'completed', 'waiting'))
+        quests = super(QuestManager, self).get_query_set().filter(
+            Q(relation__owner=user) | Q(relation__quester=user), status__in=('C', 'A', 'M')
+            ).select_related('relation__owner', 'relation__quester').order_by('pk')
         for quest in quests:
-            if quest.status == 'A' and quest.is_overdue():
-                quest.fail()
+            if quest.relation.owner_id == user.pk:
+                dashboard[{'A': 'owned', 'C': 'proposed', 'M': 'completed'}[quest.status]].append(quest)
+            if quest.relation.quester_id == user.pk:
+                dashboard[{'A': 'assigned', 'C': 'pending', 'M': 'waiting'}[quest.status]].append(quest)
+        return dashboard
+
+    def overdue(self, now=None):
+        """Returns the set of active quests whose deadline day has passed (at the provided time)."""
+        today = (now or timezone.now()).date()
+        start_of_today = datetime.combine(today, time()).replace(tzinfo=timezone.utc)
+        return super(QuestManager, self).get_query_set().filter(status='A', deadline__lt=start_of_today)
+
+    def update_status(self, chunk_size=500):
+        """
+        Fails all overdue quests in chunks using bulk updates,
+        deducts the carrots of failed bomb quests per relation
+        and informs owners and questers.
+        Returns a dictionary containing the number of failed quests,
+        charged relations and lost carrots.
+        """
+        counts = {'quests': 0, 'relations': 0, 'carrots': 0}
+        digest = new_digest('sweep') # one digest per recipient for the whole run
+        last_pk = 0
+        while True:
+            chunk = list(self.overdue().filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:chunk_size])
+            if not chunk:
+                break
+            last_pk = chunk[-1]
+            for key, value in self.fail_overdue(chunk, digest=digest).items():
+                counts[key] += value
+        return counts
+
+    def fail_overdue(self, pks, now=None, digest=None):
+        """
+        Fails the quests among the provided primary keys that are overdue
+        (at the provided time) and informs owners and questers.
+        The notifications are coalesced under the provided digest key
+        (default: a new digest for this call).
+        Returns a dictionary containing the number of failed quests,
+        charged relations and lost carrots.
+        """
+        failed, deductions = self._fail_chunk(pks, now, digest or new_digest('sweep'))
+        flush_table_versions()
+        flush_events()
+        return {
+            'quests': len(failed),
+            'relations': len(set(quest.relation_id for quest in failed if deductions[quest.pk])),
+            'carrots': sum(deductions.values()),
+            }
+
+    @transaction.commit_on_success
+    def _fail_chunk(self, pks, now, digest):
+        """
+        Fails the still active quests of the provided primary keys with a single update,
+        deducts the bomb carrots with one update per relation
+        and queues the failure notifications under the digest key with a single insert.
+        Returns the list of failed quests and a dictionary mapping quest ids to deductions.
+        """
+        quests = list(self.overdue(now).filter(pk__in=pks).select_for_update()
+                      .select_related('relation__owner', 'relation__quester').order_by('pk'))
+        if not quests:
+            return [], {}
+        super(QuestManager, self).get_query_set().filter(pk__in=[quest.pk for quest in quests]).update(
+            status='F', modification_date=timezone.now())
+        # deduct carrots in quest order as long as the relation balance allows it
+        balances = {}
+        charges = {} # relation id -> {quest id: carrots}
+        deductions = {}
+        for quest in quests:
+            quest.status = 'F'
+            deductions[quest.pk] = 0
+            if quest.bomb:
+                balance = balances.setdefault(quest.relation_id, quest.relation.balance)
+                if balance >= quest.rating:
+                    balances[quest.relation_id] = balance - quest.rating
+                    charges.setdefault(quest.relation_id, {})[quest.pk] = quest.rating
+                    deductions[quest.pk] = quest.rating
+        for relation_id, amounts in charges.items():
+            try:
+                Relation.objects.debit_many(relation_id, 'B', amounts)
+            except InsufficientBalance:
+                # the balance changed concurrently: charge quest by quest as far as it still allows
+                for quest_id, carrots in sorted(amounts.items()):
+                    try:
+                        Relation.objects.debit(relation_id, carrots, 'B', quest_id)
+                    except InsufficientBalance:
+                        deductions[quest_id] = 0
+        notify_many([notification for quest in quests
+                     for notification in quest.get_failed_notifications(deductions[quest.pk])], digest)
+        Change.objects.record('U', quests)
+        bump_table_versions(*[user_id for quest in quests
+                              for user_id in (quest.relation.owner_id, quest.relation.quester_id)])
+        return quests, deductions
 
     
 class Quest(models.Model):
@@ -59,6 +162,7 @@ class Quest(models.Model):
     title = models.CharField(max_length=60)
     description = models.TextField(blank=True)
     creation_date = models.DateTimeField(auto_now_add=True)
+    modification_date = models.DateTimeField(auto_now=True)
     activation_date = models.DateTimeField(blank=True, null=True)
     deadline = models.DateTimeField(blank=True, null=True)
     RATINGS = (
@@ -81,6 +185,8 @@ class Quest(models.Model):
         ('X', 'deleted'),
     )
     status = models.CharField(default='C', max_length=1, choices=STATUS)
+    # composite indexes on (relation, status) and (status, deadline) are added by south migration 0004
+    # a composite index on (creation_date, id) for api cursors is added by south migration 0006
     objects = QuestManager() # custom django quest manager
 
     def __unicode__(self):
@@ -109,6 +215,15 @@ class Quest(models.Model):
         self.activation_date = timezone.now()
         self.deadline = timezone.now()+timedelta(days=7)
 
+    def get_expiry(self):
+        """
+        Returns the moment the quest becomes overdue
+        (the start of the day after the deadline) or None if it has no deadline.
+        """
+        if not self.deadline:
+            return None
+        return datetime.combine(self.deadline.date() + timedelta(days=1), time()).replace(tzinfo=timezone.utc)
+
     def is_overdue(self):
         """
         Checks if the quest is overdue.
@@ -130,53 +245,54 @@ class Quest(models.Model):
         """
 
         deduction = 0
+        with transaction.commit_on_success():
+            if not Quest.objects.filter(pk=self.pk, status=self.status).update(status='F', modification_date=timezone.now()):
+                return # the quest has been changed in the meantime
+            self.status = 'F'
+            if self.bomb:
+                try:
+                    Relation.objects.debit(self.relation_id, self.rating, 'B', self.pk)
+                    deduction = self.rating
+                except InsufficientBalance:
+                    pass
+            notify_many(self.get_failed_notifications(deduction))
+            Change.objects.record('U', [self])
+        bump_table_versions(self.relation.owner_id, self.relation.quester_id)
+
+    def get_failed_notifications(self, deduction):
+        """
+        Returns the unsaved notifications informing owner and quester
+        that the quest has failed and how many carrots have been deducted.
+        """
         loss_message = ""
-        if self.bomb:
-            if self.relation.balance >= self.rating:
-                self.relation.balance -= self.rating
-                self.relation.save()
-                deduction = self.rating
-                loss_message = "You lost %s carrot%s." % (deduction, "s"[deduction==1:])
-            else:
-                defuction = self.relation.balance
-        self.status = 'F'
-        self.save()
-        # notify owner
-        pm_write(
-            sender=self.relation.quester,
-            recipient=self.relation.owner,
-            subject="Quest %s has failed. %s lost %s carrot%s." % (
-                self.title, self.relation.quester.title(), deduction, "s"[deduction==1:]),
-            body=""
-            )
-        # notify quester
-        pm_write(
-            sender=self.relation.owner,
-            recipient=self.relation.quester,
-            subject="Quest %s has failed. %s" % (self.title, loss_message),
-            body=""
-            )
+        if deduction:
+            loss_message = "You lost %s carrot%s." % (deduction, "s"[deduction==1:])
+        return [
+            # notify owner
+            Notification(
+                sender=self.relation.quester,
+                recipient=self.relation.owner,
+                subject="Quest %s has failed. %s lost %s carrot%s." % (
+                    self.title, self.relation.quester.username.title(), deduction, "s"[deduction==1:]),
+                body="",
+                carrots=deduction
+                ),
+            # notify quester
+            Notification(
+                sender=self.relation.owner,
+                recipient=self.relation.quester,
+                subject="Quest %s has failed. %s" % (self.title, loss_message),
+                body="",
+                carrots=deduction
+                ),
+            ]
     
-    def get_deadline_html(self):
-        """Returns the color coded html representation of the quest deadline as a string."""
-        if not self.deadline:
-            return "-"
-        today = timezone.now().date()
-        deadline = self.deadline.date()
-        warning_days = 1
-        template = '<span id="deadline-%s">%s</span>'
-        html = ""
-        # render date in color depending on time left
-        if today == deadline: # due
-            html = template % ("due", deadline)
-        elif today < deadline: # not yet due
-            if (deadline - today).days <= warning_days: # soon due
-                html = template % ("soon-due", deadline)
-            else: # not due
-                html = template % ("not-due", deadline)
-        else: # over due
-            html = template % ("over-due", deadline)
-        return  mark_safe(html)
+    def get_deadline_html(self, today=None):
+        """
+        Returns the color coded html representation of the quest deadline as a string.
+        Tables pass one today for all their rows.
+        """
+        return badges.deadline_html(self.deadline, today)
 
     def get_rating_html(self):
         """
@@ -184,28 +300,14 @@ class Quest(models.Model):
         The code displays 1-5 carrot images
         and a bomb image if the quest bomb flag is set.
         """
-        rating = self.rating
-        img_html = '<img src=%simages/carrot.png>' % settings.STATIC_URL
-        html = ""
-        if rating <= 5:
-            html = img_html * rating
-        else:
-            html = '%s x %s' % (img_html, rating)
-        if self.bomb:
-            html += " " + self.get_bomb_html()
-        return mark_safe(html)
+        return badges.rating_html(self.rating, self.bomb)
 
     def get_bomb_html(self):
         """
         Returns the html representation of the quest bomb flag as a string.
         The code contains is an image path for the bomb or an empty string.
         """
-        bomb = self.bomb
-        img_html = '<img src=%simages/bomb.png>' % settings.STATIC_URL
-        html = ""
-        if bomb:
-            html = img_html
-        return mark_safe(html)
+        return badges.bomb_html(self.bomb)
 
     def get_description_html(self):
         """Returns the quest description as a string or a hyphen if not set."""
@@ -214,3 +316,23 @@ class Quest(models.Model):
         else:
             return "-"
 
+
+def remember_quest_participants(sender, instance, **kwargs):
+    """
+    Remembers the relation participants of a quest about to be deleted,
+    as its relation may be deleted along with it (and be gone after the deletion).
+    """
+    instance.participant_ids = instance.relation.owner_id, instance.relation.quester_id
+
+pre_delete.connect(remember_quest_participants, sender=Quest)
+
+
+def invalidate_quest_tables(sender, instance, **kwargs):
+    """Invalidates the cached tables of both relation participants of a saved or deleted quest."""
+    participant_ids = getattr(instance, 'participant_ids', None)
+    if participant_ids is None:
+        participant_ids = instance.relation.owner_id, instance.relation.quester_id
+    bump_table_versions(*participant_ids)
+
+post_save.connect(invalidate_quest_tables, sender=Quest)
+post_delete.connect(invalidate_quest_tables, sender=Quest)
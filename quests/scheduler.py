@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+"""
+Contains the quest deadline scheduler.
+This module fails overdue quests shortly after their deadline has passed
+by keeping the expiry times of all active quests in a priority queue.
+"""
+
+import heapq
+from django.utils import timezone
+from quests.models import Quest
+
+__author__ = "Eraldo Helal"
+
+
+class DeadlineScheduler(object):
+    """
+    A priority queue of active quests ordered by the moment they become overdue.
+    The queue is rebuilt from the active quests on startup
+    and picks up newly activated quests by polling for deadlines
+    later than the latest deadline seen so far.
+    (Quest.activate() always sets the deadline 7 days into the future.)
+    """
+
+    def __init__(self, batch_size=100):
+        """Initializes an empty scheduler failing at most batch_size quests per run."""
+        self.batch_size = batch_size
+        self.queue = [] # heap of (expiry, quest id) tuples
+        self.scheduled = {} # quest id -> expiry of the current queue entry
+        self.watermark = None # latest deadline seen
+
+    def __len__(self):
+        """Returns the number of scheduled quests."""
+        return len(self.scheduled)
+
+    def load(self):
+        """Rebuilds the queue from all active quests that have a deadline."""
+        self.queue = []
+        self.scheduled = {}
+        self.watermark = None
+        return self.refresh()
+
+    def refresh(self):
+        """
+        Schedules active quests with a deadline not older than the latest one seen.
+        Returns the number of newly scheduled quests.
+        """
+        quests = Quest.objects.filter(status='A', deadline__isnull=False)
+        if self.watermark:
+            quests = quests.filter(deadline__gte=self.watermark)
+        added = 0
+        for pk, deadline in quests.values_list('pk', 'deadline').iterator():
+            if self.add(pk, deadline):
+                added += 1
+        return added
+
+    def add(self, pk, deadline):
+        """
+        Schedules the quest with the provided id and deadline.
+        Returns True if the quest was not yet scheduled for that expiry.
+        """
+        if not self.watermark or deadline > self.watermark:
+            self.watermark = deadline
+        expiry = Quest(deadline=deadline).get_expiry()
+        if self.scheduled.get(pk) == expiry:
+            return False
+        self.scheduled[pk] = expiry
+        heapq.heappush(self.queue, (expiry, pk))
+        return True
+
+    def next_expiry(self):
+        """Returns the earliest scheduled expiry or None if nothing is scheduled."""
+        while self.queue and self.scheduled.get(self.queue[0][1]) != self.queue[0][0]:
+            heapq.heappop(self.queue) # drop outdated entries
+        if self.queue:
+            return self.queue[0][0]
+        return None
+
+    def pop_due(self, now=None):
+        """
+        Removes up to batch_size quests that are overdue at the provided time from the queue.
+        Returns the list of their ids.
+        """
+        now = now or timezone.now()
+        due = []
+        while len(due) < self.batch_size:
+            expiry = self.next_expiry()
+            if expiry is None or expiry > now:
+                break
+            expiry, pk = heapq.heappop(self.queue)
+            del self.scheduled[pk]
+            due.append(pk)
+        return due
+
+    def run_pending(self, now=None):
+        """
+        Fails the quests that are due at the provided time.
+        Quests that are no longer active are skipped.
+        Returns a dictionary containing the number of failed quests,
+        charged relations and lost carrots.
+        """
+        now = now or timezone.now()
+        pks = self.pop_due(now)
+        if not pks:
+            return {'quests': 0, 'relations': 0, 'carrots': 0}
+        return Quest.objects.fail_overdue(pks, now)
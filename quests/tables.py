@@ -10,6 +10,7 @@ from django.utils.safestring import mark_safe
 from django.utils.html import escape
 from django.core.urlresolvers import reverse
 from django.conf import settings
+from carrotwars.tables import PrefetchTable, ActionColumn
 from datetime import datetime, timedelta
 
 __author__ = "Eraldo Helal"
@@ -61,15 +62,16 @@ class DeadlineColumn(tables.Column):
     Table column layout for displaying a color coded deadline.
     """
 
-    def render(self, value, record):
+    def render(self, value, record, table):
         """Returns a html string version representing the records deadline."""
-        return record.get_deadline_html()
+        return record.get_deadline_html(table.today)
     
 
-class OwnedQuestTable(tables.Table):
+class OwnedQuestTable(PrefetchTable):
     """
     Table layout for showing quests owned by a user.
     """
+    user_accessors = ('relation.quester',)
 
     quester = UserColumn(accessor='relation.quester')
     title = tables.LinkColumn('quests:detail', args=[A('pk')])
@@ -85,26 +87,21 @@ class OwnedQuestTable(tables.Table):
         fields = ("title", "description", "deadline", "rating")
 
 
-class CompleteColumn(tables.TemplateColumn):
+class CompleteColumn(ActionColumn):
     """
     Table column layout for marking a quest as completed.
     """
-    
-    def __init__(self, *args, **kwargs):
-        kwargs['template_code'] = """
-        {% load url from future %}
-        <form action="{% url 'quests:complete' value %}" method="POST">
-            {% csrf_token %}
-            <input type="image" value="Accept" src="/static/images/complete.png" />
-            </form>
-            """ 
-        super(CompleteColumn, self).__init__(*args, **kwargs)
+    viewname = 'quests:complete'
+    label = 'Accept'
+    image = '/static/images/complete.png'
+    sprite = 'complete'
         
 
-class AssignedQuestTable(tables.Table):
+class AssignedQuestTable(PrefetchTable):
     """
     Table layout for showing quests assigned to a user.
     """
+    user_accessors = ('relation.owner',)
 
     owner = UserColumn(accessor='relation.owner')
     title = tables.LinkColumn('quests:detail', args=[A('pk')])
@@ -121,41 +118,30 @@ class AssignedQuestTable(tables.Table):
         fields = ("title", "description", "deadline", "rating")
         
 
-class AcceptColumn(tables.TemplateColumn):
+class AcceptColumn(ActionColumn):
     """
     Table column layout for marking a quest as accepted.
     """
+    viewname = 'quests:accept'
+    label = 'Accept'
+    image = '/static/images/accept.png'
+    sprite = 'accept'
 
-    def __init__(self, *args, **kwargs):
-        kwargs['template_code'] = """
-        {% load url from future %}
-        <form action="{% url 'quests:accept' value %}" method="POST">
-            {% csrf_token %}
-            <input type="image" value="Accept" src="/static/images/accept.png" />
-            </form>
-            """ 
-        super(AcceptColumn, self).__init__(*args, **kwargs)
-
-class DeclineColumn(tables.TemplateColumn):
+class DeclineColumn(ActionColumn):
     """
     Table column layout for marking a quest as declined.
     """
+    viewname = 'quests:decline'
+    label = 'Decline'
+    image = '/static/images/decline.png'
+    sprite = 'decline'
 
-    def __init__(self, *args, **kwargs):
-        kwargs['template_code'] = """
-        {% load url from future %}
-        <form action="{% url 'quests:decline' value %}" method="POST">
-            {% csrf_token %}
-            <input type="image" value="Decline" src="/static/images/decline.png" />
-            </form>
-            """ 
-        super(DeclineColumn, self).__init__(*args, **kwargs)
 
-
-class PendingQuestTable(tables.Table):
+class PendingQuestTable(PrefetchTable):
     """
     Table layout for showing quests pending for a user.
     """
+    user_accessors = ('relation.owner',)
 
     owner = UserColumn(accessor='relation.owner')
     title = tables.LinkColumn('quests:detail', args=[A('pk')])
@@ -172,41 +158,30 @@ class PendingQuestTable(tables.Table):
         fields = ("title", "description", "rating")
 
 
-class ConfirmColumn(tables.TemplateColumn):
+class ConfirmColumn(ActionColumn):
     """
     Table column layout for marking a quest as confirmed.
     """
+    viewname = 'quests:confirm'
+    label = 'Accept'
+    image = '/static/images/confirm.png'
+    sprite = 'confirm'
 
-    def __init__(self, *args, **kwargs):
-        kwargs['template_code'] = """
-        {% load url from future %}
-        <form action="{% url 'quests:confirm' value %}" method="POST">
-            {% csrf_token %}
-            <input type="image" value="Accept" src="/static/images/confirm.png" />
-            </form>
-            """ 
-        super(ConfirmColumn, self).__init__(*args, **kwargs)
-
-class DenyColumn(tables.TemplateColumn):
+class DenyColumn(ActionColumn):
     """
     Table column layout for marking a quest as denied.
     """
-
-    def __init__(self, *args, **kwargs):
-        kwargs['template_code'] = """
-        {% load url from future %}
-        <form action="{% url 'quests:deny' value %}" method="POST">
-            {% csrf_token %}
-            <input type="image" value="Decline" src="/static/images/deny.png" />
-            </form>
-            """ 
-        super(DenyColumn, self).__init__(*args, **kwargs)
+    viewname = 'quests:deny'
+    label = 'Decline'
+    image = '/static/images/deny.png'
+    sprite = 'deny'
         
 
-class CompletedQuestTable(tables.Table):
+class CompletedQuestTable(PrefetchTable):
     """
     Table layout for showing quests completed for a user.
     """
+    user_accessors = ('relation.quester',)
 
     quester = UserColumn(accessor='relation.quester')
     title = tables.LinkColumn('quests:detail', args=[A('pk')])
@@ -223,10 +198,11 @@ class CompletedQuestTable(tables.Table):
         fields = ("title", "description", "rating")
 
 
-class WaitingQuestTable(tables.Table):
+class WaitingQuestTable(PrefetchTable):
     """
     Table layout for showing quests a user is waiting for.
     """
+    user_accessors = ('relation.owner',)
 
     owner = UserColumn(accessor='relation.owner')
     title = tables.LinkColumn('quests:detail', args=[A('pk')])
@@ -241,10 +217,11 @@ class WaitingQuestTable(tables.Table):
         fields = ("title", "description", "rating")
 
 
-class ProposedQuestTable(tables.Table):
+class ProposedQuestTable(PrefetchTable):
     """
     Table layout for showing quests proposed for a user.
     """
+    user_accessors = ('relation.quester',)
 
     quester = UserColumn(accessor='relation.quester')
     title = tables.LinkColumn('quests:detail', args=[A('pk')])
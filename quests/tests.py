@@ -5,7 +5,26 @@ when you run "manage.py test".
 Replace this with more appropriate tests for your application.
 """
 
+import base64
+import json
 from django.test import TestCase
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import override_settings
+from datetime import timedelta
+from django.contrib.auth.models import User
+from django.utils import timezone
+from postman.models import Message
+from notifications.models import Notification
+from relations.models import Relation
+from quests.models import Quest
+from rewards.models import Reward
+from quests.scheduler import DeadlineScheduler
+from carrotwars import badges
+from carrotwars.tablecache import get_table_version
+from django.template import Context
+from django_tables2 import TemplateColumn
+from quests.tables import CompleteColumn
 
 
 class SimpleTest(TestCase):
@@ -14,3 +33,305 @@ class SimpleTest(TestCase):
         Tests that 1 + 1 always equals 2.
         """
         self.assertEqual(1 + 1, 2)
+
+
+class UpdateStatusTest(TestCase):
+    """
+    Tests the set-based failing of overdue quests.
+    """
+
+    def setUp(self):
+        """Creates a relation with some active, overdue and finished quests."""
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'secret')
+        self.quester = User.objects.create_user('quester', 'quester@example.com', 'secret')
+        self.relation = Relation.objects.create(owner=self.owner, quester=self.quester, status='A', balance=4)
+        past = timezone.now() - timedelta(days=2)
+        future = timezone.now() + timedelta(days=2)
+        self.bomb = Quest.objects.create(relation=self.relation, title="bomb", rating=3, bomb=True, status='A', deadline=past)
+        self.broke = Quest.objects.create(relation=self.relation, title="broke", rating=2, bomb=True, status='A', deadline=past)
+        self.plain = Quest.objects.create(relation=self.relation, title="plain", rating=5, status='A', deadline=past)
+        self.running = Quest.objects.create(relation=self.relation, title="running", status='A', deadline=future)
+        self.marked = Quest.objects.create(relation=self.relation, title="marked", status='M', deadline=past)
+
+    def test_overdue(self):
+        """Tests that only active quests with a past deadline day are overdue."""
+        overdue = Quest.objects.overdue()
+        self.assertEqual(set(overdue), set([self.bomb, self.broke, self.plain]))
+        for quest in Quest.objects.all():
+            self.assertEqual(quest in overdue, quest.status == 'A' and quest.is_overdue())
+
+    def test_update_status(self):
+        """Tests that overdue quests are failed and bomb carrots deducted while the balance allows it."""
+        counts = Quest.objects.update_status(chunk_size=2)
+        self.assertEqual(counts, {'quests': 3, 'relations': 1, 'carrots': 3})
+        statuses = dict(Quest.objects.values_list('title', 'status'))
+        self.assertEqual(statuses, {'bomb': 'F', 'broke': 'F', 'plain': 'F', 'running': 'A', 'marked': 'M'})
+        self.assertEqual(Relation.objects.get(pk=self.relation.pk).balance, 1)
+        self.assertEqual(Notification.objects.pending().count(), 6)
+        self.assertEqual(Quest.objects.update_status(), {'quests': 0, 'relations': 0, 'carrots': 0})
+        # one digest per recipient for the whole run
+        self.assertEqual(Notification.objects.deliver(Notification.objects.values_list('pk', flat=True)), 6)
+        self.assertEqual(list(Message.objects.values_list('subject', flat=True)),
+                         ["3 notifications: 3 carrots deducted."] * 2)
+
+
+class DeadlineSchedulerTest(TestCase):
+    """
+    Tests the priority queue based failing of overdue quests.
+    """
+
+    def setUp(self):
+        """Creates a relation with two active quests of different deadlines."""
+        owner = User.objects.create_user('owner', 'owner@example.com', 'secret')
+        quester = User.objects.create_user('quester', 'quester@example.com', 'secret')
+        self.relation = Relation.objects.create(owner=owner, quester=quester, status='A')
+        self.soon = Quest.objects.create(relation=self.relation, title="soon", status='A',
+            deadline=timezone.now() + timedelta(days=1))
+        self.later = Quest.objects.create(relation=self.relation, title="later", status='A',
+            deadline=timezone.now() + timedelta(days=3))
+
+    def test_run_pending(self):
+        """Tests that quests are failed in expiry order once their deadline day has passed."""
+        scheduler = DeadlineScheduler()
+        self.assertEqual(scheduler.load(), 2)
+        self.assertEqual(scheduler.next_expiry(), self.soon.get_expiry())
+        self.assertEqual(scheduler.run_pending(timezone.now())['quests'], 0)
+        self.assertEqual(scheduler.run_pending(self.soon.get_expiry())['quests'], 1)
+        self.assertEqual(Quest.objects.get(pk=self.soon.pk).status, 'F')
+        self.assertEqual(Quest.objects.get(pk=self.later.pk).status, 'A')
+        self.assertEqual(len(scheduler), 1)
+
+    def test_refresh(self):
+        """Tests that newly activated quests are picked up without reloading."""
+        scheduler = DeadlineScheduler()
+        scheduler.load()
+        quest = Quest.objects.create(relation=self.relation, title="new")
+        quest.activate()
+        quest.save()
+        self.assertEqual(scheduler.refresh(), 1)
+        self.assertEqual(scheduler.refresh(), 0)
+        self.assertEqual(len(scheduler), 3)
+
+    def test_skips_inactive(self):
+        """Tests that quests which are no longer active when due are not failed."""
+        scheduler = DeadlineScheduler()
+        scheduler.load()
+        Quest.objects.filter(pk=self.soon.pk).update(status='M')
+        self.assertEqual(scheduler.run_pending(self.later.get_expiry())['quests'], 1)
+        self.assertEqual(Quest.objects.get(pk=self.soon.pk).status, 'M')
+
+
+class DashboardTest(TestCase):
+    """
+    Tests the single query quest dashboard.
+    """
+
+    def setUp(self):
+        """Creates quests in every dashboard state for both relation roles."""
+        self.user = User.objects.create_user('user', 'user@example.com', 'secret')
+        other = User.objects.create_user('other', 'other@example.com', 'secret')
+        owned = Relation.objects.create(owner=self.user, quester=other, status='A')
+        assigned = Relation.objects.create(owner=other, quester=self.user, status='A')
+        self.quests = {}
+        for relation, names in ((owned, ('proposed', 'owned', 'completed')), (assigned, ('pending', 'assigned', 'waiting'))):
+            for status, name in zip('CAM', names):
+                self.quests[name] = Quest.objects.create(relation=relation, title=name, status=status)
+            Quest.objects.create(relation=relation, title="done", status='D')
+
+    def test_dashboard_for(self):
+        """Tests that all quest sets are loaded with one query and match the manager sets."""
+        with self.assertNumQueries(1):
+            dashboard = Quest.objects.dashboard_for(self.user)
+            for quests in dashboard.values():
+                for quest in quests:
+                    quest.relation.owner, quest.relation.quester
+        self.assertEqual(dashboard['owned'], list(Quest.objects.owned_by(self.user)))
+        self.assertEqual(dashboard['assigned'], list(Quest.objects.assigned_to(self.user)))
+        self.assertEqual(dashboard['proposed'], list(Quest.objects.proposed_by(self.user)))
+        self.assertEqual(dashboard['pending'], list(Quest.objects.pending_for(self.user)))
+        self.assertEqual(dashboard['completed'], list(Quest.objects.completed_for(self.user)))
+        self.assertEqual(dashboard['waiting'], list(Quest.objects.waiting_for(self.user)))
+        for name, quest in self.quests.items():
+            self.assertEqual(dashboard[name], [quest])
+
+    def test_list_view(self):
+        """Tests that the quest list renders all dashboard tables."""
+        self.client.login(username='user', password='secret')
+        response = self.client.get('/quests/')
+        self.assertEqual(response.status_code, 200)
+        for name in self.quests:
+            self.assertContains(response, '>%s</a>' % name)
+
+    @override_settings(CACHE_IS_SHARED=True)
+    def test_cached_tables(self):
+        """Tests that unchanged tables come from the cache and changes show up at once."""
+        cache.clear()
+        self.client.login(username='user', password='secret')
+        self.client.get('/quests/')
+        connection.use_debug_cursor = True
+        try:
+            start = len(connection.queries)
+            response = self.client.get('/quests/')
+            queries = connection.queries[start:]
+        finally:
+            connection.use_debug_cursor = False
+        self.assertContains(response, '>owned</a>')
+        self.assertFalse([query for query in queries if 'quests_quest' in query['sql']])
+        quest = self.quests['owned']
+        quest.title = 'renamed'
+        quest.save()
+        self.assertContains(self.client.get('/quests/'), '>renamed</a>')
+
+    @override_settings(CACHE_IS_SHARED=True)
+    def test_conditional_get(self):
+        """Tests that unchanged pages are answered with 304 and changes with the new page."""
+        cache.clear()
+        self.client.login(username='user', password='secret')
+        etag = self.client.get('/quests/')['ETag']
+        with self.assertNumQueries(2): # session and user (the unread message count is cached)
+            response = self.client.get('/quests/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Quest.objects.filter(pk=self.quests['owned'].pk).update(title='renamed')
+        self.assertEqual(self.client.get('/quests/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Quest.objects.get(pk=self.quests['owned'].pk).save()
+        response = self.client.get('/quests/', HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, '>renamed</a>')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_local_cache(self):
+        """Tests that tables are neither cached nor answered with 304 without a shared cache."""
+        self.client.login(username='user', password='secret')
+        response = self.client.get('/quests/')
+        self.assertFalse(response.has_header('ETag'))
+        Quest.objects.filter(pk=self.quests['owned'].pk).update(title='renamed')
+        self.assertContains(self.client.get('/quests/'), '>renamed</a>')
+
+    def test_delete_relation(self):
+        """Tests that deleting a relation with quests and rewards invalidates the tables of both participants."""
+        relation = self.quests['owned'].relation
+        Reward.objects.create(relation=relation, title="reward", price=1)
+        versions = [get_table_version(user_id) for user_id in (relation.owner_id, relation.quester_id)]
+        Relation.objects.get(pk=relation.pk).delete()
+        self.assertFalse(Quest.objects.filter(relation=relation.pk).exists())
+        self.assertFalse(Reward.objects.filter(relation=relation.pk).exists())
+        self.assertNotEqual([get_table_version(user_id) for user_id in (relation.owner_id, relation.quester_id)], versions)
+
+    def test_delete_user(self):
+        """Tests that deleting a user deletes the relations, quests and rewards of the user."""
+        Reward.objects.create(relation=self.quests['assigned'].relation, title="reward", price=1)
+        User.objects.get(pk=self.user.pk).delete()
+        self.assertFalse(Relation.objects.exists())
+        self.assertFalse(Quest.objects.exists())
+        self.assertFalse(Reward.objects.exists())
+
+    def test_detail_view(self):
+        """Tests that the quest detail view neither builds nor queries the dashboard tables."""
+        self.client.login(username='user', password='secret')
+        quest = self.quests['owned']
+        response = self.client.get(quest.get_absolute_url())
+        self.assertContains(response, quest.title)
+        self.assertFalse('owned_table' in response.context)
+
+
+class BadgeTest(TestCase):
+    """
+    Tests the memoized html badges.
+    """
+
+    @override_settings(STATIC_SPRITES=False)
+    def test_rating(self):
+        """Tests that rating badges are shared and follow the static url."""
+        quest = Quest(rating=2, bomb=True)
+        self.assertTrue(quest.get_rating_html() is Quest(rating=2, bomb=True).get_rating_html())
+        with override_settings(STATIC_URL='/cdn/'):
+            self.assertEqual(quest.get_rating_html(),
+                             '<img src=/cdn/images/carrot.png><img src=/cdn/images/carrot.png> <img src=/cdn/images/bomb.png>')
+        self.assertFalse('/cdn/' in quest.get_rating_html())
+
+    @override_settings(STATIC_SPRITES=True)
+    def test_sprites(self):
+        """Tests that ratings are rendered as single sprites of up to five carrots."""
+        self.assertEqual(Quest(rating=2, bomb=True).get_rating_html(),
+                         '<span class="sprite sprite-carrots-2"></span> <span class="sprite sprite-bomb"></span>')
+        self.assertEqual(badges.balance_html(7), '<span class="sprite sprite-carrots-1"></span> x 7')
+
+    def test_deadline(self):
+        """Tests that deadlines are colored relative to the provided today."""
+        deadline = timezone.now()
+        today = deadline.date()
+        self.assertEqual(badges.deadline_html(deadline, today), '<span id="deadline-due">%s</span>' % today)
+        self.assertEqual(badges.deadline_html(deadline, today - timedelta(days=1)), '<span id="deadline-soon-due">%s</span>' % today)
+        self.assertEqual(badges.deadline_html(deadline, today - timedelta(days=5)), '<span id="deadline-not-due">%s</span>' % today)
+        self.assertEqual(badges.deadline_html(deadline, today + timedelta(days=1)), '<span id="deadline-over-due">%s</span>' % today)
+        self.assertEqual(Quest().get_deadline_html(), "-")
+
+
+class ActionColumnTest(TestCase):
+    """
+    Tests the precompiled action button columns.
+    """
+
+    @override_settings(STATIC_SPRITES=False)
+    def test_markup(self):
+        """Tests that action columns render the markup of the equivalent template column."""
+        template_column = TemplateColumn("""
+        {% load url from future %}
+        <form action="{% url 'quests:complete' value %}" method="POST">
+            {% csrf_token %}
+            <input type="image" value="Accept" src="/static/images/complete.png" />
+            </form>
+            """)
+        table = type('Table', (object,), {'context': Context({'csrf_token': 'token'})})()
+        bound_column = type('BoundColumn', (object,), {'default': None})()
+        for pk in (1, 42):
+            self.assertEqual(CompleteColumn().render(value=pk, record=None, table=table),
+                             template_column.render(record=None, table=table, value=pk, bound_column=bound_column))
+
+
+    @override_settings(STATIC_SPRITES=True)
+    def test_sprite(self):
+        """Tests that action columns with a sprite render a sprite button."""
+        table = type('Table', (object,), {'context': Context({'csrf_token': 'token'})})()
+        html = CompleteColumn().render(value=42, record=None, table=table)
+        self.assertIn('<form action="/quests/42/complete/" method="POST">', html)
+        self.assertIn('<button type="submit" class="sprite sprite-complete" title="Accept" value="Accept"></button>', html)
+
+
+class CursorPaginationTest(TestCase):
+    """
+    Tests the cursor pagination of the quest api.
+    """
+
+    def setUp(self):
+        """Creates a relation with five quests."""
+        user = User.objects.create_user('user', 'user@example.com', 'secret')
+        other = User.objects.create_user('other', 'other@example.com', 'secret')
+        self.relation = Relation.objects.create(owner=user, quester=other, status='A')
+        for index in range(5):
+            Quest.objects.create(relation=self.relation, title="quest %s" % index)
+        self.auth = 'Basic %s' % base64.b64encode('user:secret')
+
+    def get(self, uri):
+        """Returns the decoded json response of the quest api uri."""
+        response = self.client.get(uri, HTTP_AUTHORIZATION=self.auth)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    def test_walk(self):
+        """Tests that following the cursors returns every quest once, including ones created meanwhile."""
+        page = self.get('/api/v1/quest/?format=json&limit=2&cursor=')
+        self.assertFalse('total_count' in page['meta'])
+        titles = []
+        while True:
+            titles.extend(quest['title'] for quest in page['objects'])
+            if len(titles) == 2:
+                Quest.objects.create(relation=self.relation, title="quest 5")
+            if not page['meta']['next']:
+                break
+            page = self.get(page['meta']['next'])
+        self.assertEqual(titles, ["quest %s" % index for index in range(6)])
+
+    def test_invalid_cursor(self):
+        """Tests that tampered cursors are rejected."""
+        response = self.client.get('/api/v1/quest/', {'format': 'json', 'cursor': 'forged'}, HTTP_AUTHORIZATION=self.auth)
+        self.assertEqual(response.status_code, 400)
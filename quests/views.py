@@ -12,12 +12,17 @@ from django import forms
 from django.utils.decorators import method_decorator
 from django.contrib.auth.decorators import login_required
 from quests.tables import OwnedQuestTable, AssignedQuestTable, PendingQuestTable, CompletedQuestTable, WaitingQuestTable, ProposedQuestTable
-from postman.api import pm_write
+from notifications.api import notify
+from changes.models import Change
 from django.utils.html import strip_tags
 from django.core.urlresolvers import reverse
 from django.contrib import messages
+from django.db import transaction
+from django.utils import timezone
 from datetime import datetime, timedelta
-from django_tables2 import RequestConfig
+from django.utils.functional import SimpleLazyObject
+from carrotwars.tables import lazy_tables
+from carrotwars.conditional import ConditionalMixin
 
 from django.forms.widgets import RadioSelect
 
@@ -55,9 +60,21 @@ class QuestMixin(LoginRequiredMixin):
     """
     Mixin class that sets main context information that is needed for quest object views.
     Configures quest set filters, table information and default quest form.
+    Quest sets and tables are only added for the names listed in tables
+    and are only loaded once the template uses them.
     """
     model = Quest
     form_class = QuestForm
+    #: names of the quest sets (and tables) used by the view template
+    tables = ()
+    table_classes = {
+        'owned': OwnedQuestTable,
+        'assigned': AssignedQuestTable,
+        'proposed': ProposedQuestTable,
+        'pending': PendingQuestTable,
+        'completed': CompletedQuestTable,
+        'waiting': WaitingQuestTable,
+    }
     
     def get_context_data(self, **kwargs):
         """
@@ -65,34 +82,21 @@ class QuestMixin(LoginRequiredMixin):
         Returns a context dictionary.
         """
         context = super(QuestMixin, self).get_context_data(**kwargs)
-        context['owner'] = Relation.objects.owned_by(self.request.user)
-        context['owned'] = Quest.objects.owned_by(self.request.user)
-        context['assigned'] = Quest.objects.assigned_to(self.request.user)
-        context['proposed'] = Quest.objects.proposed_by(self.request.user)
-        context['pending'] = Quest.objects.pending_for(self.request.user)
-        context['completed'] = Quest.objects.completed_for(self.request.user)
-        context['waiting'] = Quest.objects.waiting_for(self.request.user)
-        context['owned_table'] = OwnedQuestTable(context['owned'])
-        context['assigned_table'] = AssignedQuestTable(context['assigned'])
-        context['proposed_table'] = ProposedQuestTable(context['proposed'])
-        context['pending_table'] = PendingQuestTable(context['pending'])
-        context['completed_table'] = CompletedQuestTable(context['completed'])
-        context['waiting_table'] = WaitingQuestTable(context['waiting'])
-        requestConfig = RequestConfig(self.request, paginate={"per_page": 10,})
-        requestConfig.configure(context['owned_table'])
-        requestConfig.configure(context['assigned_table'])
-        requestConfig.configure(context['proposed_table'])
-        requestConfig.configure(context['pending_table'])
-        requestConfig.configure(context['completed_table'])
-        requestConfig.configure(context['waiting_table'])
+        user = self.request.user
+        context['owner'] = SimpleLazyObject(lambda: Relation.objects.owned_by(user).exists())
+        # all quest sets are loaded with a single query
+        dashboard = SimpleLazyObject(lambda: Quest.objects.dashboard_for(user))
+        context.update(lazy_tables(self.request, [
+            (name, self.table_classes[name], lambda name=name: dashboard.get(name)) for name in self.tables]))
         return context
 
 
-class QuestListView(QuestMixin, ListView):
+class QuestListView(QuestMixin, ConditionalMixin, ListView):
     """A generic view providing context information for lists of quests."""
+    tables = ('owned', 'assigned', 'proposed', 'pending', 'completed', 'waiting')
 
 
-class QuestDetailView(QuestMixin, DetailView):
+class QuestDetailView(QuestMixin, ConditionalMixin, DetailView):
     """A generic view providing context information for a single quest."""
 
 
@@ -131,9 +135,9 @@ class QuestCreateView(QuestMixin, CreateView):
         else:
             success_msg = 'New quest has been created. Waiting for Quester to accept.'
 
-        self.object.save()
-        
-        self.inform_user()
+        with transaction.commit_on_success():
+            self.object.save()
+            self.inform_user()
         messages.add_message(self.request, messages.INFO, success_msg)
 
         return super(QuestCreateView, self).form_valid(form)
@@ -144,7 +148,7 @@ class QuestCreateView(QuestMixin, CreateView):
         """
         subject = "New quest!"
         body = """<a href="%s">%s</a>""" % (self.object.get_absolute_url(), strip_tags(self.object.title))
-        pm_write(
+        notify(
             sender=self.request.user,
             recipient=self.object.relation.quester,
             subject=subject,
@@ -177,17 +181,16 @@ class AcceptView(RedirectView):
         if self.request.user != quest.relation.quester or quest.status != 'C':
             return reverse('quests:list')
 
-        # update quest
-        quest.activate()
-        quest.save()
-
-        # inform owner
-        pm_write(
-            sender=self.request.user,
-            recipient=quest.relation.owner,
-            subject="Quest %s has been accepted." % quest.title,
-            body=""
-            )
+        # update quest and inform owner
+        with transaction.commit_on_success():
+            quest.activate()
+            quest.save()
+            notify(
+                sender=self.request.user,
+                recipient=quest.relation.owner,
+                subject="Quest %s has been accepted." % quest.title,
+                body=""
+                )
 
         messages.add_message(self.request, messages.SUCCESS, 'Quest has been accepted.')
         return reverse('quests:list')
@@ -210,17 +213,16 @@ class DeclineView(RedirectView):
         if self.request.user != quest.relation.quester or quest.status != 'C':
             return reverse('quests:list')
 
-        # update quest
-        quest.status = 'R'
-        quest.save()
-
-        # inform owner
-        pm_write(
-            sender=self.request.user,
-            recipient=quest.relation.owner,
-            subject="Quest %s has been declined." % quest.title,
-            body=""
-            )
+        # update quest and inform owner
+        with transaction.commit_on_success():
+            quest.status = 'R'
+            quest.save()
+            notify(
+                sender=self.request.user,
+                recipient=quest.relation.owner,
+                subject="Quest %s has been declined." % quest.title,
+                body=""
+                )
 
         messages.add_message(self.request, messages.INFO, 'Quest has been declined.')
         return reverse('quests:list')
@@ -243,18 +245,17 @@ class CompleteView(RedirectView):
         if self.request.user != quest.relation.quester or quest.status != 'A':
             return reverse('quests:list')
 
-        # update quest
-        quest.status = 'M'
-        quest.save()
-
-        # inform owner
+        # update quest and inform owner
+        with transaction.commit_on_success():
+            quest.status = 'M'
+            quest.save()
+            notify(
+                sender=self.request.user,
+                recipient=quest.relation.owner,
+                subject="Quest %s has been marked as completed." % quest.title,
+                body=""
+                )
         messages.add_message(self.request, messages.INFO, 'Quest has been marked as completed. Owner has been informed.')
-        pm_write(
-            sender=self.request.user,
-            recipient=quest.relation.owner,
-            subject="Quest %s has been marked as completed." % quest.title,
-            body=""
-            )
         return reverse('quests:list')
 
 
@@ -275,23 +276,19 @@ class ConfirmView(RedirectView):
         if self.request.user != quest.relation.owner or quest.status != 'M':
             return reverse('quests:list')
 
-        # update quest
-        quest.status = 'D'
-        quest.save()
-        
-        # update balance
-        relation = Relation.objects.get(owner=self.request.user, quester=quest.relation.quester)
-        relation.balance += quest.rating
-        relation.save()
-
-        # inform quester
+        # update quest and balance (only once, even on concurrent confirmations) and inform quester
+        with transaction.commit_on_success():
+            if not Quest.objects.filter(pk=quest.pk, status='M').update(status='D', modification_date=timezone.now()):
+                return reverse('quests:list')
+            Change.objects.record('U', [quest])
+            Relation.objects.credit(quest.relation_id, quest.rating, 'Q', quest.pk)
+            notify(
+                sender=self.request.user,
+                recipient=quest.relation.quester,
+                subject="Quest %s completion has been confirmed. You earned %s carrot%s!" % (quest.title, quest.rating, "s"[quest.rating==1:]),
+                body=""
+                )
         messages.add_message(self.request, messages.INFO, 'Quest completion has been confirmed. %s earned %s carrot%s.' % (quest.relation.quester, quest.rating, "s"[quest.rating==1:]))
-        pm_write(
-            sender=self.request.user,
-            recipient=quest.relation.quester,
-        subject="Quest %s completion has been confirmed. You earned %s carrot%s!" % (quest.title, quest.rating, "s"[quest.rating==1:]),
-            body=""
-            )
         return reverse('quests:list')
 
 
@@ -312,16 +309,15 @@ class DenyView(RedirectView):
         if self.request.user != quest.relation.owner or quest.status != 'M':
             return reverse('quests:list')
 
-        # update quest
-        quest.status = 'A'
-        quest.save()
-
-        # inform quester
+        # update quest and inform quester
+        with transaction.commit_on_success():
+            quest.status = 'A'
+            quest.save()
+            notify(
+                sender=self.request.user,
+                recipient=quest.relation.quester,
+                subject="Quest %s completion has been denied." % quest.title,
+                body=""
+                )
         messages.add_message(self.request, messages.INFO, 'Quest completion has been denied.')
-        pm_write(
-            sender=self.request.user,
-            recipient=quest.relation.quester,
-            subject="Quest %s completion has been denied." % quest.title,
-            body=""
-            )
         return reverse('quests:list')
@@ -4,7 +4,7 @@ Contains the django admin interface settings related to the relation model.
 """
 
 from django.contrib import admin
-from relations.models import Relation
+from relations.models import Relation, LedgerEntry
 from quests.models import Quest
 from rewards.models import Reward
 
@@ -29,3 +29,4 @@ class RelationAdmin(admin.ModelAdmin):
     inlines = [QuestInline, RewardInline]
 
 admin.site.register(Relation, RelationAdmin)
+admin.site.register(LedgerEntry)
@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+"""
+Contains the relation related cron job settings.
+This module manages the compaction of the carrot ledger
+by using time based triggering.
+"""
+
+from datetime import timedelta
+from django.utils import timezone
+from django_cron import CronJobBase, Schedule
+from relations.models import LedgerEntry
+
+__author__ = "Eraldo Helal"
+
+
+class CompactLedgerCronJob(CronJobBase):
+    """
+    Triggers compaction of the carrot ledger once a day.
+    Entries older than KEEP_DAYS are folded into one snapshot entry per relation.
+    """
+    RUN_AT_TIMES = ['03:00']
+    KEEP_DAYS = 90
+
+    schedule = Schedule(run_at_times=RUN_AT_TIMES)
+    code = 'relations.compact_ledger'    # a unique code
+
+    def do(self):
+        """
+        Compacts the ledger entries older than KEEP_DAYS.
+        Returns a summary message that is stored in the cron job log.
+        """
+        removed = LedgerEntry.objects.compact(before=timezone.now() - timedelta(days=self.KEEP_DAYS))
+        return "Removed %s ledger entries." % removed
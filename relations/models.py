@@ -1,13 +1,26 @@
 #!/usr/bin/env python
 """db model representing a relation of two users"""
 
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Sum, Max, Count
+from django.utils import timezone
 from django.contrib.auth.models import User
 from django.core.urlresolvers import reverse
 from django.conf import settings
 from django.utils.safestring import mark_safe
+from carrotwars import badges
+from carrotwars.tablecache import bump_table_versions
+from carrotwars.images import get_derivative, has_derivatives, schedule_derivatives
+from django.db.models.signals import post_save, post_delete
+from accounts.models import UserProfile
+from changes.models import Change
 
 __author__ = "Eraldo Helal"
+
+
+class InsufficientBalance(Exception):
+    """Raised if a relation balance does not cover the carrots to be charged."""
+
     
 class RelationManager(models.Manager):
     """
@@ -29,6 +42,56 @@ class RelationManager(models.Manager):
         """Returns the set of relations pending for the provided user."""
         return super(RelationManager, self).get_query_set().filter(quester=user, status='C')
 
+    def credit(self, relation_id, amount, reason, source_id=None):
+        """
+        Adds the provided amount of carrots to the relation balance
+        with a single atomic update and records it in the ledger.
+        All balance changes go through credit or debit.
+        Callers combine them with their status change in one transaction.
+        """
+        super(RelationManager, self).get_query_set().filter(pk=relation_id).update(
+            balance=F('balance') + amount, modification_date=timezone.now())
+        LedgerEntry.objects.create(relation_id=relation_id, delta=amount, reason=reason, source_id=source_id)
+        self.touch([relation_id])
+
+    def debit(self, relation_id, amount, reason, source_id=None):
+        """
+        Subtracts the provided amount of carrots from the relation balance
+        with a single atomic update that only applies if the balance covers the amount
+        and records it in the ledger.
+        Raises InsufficientBalance otherwise.
+        """
+        self.debit_many(relation_id, reason, {source_id: amount})
+
+    def debit_many(self, relation_id, reason, amounts):
+        """
+        Subtracts the sum of the provided amounts (a dictionary mapping source ids to carrots)
+        from the relation balance with a single atomic update that only applies
+        if the balance covers the sum and records one ledger entry per source.
+        Raises InsufficientBalance otherwise.
+        """
+        amount = sum(amounts.values())
+        charged = super(RelationManager, self).get_query_set().filter(
+            pk=relation_id, balance__gte=amount).update(balance=F('balance') - amount, modification_date=timezone.now())
+        if not charged:
+            raise InsufficientBalance("Relation %s cannot afford %s carrots." % (relation_id, amount))
+        LedgerEntry.objects.bulk_create([
+            LedgerEntry(relation_id=relation_id, delta=-carrots, reason=reason, source_id=source_id)
+            for source_id, carrots in amounts.items()])
+        self.touch([relation_id])
+
+    def touch(self, relation_ids):
+        """
+        Records the update of the provided relations in the change log
+        and invalidates the cached tables of both participants
+        (needed after bulk updates, which send no signals).
+        """
+        relations = [Relation(pk=pk, owner_id=owner_id, quester_id=quester_id) for pk, owner_id, quester_id in
+                     super(RelationManager, self).get_query_set().filter(
+                         pk__in=relation_ids).values_list('pk', 'owner_id', 'quester_id')]
+        Change.objects.record('U', relations)
+        bump_table_versions(*[user_id for relation in relations for user_id in (relation.owner_id, relation.quester_id)])
+
 class Relation(models.Model):
     """
     A django model representing a persistant 1-to-1 relation between two users.
@@ -38,6 +101,7 @@ class Relation(models.Model):
     owner = models.ForeignKey(User, related_name='relation_owner') # creator of the relation
     quester = models.ForeignKey(User, related_name='relation_quester')
     creation_date = models.DateTimeField('creation date', auto_now_add=True)
+    modification_date = models.DateTimeField('modification date', auto_now=True)
     balance = models.IntegerField(default=0, help_text="Amount of credits the quester has.")
     STATUS = (
         ('C', 'created'),
@@ -46,6 +110,8 @@ class Relation(models.Model):
         ('X', 'deleted'),
     )
     status = models.CharField(default='C', max_length=1, choices=STATUS)
+    # composite indexes on (owner, status) and (quester, status) are added by south migration 0002
+    # a composite index on (creation_date, id) for api cursors is added by south migration 0006
     objects = RelationManager() # custom django quest manager
     
     def __unicode__(self):
@@ -68,20 +134,10 @@ class Relation(models.Model):
         or single carrot image, a times symbol and a number representing
         the amount of collected carrots if above 5.
         """
-        balance = self.balance
-        img_html = '<img src=%simages/carrot.png>' % settings.STATIC_URL
-        html = ""
-        if balance == 0:
-            html = "no credits"
-        elif balance <= 5:
-            html = img_html * balance
-        else:
-            html = '%s x %s' % (img_html, balance)
-        return mark_safe(html)
+        return badges.balance_html(self.balance)
 
     def _get_user_html(self, user):
         """Returns the html reperesentation of a user containing avatar and username as a string."""
-        img_html = '<img src=%simages/carrot.png>' % settings.STATIC_URL
         link = reverse('relations:detail', args=[self.pk])
         template = """
         <a id="user-link" href="%s">
@@ -102,13 +158,8 @@ class Relation(models.Model):
         return self._get_user_html(self.quester)
 
     def _get_user_image_html(self, user, id):
-        """Returns the html reperesentation of a user avatar as a string."""
-        image_path = user.profile.avatar
-        img_html = '<img id="%s" src="%s%s">' % (id, settings.MEDIA_URL, image_path)
-        html = ""
-        if image_path:
-            html = img_html
-        return mark_safe(html)
+        """Returns the html reperesentation of a user avatar derivative (image or icon) as a string."""
+        return badges.avatar_html(id, get_derivative(user.profile.avatar.name, id))
 
     def get_owner_image_html(self):
         """Returns the html reperesentation the relation owner avatar as a string."""
@@ -126,3 +177,98 @@ class Relation(models.Model):
         """Returns the html reperesentation the relation quester avatar icon as a string."""
         return self._get_user_image_html(self.quester, "icon")
 
+
+
+class LedgerEntryManager(models.Manager):
+    """
+    Provides access to the carrot history of relations
+    and compaction of old ledger entries.
+    """
+
+    def for_relation(self, relation, since=None):
+        """Returns the ledger entries of the provided relation (since the provided date) in order."""
+        entries = super(LedgerEntryManager, self).get_query_set().filter(relation=relation)
+        if since:
+            entries = entries.filter(creation_date__gte=since)
+        return entries.order_by('creation_date', 'pk')
+
+    def balance_of(self, relation):
+        """Returns the balance of the provided relation recomputed from its ledger entries."""
+        return self.for_relation(relation).aggregate(balance=Sum('delta'))['balance'] or 0
+
+    def compact(self, before):
+        """
+        Folds all ledger entries of a relation that are older than the provided date
+        into a single snapshot entry, keeping the sum of the entries unchanged.
+        Returns the number of removed entries.
+        """
+        removed = 0
+        old_entries = super(LedgerEntryManager, self).get_query_set().filter(creation_date__lt=before)
+        relations = old_entries.values('relation').annotate(count=Count('pk')).filter(count__gt=1)
+        for relation_id in [row['relation'] for row in relations]:
+            with transaction.commit_on_success():
+                entries = old_entries.filter(relation=relation_id)
+                summary = entries.aggregate(delta=Sum('delta'), last=Max('creation_date'), count=Count('pk'))
+                entries.delete()
+                self.create(relation_id=relation_id, delta=summary['delta'], reason='S',
+                            creation_date=summary['last'])
+                removed += summary['count'] - 1
+        return removed
+
+
+class LedgerEntry(models.Model):
+    """
+    A django model representing an append-only record of a relation balance change.
+    The relation balance is a materialized snapshot of the sum of its ledger entries.
+    """
+
+    relation = models.ForeignKey(Relation, related_name='ledger')
+    delta = models.IntegerField(help_text="Amount of credits added (or removed if negative).")
+    REASONS = (
+        ('Q', 'quest confirmed'),
+        ('B', 'bomb failed'),
+        ('R', 'reward bought'),
+        ('S', 'snapshot'), # compacted older entries
+    )
+    reason = models.CharField(max_length=1, choices=REASONS)
+    source_id = models.PositiveIntegerField(blank=True, null=True, help_text="Id of the quest or reward.")
+    creation_date = models.DateTimeField('creation date', default=timezone.now)
+    # a composite index on (relation, creation_date) is added by south migration 0003
+    objects = LedgerEntryManager()
+
+    def __unicode__(self):
+        """Returns the unicode string representation of the ledger entry."""
+        return u'%s: %+d (%s)' % (self.relation, self.delta, self.get_reason_display())
+
+
+def invalidate_relation_tables(sender, instance, **kwargs):
+    """Invalidates the cached tables of both participants of a saved or deleted relation."""
+    bump_table_versions(instance.owner_id, instance.quester_id)
+
+post_save.connect(invalidate_relation_tables, sender=Relation)
+post_delete.connect(invalidate_relation_tables, sender=Relation)
+
+
+def get_profile_user_ids(profile):
+    """Returns the ids of the users whose tables show the avatar of the profile."""
+    user_ids = [profile.user_id]
+    for owner_id, quester_id in Relation.objects.filter(
+            models.Q(owner=profile.user_id) | models.Q(quester=profile.user_id)).values_list('owner_id', 'quester_id'):
+        user_ids += [owner_id, quester_id]
+    return user_ids
+
+
+def invalidate_profile_tables(sender, instance, **kwargs):
+    """Invalidates the cached tables showing the avatar of a saved or deleted profile."""
+    bump_table_versions(*get_profile_user_ids(instance))
+
+post_save.connect(invalidate_profile_tables, sender=UserProfile)
+post_delete.connect(invalidate_profile_tables, sender=UserProfile)
+
+
+def create_avatar_derivatives(sender, instance, raw=False, **kwargs):
+    """Creates the missing derivatives of the avatar of a saved profile in the background."""
+    if not raw and not has_derivatives(instance.avatar.name):
+        schedule_derivatives(instance.avatar.name, *get_profile_user_ids(instance))
+
+post_save.connect(create_avatar_derivatives, sender=UserProfile)
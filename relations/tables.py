@@ -8,6 +8,7 @@ from django_tables2.utils import A  # alias for Accessor
 from relations.models import Relation
 from django.utils.safestring import mark_safe
 from django.conf import settings
+from carrotwars.tables import PrefetchTable, ActionColumn
 
 __author__ = "Eraldo Helal"
 
@@ -36,10 +37,12 @@ class BalanceColumn(tables.Column):
         return record.get_balance_html
 
 
-class OwnedRelationTable(tables.Table):
+class OwnedRelationTable(PrefetchTable):
     """
     Table layout for showing relations owned by a user.
     """
+    select_related = ('owner', 'quester')
+    user_accessors = ('quester',)
         
     quester = UserColumn()
     balance = BalanceColumn()
@@ -51,10 +54,12 @@ class OwnedRelationTable(tables.Table):
         # sequence = ("title", "description", "...", "quester")
         fields = ("quester", "balance")
 
-class AssignedRelationTable(tables.Table):
+class AssignedRelationTable(PrefetchTable):
     """
     Table layout for showing relations assigned to a user.
     """
+    select_related = ('owner', 'quester')
+    user_accessors = ('owner',)
     
     owner = UserColumn()
     balance = BalanceColumn()
@@ -66,40 +71,30 @@ class AssignedRelationTable(tables.Table):
         # sequence = ("owner", "description", "...", "owner")
         fields = ("owner", "balance")
 
-class AcceptColumn(tables.TemplateColumn):
+class AcceptColumn(ActionColumn):
     """
     Table column layout for marking a relation as accepted.
     """
+    viewname = 'relations:accept'
+    label = 'Accept'
+    image = '/static/images/accept.png'
+    sprite = 'accept'
 
-    def __init__(self, *args, **kwargs):
-        kwargs['template_code'] = """
-        {% load url from future %}
-        <form action="{% url 'relations:accept' value %}" method="POST">
-            {% csrf_token %}
-            <input type="image" value="Accept" src="/static/images/accept.png" />
-            </form>
-            """ 
-        super(AcceptColumn, self).__init__(*args, **kwargs)
-
-class DeclineColumn(tables.TemplateColumn):
+class DeclineColumn(ActionColumn):
     """
     Table column layout for marking a relation as declined.
     """
-        
-    def __init__(self, *args, **kwargs):
-        kwargs['template_code'] = """
-        {% load url from future %}
-        <form action="{% url 'relations:decline' value %}" method="POST">
-            {% csrf_token %}
-            <input type="image" value="Decline" src="/static/images/decline.png" />
-            </form>
-            """ 
-        super(DeclineColumn, self).__init__(*args, **kwargs)
-
-class PendingRelationTable(tables.Table):
+    viewname = 'relations:decline'
+    label = 'Decline'
+    image = '/static/images/decline.png'
+    sprite = 'decline'
+
+class PendingRelationTable(PrefetchTable):
     """
     Table layout for showing relations pending for a user.
     """
+    select_related = ('owner', 'quester')
+    user_accessors = ('owner',)
     owner = UserColumn()
     accept = AcceptColumn(accessor="pk", orderable=False)
     decline = DeclineColumn(accessor="pk", orderable=False)
@@ -112,10 +107,12 @@ class PendingRelationTable(tables.Table):
         fields = ("owner",)
 
 
-class ProposedRelationTable(tables.Table):
+class ProposedRelationTable(PrefetchTable):
     """
     Table layout for showing relations proposed by a user.
     """
+    select_related = ('owner', 'quester')
+    user_accessors = ('quester',)
 
     quester = UserColumn()
     
@@ -5,7 +5,17 @@ when you run "manage.py test".
 Replace this with more appropriate tests for your application.
 """
 
-from django.test import TestCase
+import threading
+from django.test import TestCase, TransactionTestCase
+from django.test.client import RequestFactory
+from django_tables2 import RequestConfig
+from django.db import connection, transaction
+from django.contrib.auth.models import User
+from datetime import timedelta
+from django.utils import timezone
+from relations.models import Relation, LedgerEntry, InsufficientBalance
+from relations.tables import OwnedRelationTable
+from accounts.models import profile_cache
 
 
 class SimpleTest(TestCase):
@@ -14,3 +24,132 @@ class SimpleTest(TestCase):
         Tests that 1 + 1 always equals 2.
         """
         self.assertEqual(1 + 1, 2)
+
+
+class RelationListTest(TestCase):
+    """
+    Tests the lazily built relation tables.
+    """
+
+    def setUp(self):
+        """Creates an accepted and a pending relation for a user."""
+        self.user = User.objects.create_user('user', 'user@example.com', 'secret')
+        owner = User.objects.create_user('owner', 'owner@example.com', 'secret')
+        quester = User.objects.create_user('quester', 'quester@example.com', 'secret')
+        Relation.objects.create(owner=self.user, quester=quester, status='A')
+        Relation.objects.create(owner=owner, quester=self.user, status='C')
+        self.client.login(username='user', password='secret')
+
+    def test_list_view(self):
+        """Tests that the used relation tables are rendered."""
+        response = self.client.get('/relations/?sort=quester')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'quester')
+        self.assertContains(response, 'owner')
+        self.assertFalse(response.context['assigned'])
+        self.assertTrue(response.context['pending'])
+
+    def test_prefetch(self):
+        """Tests that the questers and their profiles are loaded in bulk for the displayed page."""
+        for i in range(5):
+            quester = User.objects.create_user('quester%s' % i, 'quester%s@example.com' % i, 'secret')
+            Relation.objects.create(owner=self.user, quester=quester, status='A')
+        profile_cache.clear()
+        table = OwnedRelationTable(Relation.objects.owned_by(self.user))
+        with self.assertNumQueries(3): # count, rows joined with owners and questers, profiles
+            RequestConfig(RequestFactory().get('/relations/'), paginate={"per_page": 10}).configure(table)
+            cells = [row['quester']() for row in table.page.object_list]
+        self.assertEqual(len(cells), 6)
+
+
+class BalanceContentionTest(TransactionTestCase):
+    """
+    Tests that concurrent balance updates lose no carrots
+    and never overdraw a relation.
+    The threads share the file based test database (see carrotwars.testrunner).
+    """
+
+    def setUp(self):
+        """Creates a relation with a balance of 10 carrots."""
+        owner = User.objects.create_user('owner', 'owner@example.com', 'secret')
+        quester = User.objects.create_user('quester', 'quester@example.com', 'secret')
+        self.relation = Relation.objects.create(owner=owner, quester=quester, status='A', balance=10)
+
+    def run_threads(self, target, count):
+        """Runs the target function in the provided number of parallel threads."""
+        def run():
+            try:
+                target()
+            finally:
+                connection.close()
+        threads = [threading.Thread(target=run) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def balance(self):
+        """Returns the current balance of the relation."""
+        return Relation.objects.get(pk=self.relation.pk).balance
+
+    def test_credit(self):
+        """Tests that concurrent credits are all applied."""
+        def credit():
+            for i in range(10):
+                with transaction.commit_on_success():
+                    Relation.objects.credit(self.relation.pk, 1, 'Q')
+        self.run_threads(credit, 8)
+        self.assertEqual(self.balance(), 90)
+
+    def test_debit(self):
+        """Tests that concurrent debits never overdraw the balance."""
+        charged = []
+        def debit():
+            for i in range(3):
+                try:
+                    with transaction.commit_on_success():
+                        Relation.objects.debit(self.relation.pk, 1, 'R')
+                    charged.append(1)
+                except InsufficientBalance:
+                    pass
+        self.run_threads(debit, 8)
+        self.assertEqual(len(charged), 10)
+        self.assertEqual(self.balance(), 0)
+
+
+class LedgerTest(TestCase):
+    """
+    Tests the carrot ledger behind relation balances.
+    """
+
+    def setUp(self):
+        """Creates a relation with some balance changes."""
+        owner = User.objects.create_user('owner', 'owner@example.com', 'secret')
+        quester = User.objects.create_user('quester', 'quester@example.com', 'secret')
+        self.relation = Relation.objects.create(owner=owner, quester=quester, status='A')
+        Relation.objects.credit(self.relation.pk, 5, 'Q', 1)
+        Relation.objects.credit(self.relation.pk, 3, 'Q', 2)
+        Relation.objects.debit(self.relation.pk, 4, 'R', 1)
+        Relation.objects.debit_many(self.relation.pk, 'B', {3: 1, 4: 2})
+
+    def test_entries(self):
+        """Tests that every balance change is recorded and sums up to the balance."""
+        entries = LedgerEntry.objects.for_relation(self.relation)
+        self.assertEqual([(entry.reason, entry.delta) for entry in entries],
+                         [('Q', 5), ('Q', 3), ('R', -4), ('B', -1), ('B', -2)])
+        self.assertEqual(Relation.objects.get(pk=self.relation.pk).balance, 1)
+        self.assertEqual(LedgerEntry.objects.balance_of(self.relation), 1)
+
+    def test_rejected_debit(self):
+        """Tests that a rejected debit leaves neither balance change nor entry."""
+        self.assertRaises(InsufficientBalance, Relation.objects.debit, self.relation.pk, 2, 'R', 2)
+        self.assertEqual(LedgerEntry.objects.for_relation(self.relation).count(), 5)
+
+    def test_compact(self):
+        """Tests that compaction folds old entries into one snapshot keeping the balance."""
+        LedgerEntry.objects.update(creation_date=timezone.now() - timedelta(days=10))
+        Relation.objects.credit(self.relation.pk, 2, 'Q', 3)
+        self.assertEqual(LedgerEntry.objects.compact(before=timezone.now() - timedelta(days=1)), 4)
+        entries = LedgerEntry.objects.for_relation(self.relation)
+        self.assertEqual([(entry.reason, entry.delta) for entry in entries], [('S', 1), ('Q', 2)])
+        self.assertEqual(LedgerEntry.objects.balance_of(self.relation), 3)
@@ -10,12 +10,14 @@ from django.forms import ModelForm
 from django.utils.decorators import method_decorator
 from django.contrib.auth.decorators import login_required
 from relations.tables import OwnedRelationTable, AssignedRelationTable, PendingRelationTable, ProposedRelationTable
-from postman.api import pm_write
+from notifications.api import notify
 from django.utils.html import strip_tags
 from django.core.urlresolvers import reverse
 from django.contrib import messages
-from django.db import IntegrityError
-from django_tables2 import RequestConfig
+from django.db import IntegrityError, transaction
+from functools import partial
+from carrotwars.tables import lazy_tables
+from carrotwars.conditional import ConditionalMixin
 
 __author__ = "Eraldo Helal"
 
@@ -45,9 +47,19 @@ class RelationMixin(LoginRequiredMixin):
     """
     Mixin class that sets main context information that is needed for relation object views.
     Configures relation set filters, table information and default relation form.
+    Relation sets and tables are only added for the names listed in tables
+    and are only loaded once the template uses them.
     """
     model = Relation
     form_class = RelationForm
+    #: names of the relation sets (and tables) used by the view template
+    tables = ()
+    table_classes = {
+        'owned': (OwnedRelationTable, Relation.objects.owned_by),
+        'assigned': (AssignedRelationTable, Relation.objects.assigned_to),
+        'proposed': (ProposedRelationTable, Relation.objects.proposed_by),
+        'pending': (PendingRelationTable, Relation.objects.pending_for),
+    }
     
     def get_context_data(self, **kwargs):
         """
@@ -55,27 +67,21 @@ class RelationMixin(LoginRequiredMixin):
         Returns a context dictionary.
         """
         context = super(RelationMixin, self).get_context_data(**kwargs)
-        context['owned'] = Relation.objects.owned_by(self.request.user)
-        context['assigned'] = Relation.objects.assigned_to(self.request.user)
-        context['proposed'] = Relation.objects.proposed_by(self.request.user)
-        context['pending'] = Relation.objects.pending_for(self.request.user)
-        context['owned_table'] = OwnedRelationTable(context['owned'])
-        context['assigned_table'] = AssignedRelationTable(context['assigned'])
-        context['proposed_table'] = ProposedRelationTable(context['proposed'])
-        context['pending_table'] = PendingRelationTable(context['pending'])
-        requestConfig = RequestConfig(self.request, paginate={"per_page": 10,})
-        requestConfig.configure(context['owned_table'])
-        requestConfig.configure(context['assigned_table'])
-        requestConfig.configure(context['proposed_table'])
-        requestConfig.configure(context['pending_table'])
+        user = self.request.user
+        tables = []
+        for name in self.tables:
+            table_class, relation_set = self.table_classes[name]
+            tables.append((name, table_class, partial(relation_set, user)))
+        context.update(lazy_tables(self.request, tables))
         return context
 
 
-class RelationListView(RelationMixin, ListView):
+class RelationListView(RelationMixin, ConditionalMixin, ListView):
     """A generic view providing context information for lists of relations."""
+    tables = ('owned', 'assigned', 'proposed', 'pending')
 
 
-class RelationDetailView(RelationMixin, DetailView):
+class RelationDetailView(RelationMixin, ConditionalMixin, DetailView):
     """A generic view providing context information for a single relation."""
 
 
@@ -96,8 +102,9 @@ class RelationCreateView(RelationMixin, CreateView):
         self.object.owner = self.request.user
 
         try:
-            self.object.save()
-            self.inform_user()
+            with transaction.commit_on_success():
+                self.object.save()
+                self.inform_user()
             messages.add_message(self.request, messages.INFO, 'New relation has been created. Waiting for Quester to accept.')
             return super(RelationCreateView, self).form_valid(form)
         except IntegrityError: # such a user to user relation does alreday exist.
@@ -109,7 +116,7 @@ class RelationCreateView(RelationMixin, CreateView):
     def inform_user(self):
         subject = "New relation requested by %s" % self.object.owner
         body = """<a href="%s">%s</a>""" % (self.object.get_absolute_url(), strip_tags(self.object.owner))
-        pm_write(
+        notify(
             sender=self.request.user,
             recipient=self.object.quester,
             subject=subject,
@@ -142,17 +149,16 @@ class AcceptView(RedirectView):
         if self.request.user != relation.quester or relation.status != 'C':
             return reverse('relations:list')
 
-        # update relation
-        relation.status = 'A'
-        relation.save()
-
-        # inform owner
-        pm_write(
-            sender=self.request.user,
-            recipient=relation.owner,
-            subject="Relation '%s' has been accepted." % relation,
-            body=""
-            )
+        # update relation and inform owner
+        with transaction.commit_on_success():
+            relation.status = 'A'
+            relation.save()
+            notify(
+                sender=self.request.user,
+                recipient=relation.owner,
+                subject="Relation '%s' has been accepted." % relation,
+                body=""
+                )
 
         messages.add_message(self.request, messages.INFO, 'Relation has been accepted.')
         return reverse('relations:list')
@@ -176,17 +182,16 @@ class DeclineView(RedirectView):
         if self.request.user != relation.quester or relation.status != 'C':
             return reverse('relations:list')
 
-        # update relation
-        relation.status = 'R'
-        relation.save()
-
-        # inform owner
-        pm_write(
-            sender=self.request.user,
-            recipient=relation.owner,
-            subject="Relation '%s' has been declined." % relation,
-            body=""
-            )
+        # update relation and inform owner
+        with transaction.commit_on_success():
+            relation.status = 'R'
+            relation.save()
+            notify(
+                sender=self.request.user,
+                recipient=relation.owner,
+                subject="Relation '%s' has been declined." % relation,
+                body=""
+                )
         
         messages.add_message(self.request, messages.INFO, 'Relation has been declined.')
         return reverse('relations:list')
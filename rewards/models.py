@@ -8,6 +8,11 @@ from relations.models import Relation
 from django.core.urlresolvers import reverse
 from django.conf import settings
 from django.utils.safestring import mark_safe
+from carrotwars import badges
+from carrotwars.tablecache import bump_table_versions
+from carrotwars.images import get_derivative, has_derivatives, schedule_derivatives
+from carrotwars.media import get_media_url
+from django.db.models.signals import post_save, pre_delete, post_delete
 
 import datetime
 from django.utils import timezone
@@ -42,6 +47,7 @@ class Reward(models.Model):
     title = models.CharField(max_length=200)
     description = models.TextField(blank=True)
     creation_date = models.DateTimeField('creation date', auto_now_add=True)
+    modification_date = models.DateTimeField('modification date', auto_now=True)
     price = models.IntegerField(default=1)
     image = models.ImageField(upload_to='rewards/images', default='rewards/images/default.jpg', blank=True)
     STATUS = (
@@ -52,6 +58,8 @@ class Reward(models.Model):
         ('X', 'deleted'),
     )
     status = models.CharField(default='A', max_length=1, choices=STATUS)
+    # composite indexes on (relation, status) are added by south migration 0003
+    # a composite index on (creation_date, id) for api cursors is added by south migration 0005
     objects = RewardManager()
 
     def __unicode__(self):
@@ -66,23 +74,14 @@ class Reward(models.Model):
         """
         Returns the html representation of the reward price as a string.
         """
-        price = self.price
-        img_html = '<img src=%simages/carrot.png>' % settings.STATIC_URL
-        html = ""
-        if price == 0:
-            html = "free"
-        elif price <= 5:
-            html = img_html * price
-        else:
-            html = '%s x %s' % (img_html, price)
-        return mark_safe(html)
+        return badges.price_html(self.price)
 
     def _get_image_html(self, id):
         """
-        Returns the html representation of the reward image as a string.
+        Returns the html representation of the reward image derivative (image or icon) as a string.
         """
-        image_path = self.image
-        img_html = '<img id="%s" src="%s%s">' % (id, settings.MEDIA_URL, image_path)
+        image_path = get_derivative(self.image.name, id)
+        img_html = '<img id="%s" src="%s">' % (id, get_media_url(image_path))
         html = ""
         if image_path:
             html = img_html
@@ -118,3 +117,31 @@ class Reward(models.Model):
         html = template
         return mark_safe(html)
 
+
+def remember_reward_participants(sender, instance, **kwargs):
+    """
+    Remembers the relation participants of a reward about to be deleted,
+    as its relation may be deleted along with it (and be gone after the deletion).
+    """
+    instance.participant_ids = instance.relation.owner_id, instance.relation.quester_id
+
+pre_delete.connect(remember_reward_participants, sender=Reward)
+
+
+def invalidate_reward_tables(sender, instance, **kwargs):
+    """Invalidates the cached tables of both relation participants of a saved or deleted reward."""
+    participant_ids = getattr(instance, 'participant_ids', None)
+    if participant_ids is None:
+        participant_ids = instance.relation.owner_id, instance.relation.quester_id
+    bump_table_versions(*participant_ids)
+
+post_save.connect(invalidate_reward_tables, sender=Reward)
+post_delete.connect(invalidate_reward_tables, sender=Reward)
+
+
+def create_reward_image_derivatives(sender, instance, raw=False, **kwargs):
+    """Creates the missing derivatives of the image of a saved reward in the background."""
+    if not raw and not has_derivatives(instance.image.name):
+        schedule_derivatives(instance.image.name, instance.relation.owner_id, instance.relation.quester_id)
+
+post_save.connect(create_reward_image_derivatives, sender=Reward)
@@ -8,6 +8,7 @@ from django_tables2.utils import A  # alias for Accessor
 from rewards.models import Reward
 from django.utils.safestring import mark_safe
 from django.conf import settings
+from carrotwars.tables import PrefetchTable, ActionColumn
 
 __author__ = "Eraldo Helal"
 
@@ -59,10 +60,12 @@ class RewardColumn(tables.Column):
         return record.get_html
 
 
-class OwnedRewardTable(tables.Table):
+class OwnedRewardTable(PrefetchTable):
     """
     Table layout for showing rewards owned by a user.
     """
+    select_related = ('relation__owner', 'relation__quester')
+    user_accessors = ('relation.quester',)
 
     image = ImageColumn(orderable=False, verbose_name="icon")
     title = tables.LinkColumn('rewards:detail', args=[A('pk')])
@@ -78,30 +81,37 @@ class OwnedRewardTable(tables.Table):
         fields = ("image", "title", "description", "price")
 
 
-class BuyColumn(tables.TemplateColumn):
+class BuyColumn(ActionColumn):
     """
     Table column layout for marking a reward as bought.
+    The button is shown inactive if the relation balance does not cover the price.
     """
-    
-    def __init__(self, *args, **kwargs):
-        kwargs['template_code'] = """
-        {% load url from future %}
-        <form action="{% url 'rewards:buy' value %}" method="POST">
-            {% csrf_token %}
-            {% if record.price <= record.relation.balance %}
-              <input type="image" value="Buy" src="/static/images/buy.png" />
-            {% else %}
-              <input type="image" value="Buy" src="/static/images/buy-inactive.png" />
-            {% endif %}
+    viewname = 'rewards:buy'
+    label = 'Buy'
+    image = '/static/images/buy.png'
+    template = """
+        
+        <form action="%(url)s" method="POST">
+            %(csrf)s
+            
+              <input type="image" value="%(label)s" src="%(image)s" />
+            
             </form>
-            """ 
-        super(BuyColumn, self).__init__(*args, **kwargs)
+            """
+
+    def get_image(self, record):
+        """Returns the active or inactive button image url for the reward."""
+        if record.price <= record.relation.balance:
+            return self.image
+        return '/static/images/buy-inactive.png'
 
 
-class AssignedRewardTable(tables.Table):
+class AssignedRewardTable(PrefetchTable):
     """
     Table layout for showing rewards assigned to a user.
     """
+    select_related = ('relation__owner', 'relation__quester')
+    user_accessors = ('relation.owner',)
 
     image = ImageColumn(orderable=False, verbose_name="icon")
     title = tables.LinkColumn('rewards:detail', args=[A('pk')])
@@ -5,7 +5,20 @@ when you run "manage.py test".
 Replace this with more appropriate tests for your application.
 """
 
+from cStringIO import StringIO
 from django.test import TestCase
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.contrib.auth.models import User
+from relations.models import Relation
+from rewards.models import Reward
+from carrotwars.images import IMAGE_DERIVATIVES, get_derivative_name, schedule_derivatives, create_derivatives, \
+    get_derivative, derivative_cache, missing_derivative_cache
+from carrotwars.media import get_media_url
+try:
+    from PIL import Image
+except ImportError:
+    import Image
 
 
 class SimpleTest(TestCase):
@@ -14,3 +27,80 @@ class SimpleTest(TestCase):
         Tests that 1 + 1 always equals 2.
         """
         self.assertEqual(1 + 1, 2)
+
+
+class BuyTest(TestCase):
+    """
+    Tests buying rewards with the relation balance.
+    """
+
+    def setUp(self):
+        """Creates a relation with a balance of 3 carrots and logs in the quester."""
+        owner = User.objects.create_user('owner', 'owner@example.com', 'secret')
+        quester = User.objects.create_user('quester', 'quester@example.com', 'secret')
+        self.relation = Relation.objects.create(owner=owner, quester=quester, status='A', balance=3)
+        self.client.login(username='quester', password='secret')
+
+    def buy(self, price):
+        """Tries to buy a new reward of the provided price and returns the reloaded reward."""
+        reward = Reward.objects.create(relation=self.relation, title="reward", price=price)
+        self.client.post('/rewards/%s/buy/' % reward.pk)
+        return Reward.objects.get(pk=reward.pk)
+
+    def test_buy(self):
+        """Tests that an affordable reward is bought once and charged once."""
+        reward = self.buy(2)
+        self.assertEqual(reward.status, 'D')
+        self.client.post('/rewards/%s/buy/' % reward.pk)
+        self.assertEqual(Relation.objects.get(pk=self.relation.pk).balance, 1)
+
+    def test_buy_too_expensive(self):
+        """Tests that a reward exceeding the balance is neither bought nor charged."""
+        self.assertEqual(self.buy(4).status, 'A')
+        self.assertEqual(Relation.objects.get(pk=self.relation.pk).balance, 3)
+
+
+class ImageDerivativeTest(TestCase):
+    """
+    Tests the icon and display derivatives of reward images.
+    """
+
+    def setUp(self):
+        """Uploads a large reward image."""
+        owner = User.objects.create_user('owner', 'owner@example.com', 'secret')
+        quester = User.objects.create_user('quester', 'quester@example.com', 'secret')
+        self.relation = Relation.objects.create(owner=owner, quester=quester, status='A')
+        content = StringIO()
+        Image.new('RGB', (800, 400)).save(content, 'PNG')
+        self.name = default_storage.save('rewards/images/test-derivatives.png', ContentFile(content.getvalue()))
+
+    def tearDown(self):
+        """Removes the uploaded image and its derivatives."""
+        for name in [self.name] + [get_derivative_name(self.name, derivative) for derivative in IMAGE_DERIVATIVES]:
+            default_storage.delete(name)
+        derivative_cache.clear()
+        missing_derivative_cache.clear()
+
+    def test_derivatives(self):
+        """Tests that the derivatives are created in the background and shown once they exist."""
+        reward = Reward(relation=self.relation, title="reward", image=self.name)
+        self.assertIn('%s"' % self.name, reward.get_icon_html()) # no derivatives yet
+        schedule_derivatives(self.name).get(timeout=10)
+        icon = get_derivative_name(self.name, 'icon')
+        self.assertEqual(Image.open(default_storage.open(icon)).size, (64, 32))
+        self.assertIn(icon, reward.get_icon_html())
+        self.assertIn(get_derivative_name(self.name, 'image'), reward.get_image_html())
+        self.assertEqual(schedule_derivatives(self.name), None) # nothing left to do
+
+    def test_replace(self):
+        """Tests that missing derivatives are remembered and only replaced on request, getting new urls."""
+        icon = get_derivative_name(self.name, 'icon')
+        self.assertEqual(get_derivative(self.name, 'icon'), self.name)
+        self.assertTrue(missing_derivative_cache.get(icon))
+        create_derivatives(self.name)
+        self.assertEqual(get_derivative(self.name, 'icon'), icon)
+        url = get_media_url(icon)
+        create_derivatives(self.name) # existing derivatives are kept
+        self.assertEqual(get_media_url(icon), url)
+        create_derivatives(self.name, replace=True)
+        self.assertNotEqual(get_media_url(icon), url)
@@ -4,21 +4,26 @@ This module contains the reward model based views.
 """
 
 from rewards.models import Reward
-from relations.models import Relation
+from relations.models import Relation, InsufficientBalance
 from django.contrib.auth.models import User
 from django.views.generic import ListView, DetailView, CreateView, DeleteView, UpdateView, RedirectView
 from django.forms import ModelForm
+from django.core.files.images import get_image_dimensions
 from django import forms
 from django.utils.decorators import method_decorator
 from django.contrib.auth.decorators import login_required
 from rewards.tables import OwnedRewardTable, AssignedRewardTable
-from postman.api import pm_write
+from notifications.api import notify
+from changes.models import Change
 from django.utils.html import strip_tags
 from django.core.urlresolvers import reverse
 from django.contrib import messages
-from django_tables2 import RequestConfig
-
-from rewards.tables import OwnedRewardTable, AssignedRewardTable
+from django.db import transaction
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+from functools import partial
+from carrotwars.tables import lazy_tables
+from carrotwars.conditional import ConditionalMixin
 
 __author__ = "Eraldo Helal"
 
@@ -56,12 +61,10 @@ class RewardForm(ModelForm):
         max_height = 600
         image = self.cleaned_data.get('image', False)
         if image and not isinstance(image, unicode): # image was set
-            print(type(image))
             if image._size > max_size*1024*1024:
                 raise forms.ValidationError("Image file is too large. (> %s MB)" % max_size)
-            from PIL import Image
-            img = Image.open(image)
-            width, height = img.size
+            # only the image header is read (in chunks until the dimensions are known)
+            width, height = get_image_dimensions(image)
             if width > max_width or height > max_height:
                 raise forms.ValidationError("Image file is too large. (> %s x %s)" % (max_width, max_height))
                 # # TODO? resize image (then update size [and type if it was not jpg] on the memory image file)
@@ -91,9 +94,17 @@ class RewardMixin(LoginRequiredMixin):
     """
     Mixin class that sets main context information that is needed for reward object views.
     Configures reward set filters, table information and default reward form.
+    Reward sets and tables are only added for the names listed in tables
+    and are only loaded once the template uses them.
     """
     model = Reward
     form_class = RewardForm
+    #: names of the reward sets (and tables) used by the view template
+    tables = ()
+    table_classes = {
+        'owned': (OwnedRewardTable, Reward.objects.owned_by),
+        'assigned': (AssignedRewardTable, Reward.objects.assigned_to),
+    }
     
     def get_context_data(self, **kwargs):
         """
@@ -101,22 +112,22 @@ class RewardMixin(LoginRequiredMixin):
         Returns a context dictionary.
         """
         context = super(RewardMixin, self).get_context_data(**kwargs)
-        context['owner'] = Relation.objects.owned_by(self.request.user)
-        context['owned'] = Reward.objects.owned_by(self.request.user)
-        context['assigned'] = Reward.objects.assigned_to(self.request.user)
-        context['owned_table'] = OwnedRewardTable(context['owned'])
-        context['assigned_table'] = AssignedRewardTable(context['assigned'])
-        requestConfig = RequestConfig(self.request, paginate={"per_page": 10,})
-        requestConfig.configure(context['owned_table'])
-        requestConfig.configure(context['assigned_table'])
+        user = self.request.user
+        context['owner'] = SimpleLazyObject(lambda: Relation.objects.owned_by(user).exists())
+        tables = []
+        for name in self.tables:
+            table_class, reward_set = self.table_classes[name]
+            tables.append((name, table_class, partial(reward_set, user)))
+        context.update(lazy_tables(self.request, tables))
         return context
 
 
-class RewardListView(RewardMixin, ListView):
+class RewardListView(RewardMixin, ConditionalMixin, ListView):
     """A generic view providing context information for lists of rewards."""
+    tables = ('owned', 'assigned')
 
 
-class RewardDetailView(RewardMixin, DetailView):
+class RewardDetailView(RewardMixin, ConditionalMixin, DetailView):
     """A generic view providing context information for a single reward."""
 
 
@@ -162,9 +173,9 @@ class RewardCreateView(RewardMixin, CreateView):
             return self.render_to_response(self.get_context_data(form=form))
         
         self.object.relation = Relation.objects.get(owner=self.request.user, quester=form.cleaned_data['quester'])
-        self.object.save()
-        
-        self.inform_user()
+        with transaction.commit_on_success():
+            self.object.save()
+            self.inform_user()
         messages.add_message(self.request, messages.INFO, 'New reward has been created.')
         
         return super(RewardCreateView, self).form_valid(form)
@@ -175,7 +186,7 @@ class RewardCreateView(RewardMixin, CreateView):
         """
         subject = "New reward!"
         body = """<a href="%s">%s</a>""" % (self.object.get_absolute_url(), strip_tags(self.object.title))
-        pm_write(
+        notify(
             sender=self.request.user,
             recipient=self.object.relation.quester,
             subject=subject,
@@ -203,34 +214,32 @@ class BuyView(RedirectView):
         Updates the reward status and balance and informs the owner if successful.
         Returns the redirect URL as a string.
         """
-        reward = Reward.objects.get(pk=pk)
-        relation = Relation.objects.get(owner=reward.relation.owner, quester=self.request.user)
+        reward = Reward.objects.select_related('relation__owner', 'relation__quester').get(pk=pk)
 
         # check permission
         if self.request.user != reward.relation.quester or reward.status != 'A':
             return reverse('quests:list')
 
-        # check credits
-        if relation.balance < reward.price:
-            diff = reward.price - relation.balance
-            messages.add_message(self.request, messages.ERROR, 'Not enough carrots. You have %s carrot%s from %s. You need %s more carrot%s.' % (relation.balance, "s"[relation.balance==1:], relation.owner, diff, "s"[diff==1:]))
+        # update reward and balance (the balance is only charged if it covers the price) and inform owner
+        try:
+            with transaction.commit_on_success():
+                Relation.objects.debit(reward.relation_id, reward.price, 'R', reward.pk)
+                if not Reward.objects.filter(pk=reward.pk, status='A').update(status='D', modification_date=timezone.now()):
+                    transaction.rollback() # bought in the meantime: undo the charge
+                    return reverse('rewards:list')
+                Change.objects.record('U', [reward])
+                notify(
+                    sender=self.request.user,
+                    recipient=reward.relation.owner,
+                    subject="Reward %s has been bought." % reward.title,
+                    body=""
+                    )
+        except InsufficientBalance:
+            # check credits
+            balance = Relation.objects.filter(pk=reward.relation_id).values_list('balance', flat=True)[0]
+            diff = reward.price - balance
+            messages.add_message(self.request, messages.ERROR, 'Not enough carrots. You have %s carrot%s from %s. You need %s more carrot%s.' % (balance, "s"[balance==1:], reward.relation.owner, diff, "s"[diff==1:]))
             return reverse('rewards:list')
 
-        # update reward
-        reward.status = 'D'
-        reward.save()
-
-        # update balance
-        relation = Relation.objects.get(owner=reward.relation.owner, quester=self.request.user)
-        relation.balance -= reward.price
-        relation.save()
-
-        # inform owner
         messages.add_message(self.request, messages.INFO, 'Reward has been bought. %s has been informed.' % reward.relation.owner)
-        pm_write(
-            sender=self.request.user,
-            recipient=reward.relation.owner,
-            subject="Reward %s has been bought." % reward.title,
-            body=""
-            )
         return reverse('rewards:list')